@@ -0,0 +1,199 @@
+"""
+Benchmarks do caminho crítico do /proximo, por tamanho de banco e número de respostas.
+
+    python -m benchmarks.bench_tai                          # roda e compara com a baseline
+    python -m benchmarks.bench_tai --saida resultado.json   # grava os resultados
+    python -m benchmarks.bench_tai --atualizar-baseline     # regrava a baseline
+
+Sai com código 1 se alguma etapa ficar mais lenta que a baseline além da tolerância.
+A baseline depende da máquina: regrave-a no ambiente de referência ao trocar de máquina.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from main import app
+from services.adaptive_testing import (
+    transformar_parametros,
+    EAP,
+    criterio_parada,
+    maxima_informacao_th
+)
+from services.cache import cache_decisoes
+from utils.helpers import decodificar_vetor
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+TAMANHOS_BANCO = (45, 500, 2000, 10000)
+N_RESPOSTAS = (0, 10, 20, 45)
+
+
+def gerar_payload(n_itens, n_resp, semente=0):
+    """Payload do /proximo com banco sintético e as n_resp primeiras respostas."""
+    rng = np.random.default_rng(semente)
+    itens = [f"ITEM{i}" for i in range(1, n_itens + 1)]
+    respostas = rng.choice(["A", "B"], n_resp)
+    return {
+        "ESTUDANTE": "Aluno1",
+        "AnoEscolarEstudante": "8",
+        "proficiencia": "500.0",
+        "profic.inic": "500.0",
+        "idItem": ",".join(itens),
+        "parA": ",".join(f"{v:.6f}" for v in rng.lognormal(np.log(0.02), 0.3, n_itens)),
+        "parB": ",".join(f"{v:.6f}" for v in rng.normal(250, 50, n_itens)),
+        "parC": ",".join(f"{v:.6f}" for v in rng.uniform(0.1, 0.25, n_itens)),
+        "administrado": ",".join(itens[:n_resp]),
+        "respostas": ",".join(respostas),
+        "gabarito": ",".join(["A"] * n_resp),
+        "erropadrao": "0.5",
+        "n.Ij": "45",
+        "componente": "LP",
+        "idEixo": ",".join(str(i % 4 + 1) for i in range(n_itens)),
+        "idHabilidade": ",".join(str(i % 20 + 1) for i in range(n_itens)),
+    }
+
+
+def cronometrar(funcao, tempo_minimo=0.05, rodadas=5):
+    """Mediana e p95 (em microssegundos por chamada) de várias rodadas cronometradas."""
+    # Calibra o número de chamadas por rodada para durar ao menos tempo_minimo
+    repeticoes = 1
+    while True:
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            funcao()
+        if time.perf_counter() - inicio >= tempo_minimo or repeticoes >= 10_000:
+            break
+        repeticoes *= 2
+
+    amostras = []
+    for _ in range(rodadas):
+        inicio = time.perf_counter()
+        for _ in range(repeticoes):
+            funcao()
+        amostras.append(1e6 * (time.perf_counter() - inicio) / repeticoes)
+    return {
+        "medianaUs": float(np.median(amostras)),
+        "p95Us": float(np.percentile(amostras, 95)),
+        "repeticoes": repeticoes * rodadas,
+    }
+
+
+@contextlib.contextmanager
+def sem_cache_decisoes():
+    """Desliga o cache de decisões: o mesmo payload repetido mediria só acertos de cache."""
+    max_entradas = cache_decisoes.max_entradas
+    cache_decisoes.max_entradas = 0
+    cache_decisoes.limpar()
+    try:
+        yield
+    finally:
+        cache_decisoes.max_entradas = max_entradas
+
+
+def proximo(client, payload):
+    response = client.post("/proximo", json=payload)
+    if response.status_code != 200:
+        raise RuntimeError(f"/proximo respondeu {response.status_code}: {response.text}")
+    return response
+
+
+def casos(n_itens, n_resp, client):
+    """Etapas cronometradas para um tamanho de banco e número de respostas."""
+    payload = gerar_payload(n_itens, n_resp)
+    parA = decodificar_vetor(payload["parA"])
+    parB = decodificar_vetor(payload["parB"])
+    parC = decodificar_vetor(payload["parC"])
+    PAR = transformar_parametros(np.column_stack((parA, parB, parC)), "LP")
+    U = np.array([1 if r == "A" else 0 for r in payload["respostas"].split(",") if r])
+    adm = list(range(n_resp))
+
+    etapas = {
+        "parse": lambda: [decodificar_vetor(payload[k]) for k in ("parA", "parB", "parC")],
+        "transformar_parametros": lambda: transformar_parametros(np.column_stack((parA, parB, parC)), "LP"),
+        "maxima_informacao_th": lambda: maxima_informacao_th(0.1, PAR),
+        "proximo": lambda: proximo(client, payload),
+    }
+    if n_resp:
+        etapas["EAP"] = lambda: EAP(U, PAR[adm], adm)
+        etapas["criterio_parada"] = lambda: criterio_parada(0.1, 0.4, n_resp=n_resp, n_Ij=45)
+    return etapas
+
+
+def executar(tamanhos=TAMANHOS_BANCO, n_respostas=N_RESPOSTAS, tempo_minimo=0.05):
+    client = TestClient(app)
+    resultados = []
+    with sem_cache_decisoes():
+        for n_itens in tamanhos:
+            for n_resp in n_respostas:
+                if n_resp > n_itens:
+                    continue
+                for etapa, funcao in casos(n_itens, n_resp, client).items():
+                    # Silencia eventuais saídas em stdout das funções cronometradas
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        medida = cronometrar(funcao, tempo_minimo)
+                    resultados.append({"etapa": etapa, "nItens": n_itens, "nResp": n_resp, **medida})
+                    print(f"{etapa:>24} itens={n_itens:>5} resp={n_resp:>2} {medida['medianaUs']:>12.1f} us",
+                          file=sys.stderr)
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "maquina": platform.machine(),
+        "resultados": resultados,
+    }
+
+
+def comparar(atual, baseline, tolerancia=1.5, folga_us=20.0):
+    """Lista as etapas cuja mediana passou de tolerancia x baseline (mais uma folga absoluta)."""
+    referencia = {(r["etapa"], r["nItens"], r["nResp"]): r["medianaUs"] for r in baseline["resultados"]}
+    regressoes = []
+    for r in atual["resultados"]:
+        chave = (r["etapa"], r["nItens"], r["nResp"])
+        if chave in referencia and r["medianaUs"] > referencia[chave] * tolerancia + folga_us:
+            regressoes.append({**r, "baselineUs": referencia[chave], "razao": r["medianaUs"] / referencia[chave]})
+    return regressoes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks do teste adaptativo")
+    parser.add_argument("--saida", help="arquivo JSON com os resultados")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--atualizar-baseline", action="store_true")
+    parser.add_argument("--tolerancia", type=float, default=1.5, help="razão máxima em relação à baseline")
+    parser.add_argument("--bancos", type=int, nargs="+", default=list(TAMANHOS_BANCO))
+    parser.add_argument("--respostas", type=int, nargs="+", default=list(N_RESPOSTAS))
+    parser.add_argument("--tempo-minimo", type=float, default=0.05, help="segundos por rodada")
+    args = parser.parse_args(argv)
+
+    atual = executar(args.bancos, args.respostas, args.tempo_minimo)
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(atual, f, indent=2)
+
+    if args.atualizar_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(atual, f, indent=2)
+        print(f"Baseline gravada em {args.baseline}", file=sys.stderr)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"Baseline não encontrada: {args.baseline}", file=sys.stderr)
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        regressoes = comparar(atual, json.load(f), args.tolerancia)
+    for r in regressoes:
+        print(f"REGRESSÃO {r['etapa']} itens={r['nItens']} resp={r['nResp']}: "
+              f"{r['medianaUs']:.1f} us (baseline {r['baselineUs']:.1f} us, {r['razao']:.2f}x)", file=sys.stderr)
+    return 1 if regressoes else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,341 @@
+"""
+Teste de carga do /proximo: reproduz requisições gravadas ou sessões sintéticas contra
+a aplicação em processo (ASGI), um uvicorn iniciado localmente ou uma URL.
+
+    python -m benchmarks.carga --sessoes 200 --concorrencia 16             # ASGI, banco sintético
+    python -m benchmarks.carga --banco banco.csv --componente LP --taxa 50 --duracao 60 \\
+        --uvicorn --workers 4
+    python -m benchmarks.carga --replay trafego.jsonl --url http://localhost:8000
+
+As sessões sintéticas seguem o fluxo real do teste: cada examinando virtual (theta
+sorteado da normal padrão) envia o payload, responde o item retornado pela 3PL e
+reenvia com administrado/respostas acrescidos, até o critério de parada. No replay,
+cada linha do JSONL é um payload do /proximo (ou {"rota": ..., "payload": ...}).
+
+O relatório traz a vazão e as latências p50/p95/p99 por número de respostas no payload.
+"""
+import argparse
+import asyncio
+import csv
+import gzip
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks.bench_tai import gerar_payload
+from services.banco import banco_do_payload
+from utils.helpers import decodificar_textos, normalizar_componente
+
+CAMPOS_BANCO = ("idItem", "parA", "parB", "parC", "idEixo", "idHabilidade")
+
+
+def campos_banco_csv(caminho, componente):
+    """Campos do banco (texto separado por vírgula, como no payload) a partir de um CSV."""
+    with open(caminho, newline="", encoding="utf-8") as f:
+        linhas = list(csv.DictReader(f))
+    campos = {k: ",".join(l[k] for l in linhas) for k in CAMPOS_BANCO}
+    return {**campos, "componente": normalizar_componente(componente)}
+
+
+def campos_banco_sintetico(n_itens, semente=0):
+    payload = gerar_payload(n_itens, 0, semente)
+    return {k: payload[k] for k in CAMPOS_BANCO + ("componente",)}
+
+
+class SessaoSintetica:
+    """Examinando virtual que percorre um teste completo pelo /proximo."""
+
+    def __init__(self, banco, campos, theta, rng, ano_escolar=8, profic_inic=500.0, n_Ij=45):
+        self.banco = banco
+        self.campos = campos
+        self.theta = theta
+        self.rng = rng
+        self.ano_escolar = ano_escolar
+        self.profic_inic = profic_inic
+        self.n_Ij = n_Ij
+        self.administrado = []
+        self.respostas = []
+        self.proficiencia = str(profic_inic)
+        self.erropadrao = "0.5"
+        self.encerrada = False
+
+    @property
+    def n_resp(self):
+        return len(self.respostas)
+
+    def payload(self):
+        return {
+            **self.campos,
+            "ESTUDANTE": "Carga",
+            "AnoEscolarEstudante": str(self.ano_escolar),
+            "proficiencia": self.proficiencia,
+            "profic.inic": str(self.profic_inic),
+            "administrado": ",".join(self.administrado),
+            "respostas": ",".join(self.respostas),
+            "gabarito": ",".join(["A"] * self.n_resp),
+            "erropadrao": self.erropadrao,
+            "n.Ij": str(self.n_Ij),
+        }
+
+    def responder(self, resultado):
+        """Registra a resposta do examinando ao item retornado pelo /proximo."""
+        if resultado[0] == -1 or self.n_resp + 1 >= self.banco.n_itens:
+            self.encerrada = True
+            return
+        pos = int(resultado[2])
+        a, b, c = self.banco.PAR[pos]
+        p = c + (1 - c) / (1 + np.exp(-a * (self.theta - b)))
+        self.administrado.append(resultado[0])
+        self.respostas.append("A" if self.rng.random() < p else "B")
+        if resultado[6] != "NA":
+            self.proficiencia = str(resultado[6])
+        if resultado[7] != "NA":
+            self.erropadrao = str(resultado[7])
+
+
+def ler_replay(caminho):
+    """Requisições (rota, payload) de um JSONL."""
+    requisicoes = []
+    with open(caminho, encoding="utf-8") as f:
+        for linha in f:
+            if not linha.strip():
+                continue
+            dados = json.loads(linha)
+            if "payload" in dados:
+                requisicoes.append((dados.get("rota", "/proximo"), dados["payload"]))
+            else:
+                requisicoes.append(("/proximo", dados))
+    return requisicoes
+
+
+def n_respostas(payload):
+    if "acertos" in payload:
+        acertos = payload["acertos"]
+        return len(acertos) if isinstance(acertos, list) else len(decodificar_textos(acertos))
+    return len(decodificar_textos(payload.get("administrado", "")))
+
+
+class Ritmo:
+    """Limita o início das requisições a uma taxa alvo (requisições por segundo)."""
+
+    def __init__(self, taxa):
+        self.intervalo = 1 / taxa if taxa else 0.0
+        self.proximo = None
+
+    async def aguardar(self):
+        if not self.intervalo:
+            return
+        agora = time.perf_counter()
+        # Sem acúmulo de atraso: um cliente lento não gera rajadas depois
+        self.proximo = max(self.proximo or agora, agora)
+        espera = self.proximo - agora
+        self.proximo += self.intervalo
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+
+class Medicoes:
+    """Latências (s) e status de cada requisição, por número de respostas."""
+
+    def __init__(self):
+        self.latencias = {}
+        self.status = {}
+        self.inicio = time.perf_counter()
+        self.fim = None
+
+    def registrar(self, n_resp, segundos, status):
+        self.latencias.setdefault(n_resp, []).append(segundos)
+        self.status[status] = self.status.get(status, 0) + 1
+
+    def relatorio(self):
+        duracao = (self.fim or time.perf_counter()) - self.inicio
+        todas = [s for lista in self.latencias.values() for s in lista]
+
+        def resumo(amostras):
+            ms = 1000 * np.asarray(amostras)
+            return {
+                "n": len(ms),
+                "p50Ms": float(np.percentile(ms, 50)),
+                "p95Ms": float(np.percentile(ms, 95)),
+                "p99Ms": float(np.percentile(ms, 99)),
+            }
+
+        return {
+            "requisicoes": len(todas),
+            "duracaoS": duracao,
+            "vazaoRps": len(todas) / duracao if duracao > 0 else 0.0,
+            "status": {str(k): v for k, v in sorted(self.status.items(), key=lambda kv: str(kv[0]))},
+            "latencia": resumo(todas) if todas else {},
+            "porRespostas": {str(n): resumo(self.latencias[n]) for n in sorted(self.latencias)},
+        }
+
+
+async def _enviar(cliente, rota, payload, medicoes, comprimir=False):
+    inicio = time.perf_counter()
+    try:
+        if comprimir:
+            corpo = gzip.compress(json.dumps(payload).encode(), compresslevel=1)
+            resposta = await cliente.post(rota, content=corpo, headers={
+                "Content-Encoding": "gzip", "Content-Type": "application/json"
+            })
+        else:
+            resposta = await cliente.post(rota, json=payload)
+        status = resposta.status_code
+    except httpx.HTTPError as e:
+        resposta, status = None, type(e).__name__
+    medicoes.registrar(n_respostas(payload), time.perf_counter() - inicio, status)
+    return resposta
+
+
+async def executar_carga(cliente, concorrencia=8, taxa=None, duracao=None, sessoes=None, replay=None,
+                         comprimir=False):
+    """
+    Dispara a carga com `concorrencia` clientes simultâneos e, se `taxa` for dada, no
+    máximo `taxa` requisições por segundo. sessoes é um iterador de SessaoSintetica;
+    replay, uma lista de (rota, payload) percorrida em ciclo até a duração. Com
+    comprimir=True, os corpos são enviados com Content-Encoding gzip.
+    """
+    medicoes = Medicoes()
+    ritmo = Ritmo(taxa)
+    limite = time.perf_counter() + duracao if duracao else None
+    fila_replay = itertools.cycle(replay) if replay and duracao else iter(replay or [])
+
+    def esgotado():
+        return limite is not None and time.perf_counter() >= limite
+
+    async def cliente_virtual():
+        while not esgotado():
+            if replay is not None:
+                requisicao = next(fila_replay, None)
+                if requisicao is None:
+                    return
+                await ritmo.aguardar()
+                await _enviar(cliente, *requisicao, medicoes, comprimir)
+                continue
+
+            sessao = next(sessoes, None)
+            if sessao is None:
+                return
+            while not sessao.encerrada and not esgotado():
+                await ritmo.aguardar()
+                resposta = await _enviar(cliente, "/proximo", sessao.payload(), medicoes, comprimir)
+                if resposta is None or resposta.status_code != 200:
+                    break
+                sessao.responder(resposta.json())
+
+    await asyncio.gather(*(cliente_virtual() for _ in range(concorrencia)))
+    medicoes.fim = time.perf_counter()
+    return medicoes.relatorio()
+
+
+def gerar_sessoes(campos, n_sessoes=None, semente=0, **kwargs):
+    """Sessões sintéticas com theta ~ N(0, 1); infinitas se n_sessoes for None."""
+    banco = banco_do_payload(campos)
+    rng = np.random.default_rng(semente)
+    contagem = itertools.count() if n_sessoes is None else range(n_sessoes)
+    return (SessaoSintetica(banco, campos, rng.standard_normal(), rng, **kwargs) for _ in contagem)
+
+
+def iniciar_uvicorn(porta, workers=1, timeout=30.0):
+    """Inicia `uvicorn main:app` em um subprocesso e espera o /pingR responder."""
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(porta),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if processo.poll() is not None:
+            raise RuntimeError(f"uvicorn terminou com código {processo.returncode} antes de responder")
+        try:
+            if httpx.post(f"http://127.0.0.1:{porta}/pingR").status_code == 200:
+                return processo
+        except httpx.HTTPError:
+            pass
+        # Espera entre tentativas também quando o servidor responde com erro, para não
+        # ocupar um núcleo que o servidor prestes a ser medido vai usar
+        time.sleep(0.2)
+    processo.terminate()
+    raise RuntimeError("uvicorn não respondeu no tempo limite")
+
+
+async def _executar(args, sessoes, replay):
+    if args.url:
+        cliente = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        from main import app
+        cliente = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://tai", timeout=args.timeout)
+    async with cliente:
+        return await executar_carga(
+            cliente, args.concorrencia, args.taxa, args.duracao, sessoes=sessoes, replay=replay,
+            comprimir=args.gzip
+        )
+
+
+def imprimir(relatorio, arquivo=sys.stderr):
+    print(f"{relatorio['requisicoes']} requisições em {relatorio['duracaoS']:.1f} s "
+          f"({relatorio['vazaoRps']:.1f} req/s), status {relatorio['status']}", file=arquivo)
+    print(f"{'respostas':>10} {'n':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}", file=arquivo)
+    for n_resp, r in relatorio["porRespostas"].items():
+        print(f"{n_resp:>10} {r['n']:>7} {r['p50Ms']:>9.2f} {r['p95Ms']:>9.2f} {r['p99Ms']:>9.2f}", file=arquivo)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga do /proximo")
+    origem = parser.add_mutually_exclusive_group()
+    origem.add_argument("--replay", help="JSONL com payloads do /proximo")
+    origem.add_argument("--banco", help="CSV do banco para gerar sessões sintéticas")
+    parser.add_argument("--componente", default="LP")
+    parser.add_argument("--n-itens", type=int, default=200, help="itens do banco sintético (sem --banco)")
+    parser.add_argument("--sessoes", type=int, help="número de sessões sintéticas (padrão: até a duração)")
+    parser.add_argument("--concorrencia", type=int, default=8, help="clientes simultâneos")
+    parser.add_argument("--taxa", type=float, help="requisições por segundo (padrão: sem limite)")
+    parser.add_argument("--duracao", type=float, help="segundos de carga")
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--gzip", action="store_true", help="envia os corpos comprimidos com gzip")
+    alvo = parser.add_mutually_exclusive_group()
+    alvo.add_argument("--url", help="URL de uma instância já em execução")
+    alvo.add_argument("--uvicorn", action="store_true", help="inicia um uvicorn local para o teste")
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=1, help="workers do uvicorn iniciado com --uvicorn")
+    parser.add_argument("--saida", help="arquivo JSON com o relatório")
+    args = parser.parse_args(argv)
+
+    if args.sessoes is None and args.duracao is None and not args.replay:
+        args.sessoes = 100
+
+    replay = sessoes = None
+    if args.replay:
+        replay = ler_replay(args.replay)
+    else:
+        campos = (campos_banco_csv(args.banco, args.componente) if args.banco
+                  else campos_banco_sintetico(args.n_itens, args.semente))
+        sessoes = gerar_sessoes(campos, args.sessoes, args.semente)
+
+    processo = None
+    if args.uvicorn:
+        processo = iniciar_uvicorn(args.porta, args.workers)
+        args.url = f"http://127.0.0.1:{args.porta}"
+    try:
+        relatorio = asyncio.run(_executar(args, sessoes, replay))
+    finally:
+        if processo is not None:
+            processo.terminate()
+            processo.wait()
+
+    imprimir(relatorio)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
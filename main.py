@@ -1,13 +1,46 @@
+import os
 from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
 from routers.api import router as api_router
+from routers.bancos import router as bancos_router
+from routers.sessoes import router as sessoes_router
+from routers.metricas import router as metricas_router
+from routers.perfil import router as perfil_router
+from services.perfil import perfis, middleware_perfil
+from utils.transporte import RespostaJSON, DescompressaoMiddleware
 
 app = FastAPI(
     title="API Adaptativa",
     description="API para testes adaptativos com parâmetros complexos",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=RespostaJSON
 )
 
+# Corpos de requisição com Content-Encoding gzip/deflate e respostas comprimidas
+# para clientes que enviam Accept-Encoding
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("TAI_GZIP_MINIMO", "1000")))
+app.add_middleware(DescompressaoMiddleware)
+
 app.include_router(api_router)
+app.include_router(bancos_router)
+app.include_router(sessoes_router)
+app.include_router(metricas_router)
+app.include_router(perfil_router)
+
+# Perfis por requisição: o middleware só é instalado com a coleta ativa
+if perfis.ativo:
+    app.middleware("http")(middleware_perfil)
+
+# Bancos gravados (services.armazenamento), mapeados em memória e compartilhados entre os workers
+if os.getenv("TAI_DIR_BANCOS") and os.path.isdir(os.getenv("TAI_DIR_BANCOS")):
+    from services.armazenamento import carregar_diretorio
+    from services.banco import registro_bancos
+    carregar_diretorio(registro_bancos, os.getenv("TAI_DIR_BANCOS"))
+
+# Árvores de decisão geradas antes da janela de aplicação
+if os.getenv("TAI_DIR_ARVORES") and os.path.isdir(os.getenv("TAI_DIR_ARVORES")):
+    from services.arvore import registro_arvores
+    registro_arvores.carregar_diretorio(os.getenv("TAI_DIR_ARVORES"))
 
 if __name__ == "__main__":
     import uvicorn
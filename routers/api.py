@@ -1,18 +1,25 @@
 
-from fastapi import APIRouter, HTTPException, Request, Body
+from fastapi import APIRouter, HTTPException, Body
 from typing import Any, Dict
 import numpy as np
 from services.adaptive_testing import (
-    transformar_parametros,
-    EAP,
-    criterio_parada,
-    maxima_informacao_th,
-    proximo_item_criterio,
-    verificar_valid_eixo
+    valid_eixo_contagem, theta_da_escala_saeb, quadratura, log_verossimilhanca, estimar_posteriori
 )
-from utils.helpers import parse_str_list, normalizar_componente
+from services.decisao import primeiro_item, proximo_passo
+from services.lote import EstudanteLote, proximo_lote
+from services.execucao import executor, FilaCheia, BancoAusente
+from services.metricas import medir, REQUISICOES
+from services.arvore import registro_arvores
+from services.banco import registro_bancos, banco_do_payload
+from services.cache import cache_decisoes
+from services.estimadores import estimador_padrao
+from services.informacao import CRITERIO_SELECAO, pesos_posteriori
+from services.auditoria import auditoria, registro_decisao
+from services.checkpoint import checkpoints, pedido as pedido_checkpoint
+from utils.helpers import ler_respostas
+from utils.transporte import RotaJSON
 
-router = APIRouter()
+router = APIRouter(route_class=RotaJSON)
 
 # Configuração do exemplo para documentação
 PROXIMO_ITEM_DOCS = {
@@ -42,128 +49,279 @@ EXEMPLO_PAYLOAD = Body(
         "idHabilidade": "2,3"
     }
 )
-@router.post("/proximo", **PROXIMO_ITEM_DOCS)
-async def proximo_item(
-    request: Request,
-    payload: Dict[str, Any] = EXEMPLO_PAYLOAD
-):
-    body = await request.json()
 
-    try:
+
+def obter_banco(body, registrar=False):
+    """
+    Resolve o banco da requisição: pelo idBanco registrado ou pelos campos do payload.
+    Com registrar=True, o banco enviado no payload também é registrado.
+    """
+    if "idBanco" in body:
+        banco = registro_bancos.obter(body["idBanco"])
+        if banco is None:
+            raise HTTPException(status_code=404, detail=f"Banco não registrado: {body['idBanco']}")
+        return banco
+    banco = banco_do_payload(body)
+    if registrar:
+        registro_bancos.registrar(banco)
+    return banco
+
+
+EXEMPLO_LOTE = Body(
+    ...,
+    example={
+        "idBanco": "LP-8-2025",
+        "estudantes": [
+            {
+                "ESTUDANTE": "Aluno1",
+                "AnoEscolarEstudante": "8",
+                "profic.inic": "500.0",
+                "administrado": "ITEM1",
+                "respostas": "A",
+                "gabarito": "A",
+                "n.Ij": "45"
+            }
+        ]
+    }
+)
+
+
+def calcular_proximo(body, banco=None):
+    """
+    Cálculo completo do /proximo a partir do payload já decodificado. O banco pode
+    ser passado já resolvido (ver calcular_proximo_no_processo).
+    """
+    with medir("parse"):
         # Conversão dos campos do payload recebido
         ESTUDANTE = body["ESTUDANTE"]
         AnoEscolarEstudante = int(body["AnoEscolarEstudante"])
         proficiencia = float(body["proficiencia"])
         profic_inic = float(body["profic.inic"])
-        idItem = body["idItem"].split(",")
-        parA = parse_str_list(body["parA"])
-        parB = parse_str_list(body["parB"])
-        parC = parse_str_list(body["parC"])
-        # Filtrar strings vazias para administrado, respostas e gabarito
-        administrado = [a for a in body["administrado"].split(",") if a]
-        respostas = [r for r in body["respostas"].split(",") if r]
-        gabarito = [g for g in body["gabarito"].split(",") if g]
-        if len(respostas) != len(gabarito):
-            raise HTTPException(status_code=400, detail="respostas e gabarito devem ter o mesmo tamanho")
+        administrado, respostas_corrigidas = ler_respostas(body)
         erropadrao = float(body["erropadrao"])
         n_Ij = int(body["n.Ij"])
-        componente = normalizar_componente(body["componente"])
-        idEixo = parse_str_list(body["idEixo"], int)
-        idHabilidade = parse_str_list(body["idHabilidade"], int)
-
-        # Gabarito corrigido (0/1)
-        respostas_corrigidas = np.array([1 if r == g else 0 for r, g in zip(respostas, gabarito)])
-
-        administrado_idx = [idx for idx, item in enumerate(idItem) if item in set(administrado)]
-        PAR = np.column_stack((parA, parB, parC))
-        PAR = transformar_parametros(PAR, componente)
-
-        # NOVO: calcular validEixo com base nos eixos aplicados - Corrige parada na 8 questão
-        validEixo = verificar_valid_eixo(administrado_idx, idEixo)
-        
-        if len(respostas_corrigidas) == 0:
-            # PRIMEIRA RESPOSTA
-            theta_est_ep = (profic_inic - 249.985) / 55.093
-            INFO = maxima_informacao_th(theta_est_ep, PAR)
-            pos = proximo_item_criterio(INFO, administrado_idx)
-            return [
-                idItem[pos],
-                "1",
-                str(pos),
-                str(round(PAR[pos, 0], 6)),
-                str(round(PAR[pos, 1], 14)),
-                str(round(parC[pos], 3)),
-                str(round(profic_inic, 13)),
-                "NA"
-            ]
-        else:
-            # ESTIMA PROFICIÊNCIA
-            PAR_adm = PAR[administrado_idx, :]
-            theta_est, theta_ep = EAP(respostas_corrigidas, PAR_adm, administrado_idx)
-
-            # NOVO: enviar validEixo - Corrige parada na 8 questão
-            parar = criterio_parada(
-                theta_est, theta_ep, Area=componente, AnoEscolar=AnoEscolarEstudante,
-                n_resp=len(respostas_corrigidas), n_Ij=n_Ij, validEixo=validEixo
+        # Sorteio entre os k itens mais informativos (1 = seleção determinística)
+        randomesque = int(body.get("randomesque", 1))
+        # Checkpoint da posteriori (services.checkpoint), só com o EAP padrão
+        pede_checkpoint, checkpoint = pedido_checkpoint(body)
+        pede_checkpoint = pede_checkpoint and estimador_padrao.nome == "eap"
+
+        # Banco previamente registrado (idBanco) ou enviado por completo no payload
+        if banco is None:
+            banco = obter_banco(body)
+
+        administrado_idx = banco.indices(administrado)
+
+    REQUISICOES.inc(rota="/proximo", componente=banco.componente, ano_escolar=AnoEscolarEstudante)
+
+    log_posteriori, do_checkpoint = None, False
+    if pede_checkpoint:
+        with medir("checkpoint"):
+            log_posteriori, do_checkpoint = checkpoints.posteriori(
+                checkpoint, banco, administrado_idx, respostas_corrigidas
+            )
+
+    # A seleção é determinística (exceto no randomesque): as primeiras etapas podem vir
+    # da árvore pré-calculada e entradas já calculadas são respondidas pelo cache
+    detalhes = {} if auditoria.ativo else None
+    resultado, origem, chave = None, "calculo", None
+    if randomesque <= 1:
+        # As árvores são construídas com o EAP padrão e a máxima informação de Fisher
+        if len(registro_arvores) and estimador_padrao.nome == "eap" and CRITERIO_SELECAO == "mfi":
+            resultado = registro_arvores.responder(
+                banco, AnoEscolarEstudante, profic_inic, n_Ij, administrado_idx, respostas_corrigidas, detalhes
+            )
+            origem = "arvore"
+        if resultado is None:
+            chave = cache_decisoes.chave(
+                banco, AnoEscolarEstudante, profic_inic, n_Ij, administrado_idx, respostas_corrigidas,
+                estimador_padrao.nome, proficiencia if estimador_padrao.usa_theta_inicial else None
             )
+            resultado = cache_decisoes.obter(chave, detalhes)
+            origem = "cache"
+
+    if resultado is None:
+        origem = "calculo"
+        resultado = decidir_proximo(
+            banco, AnoEscolarEstudante, profic_inic, n_Ij, administrado_idx, respostas_corrigidas, randomesque,
+            proficiencia=proficiencia, detalhes=detalhes, log_posteriori=log_posteriori
+        )
+        # A posteriori de um checkpoint é quantizada: a decisão não vai para o cache,
+        # que continua respondendo exatamente como o cálculo do zero
+        if chave is not None and not do_checkpoint:
+            cache_decisoes.guardar(chave, resultado, detalhes)
+
+    if detalhes is not None:
+        auditoria.registrar(registro_decisao(
+            "/proximo", banco, ESTUDANTE, AnoEscolarEstudante, profic_inic, n_Ij, administrado_idx,
+            respostas_corrigidas, resultado, detalhes, origem
+        ))
+    if pede_checkpoint:
+        # 9º elemento: o checkpoint para a próxima chamada (None quando o teste terminou)
+        resultado = list(resultado) + [
+            None if resultado[0] == -1 else
+            checkpoints.gerar(banco, log_posteriori, administrado_idx, respostas_corrigidas)
+        ]
+    return resultado
+
 
-            if not parar:
-                INFO = maxima_informacao_th(theta_est, PAR)
-                pos = proximo_item_criterio(INFO, administrado_idx)
-
-                # NOVO: Aplica a escala SAEB correta conforme o componente - Corrige diferença de escala
-                if componente == "LP":
-                    theta_saeb = theta_est * 55.093 + 249.985
-                    erro_saeb = theta_ep * 55.093
-                elif componente == "MT":
-                    theta_saeb = theta_est * 55.892 + 249.964
-                    erro_saeb = theta_ep * 55.892
-                elif componente == "CN":
-                    theta_saeb = theta_est * 55.789 + 249.955
-                    erro_saeb = theta_ep * 55.789
-                else:  # componente CH ou outros
-                    theta_saeb = theta_est * 55.093 + 249.985
-                    erro_saeb = theta_ep * 55.093
-
-                return [
-                    idItem[pos],
-                    str(len(respostas_corrigidas) + 1),
-                    str(pos),
-                    str(round(PAR[pos, 0], 6)),
-                    str(round(PAR[pos, 1], 14)),
-                    str(round(parC[pos], 3)),
-                    str(round(theta_saeb, 12)),
-                    str(round(erro_saeb, 13))
-                ]
-            else:
-                # NOVO: Aplica a escala SAEB correta conforme o componente - Corrige diferença de escala
-                if componente == "LP":
-                    theta_saeb = theta_est * 55.093 + 249.985
-                    erro_saeb = theta_ep * 55.093
-                elif componente == "MT":
-                    theta_saeb = theta_est * 55.892 + 249.964
-                    erro_saeb = theta_ep * 55.892
-                elif componente == "CN":
-                    theta_saeb = theta_est * 55.789 + 249.955
-                    erro_saeb = theta_ep * 55.789
-                else:  # componente CH ou outros
-                    theta_saeb = theta_est * 55.093 + 249.985
-                    erro_saeb = theta_ep * 55.093
-
-                return [
-                    -1,
-                    "NA",
-                    "NA",
-                    "NA",
-                    "NA",
-                    "NA",
-                    round(theta_saeb, 4),
-                    round(erro_saeb, 4)
-                ]
+def decidir_proximo(banco, AnoEscolarEstudante, profic_inic, n_Ij, administrado_idx, respostas_corrigidas, randomesque=1,
+                    proficiencia=None, estimador=None, detalhes=None, criterio=None, log_posteriori=None):
+    """
+    Decisão do /proximo. O estimador de proficiência e o critério de seleção são os
+    configurados na implantação (TAI_ESTIMADOR e TAI_CRITERIO_SELECAO); proficiencia,
+    na escala SAEB, é o ponto de partida dos estimadores iterativos. detalhes
+    (opcional) recebe os valores da auditoria. log_posteriori, se informada, é a
+    posteriori do EAP padrão já atualizada (checkpoint) e dispensa o estimador.
+    """
+    estimador = estimador or estimador_padrao
+    criterio = criterio or CRITERIO_SELECAO
+    # NOVO: calcular validEixo com base nos eixos aplicados - Corrige parada na 8 questão
+    validEixo = valid_eixo_contagem(len(administrado_idx), banco.eixos_distintos)
+
+    if len(respostas_corrigidas) == 0:
+        # PRIMEIRA RESPOSTA
+        return primeiro_item(banco, profic_inic, administrado_idx, randomesque, detalhes)
+
+    # ESTIMA PROFICIÊNCIA
+    if log_posteriori is not None:
+        with medir("eap"):
+            theta_est, theta_ep = estimar_posteriori(log_posteriori, quadratura()[0])
+    else:
+        theta_inicial = None if proficiencia is None else theta_da_escala_saeb(proficiencia, banco.componente)
+        with medir("eap"):
+            estimativa = estimador.estimar(banco, administrado_idx, respostas_corrigidas, theta_inicial)
+        theta_est, theta_ep = estimativa.theta, estimativa.ep
+
+    # pwi e kl ponderam pela posteriori nos nós da quadratura padrão
+    pesos = None
+    if criterio != "mfi":
+        if log_posteriori is None:
+            _, log_priori = quadratura()
+            log_posteriori = log_verossimilhanca(respostas_corrigidas, banco.grade(administrado_idx)) + log_priori
+        pesos = pesos_posteriori(log_posteriori)
+
+    # NOVO: enviar validEixo - Corrige parada na 8 questão
+    return proximo_passo(
+        banco, theta_est, theta_ep, administrado_idx,
+        n_resp=len(respostas_corrigidas), AnoEscolar=AnoEscolarEstudante,
+        n_Ij=n_Ij, validEixo=validEixo, randomesque=randomesque, detalhes=detalhes,
+        pesos=pesos, criterio=criterio
+    )
+
+
+def calcular_proximo_no_processo(body, id_banco, impressao, banco=None):
+    """
+    calcular_proximo em um processo do pool de execução, que mantém o próprio registro
+    de bancos: o banco vem do registro do processo (ou do diretório de bancos) e só é
+    recebido por inteiro quando o processo ainda não tem esta versão dele.
+    """
+    if banco is not None:
+        registro_bancos.registrar(banco)
+    else:
+        banco = registro_bancos.obter(id_banco)
+        if banco is not None and banco.impressao != impressao:
+            banco = registro_bancos.obter(id_banco, verificar=True)
+        if banco is None or banco.impressao != impressao:
+            raise BancoAusente(id_banco)
+    return calcular_proximo(body, banco)
+
+
+@router.post("/proximo", **PROXIMO_ITEM_DOCS)
+async def proximo_item(payload: Dict[str, Any] = EXEMPLO_PAYLOAD):
+    # O corpo já chega decodificado uma única vez pelo FastAPI
+    try:
+        with medir("proximo"):
+            if executor.modo == "process" and "idBanco" in payload:
+                # O banco é resolvido aqui (404) e segue só pelo id e pela impressão do conteúdo
+                banco = obter_banco(payload)
+                try:
+                    return await executor.executar(calcular_proximo_no_processo, payload, banco.id, banco.impressao)
+                except BancoAusente:
+                    return await executor.executar(
+                        calcular_proximo_no_processo, payload, banco.id, banco.impressao, banco
+                    )
+            return await executor.executar(calcular_proximo, payload)
+    except FilaCheia as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     
 
+@router.post("/proximo/lote", summary="Seleciona o próximo item de vários estudantes do mesmo banco")
+def proximo_item_lote(payload: Dict[str, Any] = EXEMPLO_LOTE):
+    """
+    Recebe o banco (idBanco ou campos completos) e a lista de estudantes, com os mesmos
+    campos individuais do /proximo. Retorna, na mesma ordem, a resposta de cada
+    estudante no formato do /proximo ou {"erro": ...} se os dados do estudante forem inválidos.
+    """
+    try:
+        banco = obter_banco(payload).preparar()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    validos, erros = [], {}
+    for j, dados in enumerate(payload.get("estudantes", [])):
+        try:
+            administrado, respostas_corrigidas = ler_respostas(dados)
+            validos.append((j, EstudanteLote(
+                ano_escolar=int(dados["AnoEscolarEstudante"]),
+                profic_inic=float(dados["profic.inic"]),
+                n_Ij=int(dados["n.Ij"]),
+                administrado_idx=banco.indices(administrado),
+                acertos=respostas_corrigidas.tolist(),
+            )))
+        except Exception as e:
+            erros[j] = {"erro": str(e)}
+
+    for ano, n in zip(*np.unique([e.ano_escolar for _, e in validos], return_counts=True)):
+        REQUISICOES.inc(int(n), rota="/proximo/lote", componente=banco.componente, ano_escolar=int(ano))
+
+    detalhes = [] if auditoria.ativo else None
+    with medir("proximo_lote"):
+        try:
+            calculados = proximo_lote(banco, [e for _, e in validos], detalhes)
+        except Exception:
+            # Um estudante que falhe no cálculo conjunto não derruba o lote:
+            # cada um é recalculado sozinho e só o que falhar recebe {"erro": ...}
+            validos, calculados, detalhes = calcular_individualmente(banco, validos, erros, detalhes)
+    if detalhes is not None:
+        estudantes = payload.get("estudantes", [])
+        for (j, e), resultado, d in zip(validos, calculados, detalhes):
+            auditoria.registrar(registro_decisao(
+                "/proximo/lote", banco, estudantes[j].get("ESTUDANTE"), e.ano_escolar, e.profic_inic, e.n_Ij,
+                e.administrado_idx, e.acertos, resultado, d
+            ))
+    resultados = dict(erros)
+    resultados.update({j: r for (j, _), r in zip(validos, calculados)})
+    return {"resultados": [resultados[j] for j in range(len(resultados))]}
+
+
+def calcular_individualmente(banco, validos, erros, detalhes=None):
+    """
+    Calcula os estudantes do lote um a um. Os que falharem vão para erros; retorna os
+    que deram certo, as respostas e os detalhes da auditoria (se pedidos) deles.
+    """
+    restantes, calculados = [], []
+    detalhes = None if detalhes is None else []
+    for j, e in validos:
+        d = None if detalhes is None else []
+        try:
+            resultado = proximo_lote(banco, [e], d)[0]
+        except Exception as ex:
+            erros[j] = {"erro": str(ex)}
+            continue
+        restantes.append((j, e))
+        calculados.append(resultado)
+        if detalhes is not None:
+            detalhes.extend(d)
+    return restantes, calculados, detalhes
+
+
 @router.post("/pingR")
 def ping():
     return {"status": "200"}    
\ No newline at end of file
@@ -0,0 +1,160 @@
+import os
+import shutil
+from fastapi import APIRouter, HTTPException, Body
+from typing import Any, Dict
+from services.arvore import construir_arvore, registro_arvores, nome_arquivo
+from services.armazenamento import salvar_banco, carregar_banco, caminho_banco
+from services.banco import registro_bancos, banco_do_payload, alterar_banco
+from utils.helpers import decodificar_textos
+from utils.transporte import RotaJSON
+
+router = APIRouter(route_class=RotaJSON)
+
+# A árvore tem 2^(profundidade+1) - 1 nós, cada um com uma seleção: o POST /arvores
+# limita a profundidade (a CLI services.arvore não tem limite)
+MAX_PROFUNDIDADE_ARVORE = int(os.getenv("TAI_MAX_PROFUNDIDADE_ARVORE", "12"))
+
+EXEMPLO_BANCO = Body(
+    ...,
+    example={
+        "idBanco": "LP-8-2025",
+        "idItem": "ITEM1,ITEM2",
+        "parA": "1.0,2.0",
+        "parB": "250.0,300.0",
+        "parC": "0.2,0.3",
+        "componente": "Língua portuguesa",
+        "idEixo": "1,2",
+        "idHabilidade": "2,3"
+    }
+)
+
+
+@router.post("/bancos", summary="Registra um banco de itens para uso no /proximo")
+def registrar_banco(payload: Dict[str, Any] = EXEMPLO_BANCO):
+    """
+    Prepara o banco (parâmetros transformados e grade de probabilidades) e o mantém
+    em memória. Sem idBanco, o identificador é o hash do conteúdo do banco. Se
+    TAI_DIR_BANCOS estiver definido, o banco também é gravado nesse diretório e
+    mapeado de lá, ficando disponível para os demais workers.
+    """
+    try:
+        banco = banco_do_payload(payload, id_banco=payload.get("idBanco"))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if registro_bancos.diretorio:
+        os.makedirs(registro_bancos.diretorio, exist_ok=True)
+        banco = carregar_banco(salvar_banco(banco, registro_bancos.diretorio))
+    registro_bancos.registrar(banco)
+    return {"idBanco": banco.id, "componente": banco.componente, "nItens": banco.n_itens}
+
+
+@router.delete("/bancos/{id_banco}", summary="Remove um banco registrado")
+def remover_banco(id_banco: str):
+    """
+    Remove o banco da memória e, com TAI_DIR_BANCOS, do diretório; os demais workers
+    o descartam na próxima verificação (TAI_INTERVALO_BANCOS).
+    """
+    with registro_bancos.bloqueio(id_banco):
+        gravado = None
+        if registro_bancos.diretorio:
+            gravado = caminho_banco(registro_bancos.diretorio, id_banco)
+            gravado = gravado if os.path.isdir(gravado) else None
+        if not registro_bancos.remover(id_banco) and gravado is None:
+            raise HTTPException(status_code=404, detail=f"Banco não registrado: {id_banco}")
+        if gravado is not None:
+            shutil.rmtree(gravado, ignore_errors=True)
+    return {"idBanco": id_banco}
+
+
+EXEMPLO_ALTERACAO = Body(
+    ...,
+    example={
+        "remover": "ITEM1",
+        "recalibrar": {"idItem": "ITEM2", "parA": "1.5", "parB": "280.0", "parC": "0.25"},
+        "adicionar": {
+            "idItem": "ITEM3",
+            "parA": "1.2",
+            "parB": "260.0",
+            "parC": "0.2",
+            "idEixo": "1",
+            "idHabilidade": "4"
+        }
+    }
+)
+
+
+@router.patch("/bancos/{id_banco}", summary="Remove, recalibra ou adiciona itens de um banco registrado")
+def alterar_banco_registrado(id_banco: str, payload: Dict[str, Any] = EXEMPLO_ALTERACAO):
+    """
+    Gera uma nova versão do banco recalculando só os itens alterados. Requisições e
+    sessões em andamento terminam com a versão anterior; as decisões em cache e as
+    árvores da versão anterior deixam de ser usadas. Alterações simultâneas do mesmo
+    banco são serializadas e cada uma parte da versão gravada mais recente; os demais
+    workers passam a usar a versão nova na próxima verificação (TAI_INTERVALO_BANCOS).
+    """
+    with registro_bancos.bloqueio(id_banco):
+        banco = registro_bancos.obter(id_banco, verificar=True)
+        if banco is None:
+            raise HTTPException(status_code=404, detail=f"Banco não registrado: {id_banco}")
+
+        try:
+            alterado = alterar_banco(
+                banco,
+                remover=decodificar_textos(payload.get("remover", "")),
+                recalibrar=payload.get("recalibrar"),
+                adicionar=payload.get("adicionar"),
+            )
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        if registro_bancos.diretorio:
+            alterado = carregar_banco(salvar_banco(alterado, registro_bancos.diretorio))
+        registro_bancos.registrar(alterado)
+    registro_arvores.remover_banco(id_banco)
+    return {"idBanco": alterado.id, "versao": alterado.versao, "nItens": alterado.n_itens}
+
+
+EXEMPLO_ARVORE = Body(
+    ...,
+    example={
+        "idBanco": "LP-8-2025",
+        "AnoEscolarEstudante": "8",
+        "profic.inic": "500.0",
+        "n.Ij": "45",
+        "profundidade": 8
+    }
+)
+
+
+@router.post("/arvores", summary="Pré-calcula a árvore de decisão das primeiras etapas")
+def construir_arvore_banco(payload: Dict[str, Any] = EXEMPLO_ARVORE):
+    """
+    Gera a árvore de decisão para um banco registrado e a usa no /proximo. Se
+    TAI_DIR_ARVORES estiver definido, a árvore também é gravada nesse diretório.
+    """
+    banco = registro_bancos.obter(payload.get("idBanco"))
+    if banco is None:
+        raise HTTPException(status_code=404, detail=f"Banco não registrado: {payload.get('idBanco')}")
+
+    try:
+        profundidade = int(payload.get("profundidade", 8))
+        if not 0 <= profundidade <= MAX_PROFUNDIDADE_ARVORE:
+            raise ValueError(f"profundidade deve estar entre 0 e {MAX_PROFUNDIDADE_ARVORE}")
+        arvore = construir_arvore(
+            banco,
+            ano_escolar=int(payload["AnoEscolarEstudante"]),
+            profic_inic=float(payload["profic.inic"]),
+            n_Ij=int(payload.get("n.Ij", 45)),
+            profundidade=profundidade,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    registro_arvores.adicionar(arvore)
+    diretorio = os.getenv("TAI_DIR_ARVORES")
+    if diretorio:
+        os.makedirs(diretorio, exist_ok=True)
+        arvore.salvar(os.path.join(diretorio, nome_arquivo(arvore)))
+
+    return {**arvore.meta, "nDecisoes": int((arvore.item >= 0).sum())}
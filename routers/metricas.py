@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from services.metricas import metricas
+
+router = APIRouter()
+
+
+@router.get("/metrics", response_class=PlainTextResponse, summary="Métricas no formato texto do Prometheus")
+def exportar_metricas():
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,31 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import PlainTextResponse
+from services.perfil import perfis
+
+router = APIRouter()
+
+
+@router.get("/debug/perfis", summary="Perfis das requisições mais recentes")
+def listar_perfis():
+    """
+    Perfis coletados pelo cabeçalho X-TAI-Perfil (TAI_PERFIL_HEADER=1) ou por
+    amostragem (TAI_PERFIL_AMOSTRA), do mais recente para o mais antigo.
+    """
+    return {"ativo": perfis.ativo, "perfis": perfis.listar()}
+
+
+@router.get("/debug/perfis/{id_perfil}", summary="Etapas de uma requisição perfilada")
+def obter_perfil(id_perfil: str):
+    perfil = perfis.obter(id_perfil)
+    if perfil is None:
+        raise HTTPException(status_code=404, detail=f"Perfil não encontrado: {id_perfil}")
+    return perfil.resumo()
+
+
+@router.get("/debug/perfis/{id_perfil}/cprofile", response_class=PlainTextResponse,
+            summary="Relatório do cProfile de uma requisição perfilada")
+def obter_cprofile(id_perfil: str):
+    perfil = perfis.obter(id_perfil)
+    if perfil is None or perfil.cprofile is None:
+        raise HTTPException(status_code=404, detail=f"Perfil com cProfile não encontrado: {id_perfil}")
+    return PlainTextResponse(perfil.cprofile)
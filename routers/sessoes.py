@@ -0,0 +1,110 @@
+from fastapi import APIRouter, HTTPException, Body
+from typing import Any, Dict
+from routers.api import obter_banco
+from services.adaptive_testing import escala_saeb
+from services.auditoria import auditoria, registro_decisao
+from services.metricas import REQUISICOES
+from services.sessoes import armazem_sessoes, RespostaConflitante
+from utils.transporte import RotaJSON
+
+router = APIRouter(route_class=RotaJSON)
+
+EXEMPLO_INICIO = Body(
+    ...,
+    example={
+        "ESTUDANTE": "Aluno1",
+        "AnoEscolarEstudante": "8",
+        "profic.inic": "500.0",
+        "n.Ij": "45",
+        "idBanco": "LP-8-2025"
+    }
+)
+
+EXEMPLO_RESPOSTA = Body(..., example={"idItem": "ITEM1", "resposta": "A", "gabarito": "A"})
+
+
+def auditar(sessao, rota, detalhes):
+    if detalhes is not None:
+        auditoria.registrar(registro_decisao(
+            rota, sessao.banco, sessao.estudante, sessao.ano_escolar, sessao.profic_inic, sessao.n_Ij,
+            sessao.ordem, sessao.acertos, sessao.resultado, detalhes
+        ))
+
+
+def obter_sessao(id_sessao):
+    sessao = armazem_sessoes.obter(id_sessao)
+    if sessao is None:
+        raise HTTPException(status_code=404, detail=f"Sessão não encontrada ou expirada: {id_sessao}")
+    return sessao
+
+
+@router.post("/sessoes", summary="Inicia um teste adaptativo com estado no servidor")
+def iniciar_sessao(payload: Dict[str, Any] = EXEMPLO_INICIO):
+    """
+    Cria a sessão e retorna o primeiro item. O banco pode ser referenciado por idBanco
+    ou enviado por completo (nesse caso é registrado).
+    """
+    try:
+        banco = obter_banco(payload, registrar=True)
+        sessao = armazem_sessoes.criar(
+            banco,
+            ano_escolar=int(payload["AnoEscolarEstudante"]),
+            profic_inic=float(payload["profic.inic"]),
+            n_Ij=int(payload["n.Ij"]),
+            estudante=payload.get("ESTUDANTE", ""),
+        )
+        detalhes = {} if auditoria.ativo else None
+        item = sessao.iniciar(detalhes)
+        auditar(sessao, "/sessoes", detalhes)
+        REQUISICOES.inc(rota="/sessoes", componente=banco.componente, ano_escolar=sessao.ano_escolar)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"idSessao": sessao.id, "item": item}
+
+
+@router.post("/sessoes/{id_sessao}/respostas", summary="Registra a resposta ao item atual")
+def responder_sessao(id_sessao: str, payload: Dict[str, Any] = EXEMPLO_RESPOSTA):
+    """
+    Retorna o próximo item no mesmo formato do /proximo, ou o resultado final (-1).
+    idItem é o item respondido: uma resposta que não seja ao item atual (por exemplo, o
+    reenvio de uma resposta já aplicada) recebe 409 e não altera a sessão.
+    """
+    sessao = obter_sessao(id_sessao)
+    if sessao.finalizada:
+        raise HTTPException(status_code=409, detail="Sessão já finalizada")
+    if "idItem" not in payload:
+        raise HTTPException(status_code=400, detail="Informe o idItem do item respondido")
+
+    try:
+        detalhes = {} if auditoria.ativo else None
+        item, variacao = sessao.responder(
+            payload["resposta"] == payload["gabarito"], detalhes, id_item=str(payload["idItem"])
+        )
+        auditar(sessao, "/sessoes/respostas", detalhes)
+        REQUISICOES.inc(rota="/sessoes/respostas", componente=sessao.banco.componente, ano_escolar=sessao.ano_escolar)
+        armazem_sessoes.atualizar(sessao, variacao)
+    except RespostaConflitante as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {"idSessao": sessao.id, "item": item, "finalizada": sessao.finalizada}
+
+
+@router.delete("/sessoes/{id_sessao}", summary="Encerra a sessão e retorna a proficiência")
+def finalizar_sessao(id_sessao: str):
+    sessao = obter_sessao(id_sessao)
+    armazem_sessoes.remover(id_sessao)
+
+    theta_est, theta_ep = sessao.estimativa()
+    theta_saeb, erro_saeb = escala_saeb(theta_est, theta_ep, sessao.banco.componente)
+    return {
+        "idSessao": sessao.id,
+        "ESTUDANTE": sessao.estudante,
+        "nRespostas": sessao.n_resp,
+        "proficiencia": round(theta_saeb, 4),
+        "erropadrao": round(erro_saeb, 4),
+    }
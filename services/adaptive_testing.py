@@ -1,122 +1,229 @@
 import numpy as np
+from functools import lru_cache
+
+from services.perfis_pontuacao import perfis_pontuacao
 
 def transformar_parametros(PAR, componente):
     """
-    Transforma os parâmetros dos itens (parA e parB) com base no componente.
-    """
-    if componente == "LP":
-        # Transformação para Língua Portuguesa
-        PAR[:, 0] = PAR[:, 0] * 55.093
-        PAR[:, 1] = (PAR[:, 1] - 249.985) / 55.093
-    elif componente == "MT":
-        # Transformação para Matemática
-        PAR[:, 0] = PAR[:, 0] * 55.892
-        PAR[:, 1] = (PAR[:, 1] - 249.964) / 55.892
-    elif componente == "CN":
-        # Transformação para Ciências da Natureza
-        PAR[:, 0] = PAR[:, 0] * 55.7899
-        PAR[:, 1] = (PAR[:, 1] - 249.955) / 55.7899
-    elif componente == "CH":
-        # Transformação para Ciências Humanas (valores hipotéticos, ajustar conforme necessário)
-        PAR[:, 0] = PAR[:, 0] * 55.093  # Exemplo, ajustar conforme a escala de CH
-        PAR[:, 1] = (PAR[:, 1] - 249.985) / 55.093  # Exemplo, ajustar conforme a escala de CH
-    else:
-        raise ValueError(f"Componente desconhecido: {componente}")
-
-    return PAR
+    Transforma os parâmetros dos itens (parA e parB) da escala SAEB para a escala theta,
+    com a inclinação e o intercepto do perfil do componente (services.perfis_pontuacao).
+    """
+    return perfis_pontuacao.atual.transformar(PAR, componente)
 
-def EAP(U, PAR, administrado):
-    print("\n=== Iniciando EAP ===")
+# Quadratura padrão do EAP: 61 pontos igualmente espaçados em [-6, 6]
+Q_PONTOS = 61
+LIMITE_QUADRATURA = 6.0
 
-    U = np.array(U).reshape(1, -1)
-    naoNA = np.where(~np.isnan(U))[1]
-    It = len(naoNA)
 
-    q = 61
-    Xr = np.linspace(-6, 6, q).reshape(-1, 1)
-    AXr = 1 / np.sqrt(2 * np.pi) * np.exp(-(Xr**2) / 2) * 8 / (q - 1)
+@lru_cache(maxsize=None)
+def quadratura(q=Q_PONTOS, limite=LIMITE_QUADRATURA):
+    """
+    Retorna os nós da quadratura e o log da priori normal padrão em cada nó.
+    A constante de normalização da priori é omitida, pois se cancela na posteriori.
+    Os vetores são compartilhados entre chamadas e, por isso, somente leitura.
+    """
+    Xr = np.linspace(-limite, limite, q)
+    log_priori = -(Xr ** 2) / 2
+    Xr.flags.writeable = False
+    log_priori.flags.writeable = False
+    return Xr, log_priori
+
 
+def probabilidades_grade(PAR, Xr):
+    """
+    Probabilidade de acerto (3PL) de cada item em cada nó da quadratura.
+    Retorna uma matriz (q x n_itens).
+    """
     a, b, c = PAR[:, 0], PAR[:, 1], PAR[:, 2]
-    ak = np.ones((q, 1)) @ a.reshape(1, -1)
-    bk = np.ones((q, 1)) @ b.reshape(1, -1)
-    ck = np.ones((q, 1)) @ c.reshape(1, -1)
+    # exp pode estourar para inf nos extremos da grade; o resultado (P = c) é o correto
+    with np.errstate(over="ignore"):
+        return c + (1 - c) / (1 + np.exp(-a * (Xr.reshape(-1, 1) - b)))
 
-    Xrk = np.tile(Xr, (1, len(a)))
-    P = ck + (1 - ck) / (1 + np.exp(-ak * (Xrk - bk)))
 
-    
+def log_verossimilhanca(U, P):
+    """
+    Log-verossimilhança do padrão de respostas U em todos os nós de uma vez.
+    Respostas ausentes (NaN) não contribuem. Retorna um vetor (q,).
+    """
+    U = np.asarray(U, dtype=float).reshape(-1)
+    respondido = ~np.isnan(U)
+    acertos = np.where(respondido, U, 0.0)
+    erros = respondido - acertos
+
+    # Evita log(0) quando c = 0 e a probabilidade satura
+    P = np.clip(P, np.finfo(float).tiny, 1 - np.finfo(float).eps)
+    return np.log(P) @ acertos + np.log1p(-P) @ erros
+
+
+def estimar_posteriori(log_posteriori, Xr):
+    """
+    Média (theta) e desvio padrão (EP) da posteriori dada em escala log.
+    A normalização é feita em escala log para evitar underflow em testes longos.
+    """
+    pesos = np.exp(log_posteriori - np.max(log_posteriori))
+    total = np.sum(pesos)
+    theta_est = np.sum(Xr * pesos) / total
+    ep_est = np.sqrt(np.sum((Xr - theta_est) ** 2 * pesos) / total)
+    return float(theta_est), float(ep_est)
+
+
+def estimar_posteriori_lote(log_posteriori, Xr):
+    """Versão de estimar_posteriori para uma matriz (N x q) de log-posterioris."""
+    pesos = np.exp(log_posteriori - np.max(log_posteriori, axis=1, keepdims=True))
+    total = np.sum(pesos, axis=1)
+    theta_est = pesos @ Xr / total
+    ep_est = np.sqrt(np.sum((Xr - theta_est[:, None]) ** 2 * pesos, axis=1) / total)
+    return theta_est, ep_est
+
+
+def EAP_grade(U, P_adm):
+    """
+    EAP a partir das probabilidades dos itens administrados já calculadas
+    nos nós da quadratura padrão (matriz q x n_administrados).
+    """
+    Xr, log_priori = quadratura()
+    log_posteriori = log_verossimilhanca(U, P_adm) + log_priori
+    return estimar_posteriori(log_posteriori, Xr)
+
 
-    Pjt = np.zeros((q, 1))
-    theta_est = np.zeros(1)
-    for j in range(1):
-        for l in range(q):
-            veroj = 1
-            for i in range(It):
-                if not np.isnan(U[j, i]):
-                    veroj *= P[l, i] ** U[j, i] * (1 - P[l, i]) ** (1 - U[j, i])
-            Pjt[l] = veroj
-        Pj = Pjt * AXr
-        tPj = Xr * Pj
-        theta_est[j] = np.sum(tPj) / np.sum(Pj)
+def log_posteriori_lote(U, P):
+    """
+    Log-posteriori (N x q) de vários estudantes sobre o mesmo banco.
+    U é uma matriz (N x n_itens) com 0/1 nos itens respondidos e NaN nos demais;
+    P é a grade de probabilidades do banco (q x n_itens).
+    """
+    U = np.asarray(U, dtype=float)
+    respondido = ~np.isnan(U)
+    acertos = np.where(respondido, U, 0.0)
+    erros = respondido - acertos
 
-    squad = (Xr - theta_est) ** 2
-    ep_est = np.sqrt(np.sum(squad * Pj) / np.sum(Pj))
+    P = np.clip(P, np.finfo(float).tiny, 1 - np.finfo(float).eps)
+    _, log_priori = quadratura()
+    return acertos @ np.log(P).T + erros @ np.log1p(-P).T + log_priori
+
+
+def EAP_lote(U, P):
+    """
+    EAP de vários estudantes de uma vez sobre o mesmo banco (ver log_posteriori_lote).
+    Retorna os vetores theta (N,) e EP (N,).
+    """
+    Xr, _ = quadratura()
+    return estimar_posteriori_lote(log_posteriori_lote(U, P), Xr)
 
 
-    return float(theta_est[0]), float(ep_est)
+def EAP(U, PAR, administrado):
+    Xr, _ = quadratura()
+    return EAP_grade(U, probabilidades_grade(PAR, Xr))
 
 def parar_teste(theta, theta_erro, pontos_corte, valor_critico=1):
     theta_range = [theta - valor_critico * theta_erro, theta + valor_critico * theta_erro]
     ff = np.digitize(theta_range, pontos_corte)
     return 1 if len(np.unique(ff)) == 1 else 0
 
-def criterio_parada(theta_est, theta_ep, parada="EP", EP=0.5, n_resp=0, n_min=8, validEixo=True, Area="LP", AnoEscolar=8, n_Ij=45):
-    print("\n=== Iniciando criterio_parada ===")
-
-    niveis = {
-        "LP": {
-            2: [-2.722396675, -2.268618518, -1.361062204],
-            3: [-2.268618518, -1.361062204, -0.45350589],
-            4: [-2.087107255, -1.179550941, -0.271994627],
-            5: [-1.814840361, -0.907284047, 0.000272267],
-            6: [-1.542573467, -0.635017153, 0.272539161],
-            7: [-1.361062204, -0.45350589, 0.454050424],
-            8: [-1.179550941, 0.000272267, 0.907828581],
-            9: [-0.89393831, 0.447935304, 1.342517713],
-        },
-        "MT": {
-            2: [-2.239742, -1.343523, -0.895413],
-            3: [-1.791633, -0.895413, 0.0008],
-            4: [-1.522767, -0.7161691, 0.2696725],
-            5: [-1.343523, -0.4473032, 0.4489164],
-            6: [-1.074657, -0.1784373, 0.7177823],
-            7: [-0.895413, 0.0008, 0.8970262],
-            8: [-0.7161691, 0.4489164, 1.345136],
-            9: [-0.4473032, 0.8970262, 1.793246],
-        },
-    }
-    pontos_corte = niveis.get(Area, {}).get(AnoEscolar, [])
+def parar_teste_lote(theta, theta_erro, pontos_corte, valor_critico=1):
+    """
+    Versão vetorizada de parar_teste: pontos_corte tem uma linha por estudante.
+    """
+    theta = np.asarray(theta, dtype=float)
+    theta_erro = np.asarray(theta_erro, dtype=float)
+    pontos_corte = np.asarray(pontos_corte, dtype=float).reshape(len(theta), -1)
+    inferior = np.sum(pontos_corte <= (theta - valor_critico * theta_erro)[:, None], axis=1)
+    superior = np.sum(pontos_corte <= (theta + valor_critico * theta_erro)[:, None], axis=1)
+    return inferior == superior
+
+# Motivos do critério de parada
+PARADA_EP = "ep"
+PARADA_INTERVALO = "intervalo"
+PARADA_MAXIMO = "maximo"
+
+def motivo_parada(theta_est, theta_ep, parada="EP", EP=None, n_resp=0, n_min=None, validEixo=True, Area="LP", AnoEscolar=8, n_Ij=45):
+    """
+    Motivo pelo qual o teste deve parar (PARADA_EP, PARADA_INTERVALO ou PARADA_MAXIMO),
+    ou None se o teste deve continuar. Pontos de corte, limiar do EP e números mínimo e
+    máximo de itens vêm do perfil do componente e ano (EP e n_min podem ser informados).
+    """
+    perfil = perfis_pontuacao.atual.perfil(Area, AnoEscolar)
+    EP = perfil.ep if EP is None else EP
+    n_min = perfil.n_min if n_min is None else n_min
     valor_critico = 1
 
-    Parada = False
     if n_resp >= n_min:
-        if parada == "EP" and theta_ep <= EP and validEixo and n_resp >= 16:
-            Parada = True
-            print("Critério de parada: EP atingido")
-        elif parar_teste(theta_est, theta_ep, pontos_corte, valor_critico) == 1 and validEixo:
-            Parada = True
-            print("Critério de parada: Intervalo de proficiência atingido")
-        elif n_resp == 32 or n_resp == n_Ij - 2:
-            Parada = True
-            print("Critério de parada: Número máximo de itens atingido")
-
-    return Parada
+        if parada == "EP" and theta_ep <= EP and validEixo and n_resp >= perfil.n_min_ep:
+            return PARADA_EP
+        elif parar_teste(theta_est, theta_ep, perfil.pontos_corte, valor_critico) == 1 and validEixo:
+            return PARADA_INTERVALO
+        elif n_resp == perfil.n_max or n_resp == n_Ij - 2:
+            return PARADA_MAXIMO
+    return None
+
+def criterio_parada(theta_est, theta_ep, parada="EP", EP=None, n_resp=0, n_min=None, validEixo=True, Area="LP", AnoEscolar=8, n_Ij=45):
+    return motivo_parada(
+        theta_est, theta_ep, parada=parada, EP=EP, n_resp=n_resp, n_min=n_min,
+        validEixo=validEixo, Area=Area, AnoEscolar=AnoEscolar, n_Ij=n_Ij
+    ) is not None
+
+def motivo_parada_lote(theta_est, theta_ep, n_resp, validEixo, AnoEscolar, n_Ij, parada="EP", EP=None, n_min=None, Area="LP"):
+    """
+    Versão vetorizada de motivo_parada para vários estudantes do mesmo componente.
+    theta_est, theta_ep, n_resp, validEixo, AnoEscolar e n_Ij são vetores (ou escalares).
+    Os parâmetros de cada estudante são lidos dos vetores do perfil pela linha do seu
+    ano escolar. Retorna um vetor de motivos, com "" para quem deve continuar.
+    """
+    theta_est = np.asarray(theta_est, dtype=float)
+    N = len(theta_est)
+    theta_ep = np.broadcast_to(np.asarray(theta_ep, dtype=float), N)
+    n_resp = np.broadcast_to(np.asarray(n_resp), N)
+    validEixo = np.broadcast_to(np.asarray(validEixo, dtype=bool), N)
+    n_Ij = np.broadcast_to(np.asarray(n_Ij), N)
+
+    perfil = perfis_pontuacao.atual.componente(Area)
+    linhas = perfil.linhas(np.broadcast_to(np.asarray(AnoEscolar), N))
+    EP = perfil.ep[linhas] if EP is None else EP
+    n_min = perfil.n_min[linhas] if n_min is None else n_min
+
+    # Pontos de corte ausentes (NaN) não contam; sem nenhum, o intervalo nunca cruza
+    # um nível (mesmo comportamento de parar_teste)
+    intervalo = parar_teste_lote(theta_est, theta_ep, perfil.pontos_corte[linhas])
+
+    por_ep = (parada == "EP") & (theta_ep <= EP) & validEixo & (n_resp >= perfil.n_min_ep[linhas])
+    por_intervalo = intervalo & validEixo
+    por_maximo = (n_resp == perfil.n_max[linhas]) | (n_resp == n_Ij - 2)
+    minimo = n_resp >= n_min
+    # Mesma precedência de motivo_parada
+    return np.select(
+        [minimo & por_ep, minimo & por_intervalo, minimo & por_maximo],
+        [PARADA_EP, PARADA_INTERVALO, PARADA_MAXIMO],
+        default=""
+    )
+
+def criterio_parada_lote(theta_est, theta_ep, n_resp, validEixo, AnoEscolar, n_Ij, parada="EP", EP=None, n_min=None, Area="LP"):
+    """Versão vetorizada de criterio_parada. Retorna um vetor booleano."""
+    return motivo_parada_lote(
+        theta_est, theta_ep, n_resp, validEixo, AnoEscolar, n_Ij,
+        parada=parada, EP=EP, n_min=n_min, Area=Area
+    ) != ""
+
+def escala_saeb(theta_est, theta_ep, componente):
+    """
+    Converte theta e erro padrão (escalares ou vetores) para a escala SAEB do componente.
+    """
+    return perfis_pontuacao.atual.escala_saeb(theta_est, theta_ep, componente)
+
+def theta_da_escala_saeb(valor_saeb, componente):
+    """
+    Inverso de escala_saeb para a proficiência: valor na escala SAEB -> theta.
+    """
+    return perfis_pontuacao.atual.theta_da_escala(valor_saeb, componente)
+
+def theta_proficiencia_inicial(profic_inic):
+    """Ponto de partida do teste (profic.inic, escala SAEB) em theta; aceita vetores."""
+    return perfis_pontuacao.atual.theta_inicial(profic_inic)
 
 def maxima_informacao_th(theta_est, PAR, D=1):
     """
     Calcula a informação de Fisher para um dado valor de proficiência (theta_est).
     """
-    a, b, c = PAR[:, 0], PAR[:, 1], PAR[:, 2]
+    a, b, c = PAR[..., 0], PAR[..., 1], PAR[..., 2]
 
     # Calcula a probabilidade de resposta correta (P)
     P = c + (1 - c) / (1 + np.exp(-D * a * (theta_est - b)))
@@ -127,8 +234,6 @@ def maxima_informacao_th(theta_est, PAR, D=1):
     return max_info
 
 def proximo_item_criterio(INFO, administrado):
-    print("\n=== Iniciando proximo_item_criterio ===")
-
     # Zerar a informação dos itens já administrados
     INFO[administrado] = 0
     
@@ -138,17 +243,19 @@ def proximo_item_criterio(INFO, administrado):
 
 # NOVO: calcular validEixo com base nos eixos aplicados - Corrige parada na 8 questão
 def verificar_valid_eixo(administrado_idx: list[int], id_eixo: list[int]) -> bool:
-    from collections import Counter
-
-    # Mapeia os eixos aplicados
-    eixos_aplicados = [id_eixo[i] for i in administrado_idx]
-    contagem = Counter(eixos_aplicados)
-
-    eixos_distintos = len(set(id_eixo))
+    # A regra depende só do número de itens aplicados e de eixos do banco; com um
+    # BancoItens, prefira valid_eixo_contagem(n, banco.eixos_distintos), sem recontar o banco
+    return valid_eixo_contagem(len(administrado_idx), len(np.unique(id_eixo)))
 
+def minimo_itens_eixo(eixos_distintos: int) -> int:
+    """Número de itens aplicados a partir do qual validEixo é verdadeiro."""
     if eixos_distintos >= 2:
         if eixos_distintos < 4:
-            return sum(contagem.values()) >= eixos_distintos * 3
+            return eixos_distintos * 3
         else:
-            return sum(contagem.values()) >= eixos_distintos * 2
-    return True
+            return eixos_distintos * 2
+    return 0
+
+def valid_eixo_contagem(n_aplicados, eixos_distintos: int):
+    """Regra do validEixo a partir de contadores já mantidos (número de itens aplicados e de eixos do banco)."""
+    return n_aplicados >= minimo_itens_eixo(eixos_distintos)
@@ -0,0 +1,173 @@
+"""
+Bancos preparados gravados em disco como arquivos .npy, para implantações com vários
+workers. Cada worker mapeia os arquivos em memória (somente leitura): as páginas são
+compartilhadas pelo cache do sistema operacional, então a memória do nó não cresce com
+o número de workers e um worker novo fica pronto sem reprocessar os bancos. Uso:
+
+    python -m services.armazenamento --banco banco.csv --componente LP --id-banco LP-8-2025 \\
+        --saida bancos/
+
+Estrutura de um banco gravado (um diretório por banco):
+
+    <idBanco>/meta.json          id, componente, idItem, versão do banco e do formato, impressão
+    <idBanco>/PAR.npy            parâmetros transformados (n_itens x 3)
+    <idBanco>/id_eixo.npy
+    <idBanco>/id_habilidade.npy
+    <idBanco>/P_grade.npy        grade de probabilidades (q x n_itens)
+    <idBanco>/informacao.npy     tabela de informação de Fisher
+    <idBanco>/informacao_grade.npy  informação de Fisher nos nós da quadratura (q x n_itens)
+    <idBanco>/eixo_ordem.npy     itens agrupados por eixo (partição; eixos e inícios no meta.json)
+
+Os arquivos dos formatos anteriores (sem formato no meta.json) continuam sendo lidos;
+o que faltar neles é calculado sob demanda. Para gerar bancos validados a partir de
+planilhas exportadas, ver services.ingestao.
+"""
+import argparse
+import json
+import os
+import shutil
+import uuid
+from urllib.parse import quote
+
+import numpy as np
+
+from services.adaptive_testing import Q_PONTOS
+from services.banco import BancoItens
+from services.informacao import TabelaInformacao, PASSO_INFORMACAO
+
+# Versão do formato gravado em meta.json
+FORMATO = 2
+
+
+def caminho_banco(diretorio, id_banco):
+    """Diretório do banco; o idBanco é escapado para ser um nome de arquivo válido."""
+    return os.path.join(diretorio, quote(id_banco, safe=""))
+
+
+def salvar_banco(banco, diretorio):
+    """
+    Grava o banco preparado. A gravação é feita em um diretório temporário e trocada
+    de uma vez, para que nenhum worker leia um banco pela metade.
+    """
+    banco.preparar()
+    destino = caminho_banco(diretorio, banco.id)
+    temporario = f"{destino}.tmp-{uuid.uuid4().hex}"
+    os.makedirs(temporario)
+    tabela = banco.tabela_informacao
+
+    np.save(os.path.join(temporario, "PAR.npy"), np.ascontiguousarray(banco.PAR, dtype=np.float64))
+    np.save(os.path.join(temporario, "id_eixo.npy"), np.asarray(banco.id_eixo, dtype=np.int64))
+    np.save(os.path.join(temporario, "id_habilidade.npy"), np.asarray(banco.id_habilidade, dtype=np.int64))
+    np.save(os.path.join(temporario, "P_grade.npy"), np.ascontiguousarray(banco.P_grade))
+    np.save(os.path.join(temporario, "informacao.npy"), np.ascontiguousarray(tabela.tabela))
+    np.save(os.path.join(temporario, "informacao_grade.npy"), np.ascontiguousarray(banco.informacao_grade))
+    eixos, ordem, inicios = banco.particao_eixos
+    np.save(os.path.join(temporario, "eixo_ordem.npy"), np.asarray(ordem, dtype=np.int64))
+    meta = {
+        "formato": FORMATO,
+        "idBanco": banco.id,
+        "componente": banco.componente,
+        "idItem": banco.id_item,
+        "versao": banco.versao,
+        "impressao": banco.impressao,
+        "escala": None if banco.escala is None else list(banco.escala),
+        "qPontos": int(banco.P_grade.shape[0]),
+        "passoInformacao": tabela.passo,
+        "limiteInformacao": tabela.limite,
+        "eixos": [int(e) for e in eixos],
+        "eixoInicios": [int(i) for i in inicios],
+    }
+    with open(os.path.join(temporario, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+
+    # Arquivos já mapeados por outros workers continuam válidos após a troca
+    if os.path.exists(destino):
+        antigo = f"{destino}.old-{uuid.uuid4().hex}"
+        os.replace(destino, antigo)
+        os.replace(temporario, destino)
+        shutil.rmtree(antigo, ignore_errors=True)
+    else:
+        os.replace(temporario, destino)
+    return destino
+
+
+def carregar_banco(caminho, mmap=True):
+    """
+    Banco gravado por salvar_banco. Com mmap=True, os vetores são mapeados somente
+    leitura em vez de copiados. A grade e a tabela de informação só são reaproveitadas
+    se foram geradas com a mesma quadratura e o mesmo passo deste processo.
+    """
+    modo = "r" if mmap else None
+    with open(os.path.join(caminho, "meta.json"), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("formato", 1) > FORMATO:
+        raise ValueError(f"Banco {caminho} gravado no formato {meta['formato']}, mais novo que o suportado ({FORMATO})")
+
+    def vetor(nome):
+        return np.load(os.path.join(caminho, nome), mmap_mode=modo)
+
+    banco = BancoItens(
+        id=meta["idBanco"],
+        componente=meta["componente"],
+        id_item=meta["idItem"],
+        PAR=vetor("PAR.npy"),
+        id_eixo=vetor("id_eixo.npy"),
+        id_habilidade=vetor("id_habilidade.npy"),
+        versao=meta["versao"],
+        escala=None if meta.get("escala") is None else tuple(meta["escala"]),
+    )
+    # Estruturas derivadas já calculadas entram direto no cache do banco
+    banco.__dict__["impressao"] = meta["impressao"]
+    if meta["qPontos"] == Q_PONTOS:
+        banco.__dict__["P_grade"] = vetor("P_grade.npy")
+        if meta.get("formato", 1) >= 2:
+            banco.__dict__["informacao_grade"] = vetor("informacao_grade.npy")
+    if meta.get("formato", 1) >= 2:
+        banco.__dict__["particao_eixos"] = (
+            np.array(meta["eixos"], dtype=np.int64), vetor("eixo_ordem.npy"), np.array(meta["eixoInicios"])
+        )
+    if meta["passoInformacao"] == PASSO_INFORMACAO:
+        banco.__dict__["tabela_informacao"] = TabelaInformacao.de_tabela(
+            vetor("informacao.npy"), meta["passoInformacao"], meta["limiteInformacao"]
+        )
+    return banco
+
+
+def carregar_id(diretorio, id_banco, mmap=True):
+    """Banco gravado com o idBanco informado, ou None se não existir no diretório."""
+    caminho = caminho_banco(diretorio, id_banco)
+    if not os.path.isfile(os.path.join(caminho, "meta.json")):
+        return None
+    return carregar_banco(caminho, mmap)
+
+
+def carregar_diretorio(registro, diretorio, mmap=True):
+    """Registra todos os bancos gravados no diretório; retorna quantos foram carregados."""
+    n = 0
+    for nome in sorted(os.listdir(diretorio)):
+        caminho = os.path.join(diretorio, nome)
+        if ".tmp-" in nome or ".old-" in nome or not os.path.isfile(os.path.join(caminho, "meta.json")):
+            continue
+        registro.registrar(carregar_banco(caminho, mmap))
+        n += 1
+    return n
+
+
+def main(argv=None):
+    from services.banco import banco_de_csv
+
+    parser = argparse.ArgumentParser(description="Grava um banco preparado para ser mapeado pelos workers")
+    parser.add_argument("--banco", required=True, help="CSV do banco (idItem, parA, parB, parC, idEixo, idHabilidade)")
+    parser.add_argument("--componente", required=True)
+    parser.add_argument("--id-banco", help="idBanco usado no /proximo (padrão: hash do conteúdo)")
+    parser.add_argument("--saida", required=True, help="diretório dos bancos (TAI_DIR_BANCOS)")
+    args = parser.parse_args(argv)
+
+    banco = banco_de_csv(args.banco, args.componente, id_banco=args.id_banco)
+    os.makedirs(args.saida, exist_ok=True)
+    caminho = salvar_banco(banco, args.saida)
+    print(f"Banco {banco.id} com {banco.n_itens} itens gravado em {caminho}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Árvore de decisão pré-calculada para as primeiras etapas do teste adaptativo.
+
+Como a seleção é determinística dado o padrão de respostas, as primeiras etapas de
+um teste formam uma árvore binária por banco, ano escolar, proficiência inicial e
+n.Ij. Os nós ficam em ordem de heap: a raiz (nenhuma resposta) é o nó 0 e os filhos
+do nó k são 2k+1 (erro) e 2k+2 (acerto). Uso:
+
+    python -m services.arvore --banco banco.csv --componente LP --ano-escolar 8 \\
+        --profic-inic 500 --profundidade 8 --saida arvores/
+"""
+import argparse
+import json
+import os
+import threading
+
+import numpy as np
+
+from services.adaptive_testing import (
+    EAP_grade, motivo_parada, escala_saeb, valid_eixo_contagem, theta_proficiencia_inicial, maxima_informacao_th
+)
+from services.decisao import selecionar_item, resposta_item, resposta_final
+from services.informacao import BALANCEAR_EIXOS
+from services.perfis_pontuacao import perfis_pontuacao
+
+
+class ArvoreDecisao:
+    """Decisões pré-calculadas em vetores planos indexados pelo nó."""
+
+    def __init__(self, meta, item, theta, ep, parada):
+        self.meta = meta
+        self.item = item
+        self.theta = theta
+        self.ep = ep
+        self.parada = parada
+
+    @property
+    def chave(self):
+        m = self.meta
+        return chave_arvore(m["idBanco"], m["anoEscolar"], m["proficInic"], m["nIj"])
+
+    @property
+    def profundidade(self):
+        return self.meta["profundidade"]
+
+    def no(self, administrado_idx, acertos):
+        """
+        Nó correspondente ao caminho (itens aplicados e respostas), ou None se o caminho
+        sai da árvore (item diferente do previsto ou mais respostas que a profundidade).
+        """
+        if len(acertos) > self.profundidade:
+            return None
+        no = 0
+        for idx, acerto in zip(administrado_idx, acertos):
+            if self.item[no] != idx:
+                return None
+            no = 2 * no + 1 + int(acerto)
+        return no
+
+    def resposta(self, banco, no, n_resp):
+        """Resposta do /proximo no formato usual para o nó."""
+        if n_resp == 0:
+            return resposta_item(banco, int(self.item[0]), 1, str(round(self.meta["proficInic"], 13)), "NA")
+        theta_saeb, erro_saeb = escala_saeb(float(self.theta[no]), float(self.ep[no]), banco.componente)
+        if self.parada[no]:
+            return resposta_final(theta_saeb, erro_saeb)
+        return resposta_item(
+            banco, int(self.item[no]), n_resp + 1,
+            str(round(theta_saeb, 12)),
+            str(round(erro_saeb, 13))
+        )
+
+    def detalhes(self, banco, no, n_resp):
+        """
+        Valores da auditoria no nó, como o cálculo os registraria: theta e EP do nó,
+        motivo da parada e informação (3PL exata) do item selecionado.
+        """
+        if n_resp == 0:
+            theta, ep, motivo = float(theta_proficiencia_inicial(self.meta["proficInic"])), None, None
+        else:
+            theta, ep, motivo = float(self.theta[no]), float(self.ep[no]), None
+            if self.parada[no]:
+                motivo = motivo_parada(
+                    theta, ep, Area=banco.componente, AnoEscolar=self.meta["anoEscolar"], n_resp=n_resp,
+                    n_Ij=self.meta["nIj"], validEixo=valid_eixo_contagem(n_resp, banco.eixos_distintos)
+                )
+                return {"theta": theta, "ep": ep, "motivo": motivo}
+        informacao = float(maxima_informacao_th(theta, banco.PAR[int(self.item[no])]))
+        return {"theta": theta, "ep": ep, "motivo": motivo, "informacao": informacao}
+
+    def salvar(self, caminho):
+        np.savez(
+            caminho, item=self.item, theta=self.theta, ep=self.ep, parada=self.parada,
+            meta=np.array(json.dumps(self.meta))
+        )
+
+    @classmethod
+    def carregar(cls, caminho):
+        with np.load(caminho) as dados:
+            return cls(
+                json.loads(str(dados["meta"])), dados["item"], dados["theta"], dados["ep"], dados["parada"]
+            )
+
+
+def chave_arvore(id_banco, ano_escolar, profic_inic, n_Ij):
+    return (id_banco, int(ano_escolar), float(profic_inic), int(n_Ij))
+
+
+def construir_arvore(banco, ano_escolar, profic_inic, n_Ij=45, profundidade=8):
+    """
+    Percorre todos os padrões de resposta até a profundidade informada, aplicando
+    em cada nó o mesmo EAP, critério de parada e seleção do /proximo.
+    """
+    banco.preparar()
+    n_nos = 2 ** (profundidade + 1) - 1
+    item = np.full(n_nos, -1, dtype=np.int32)
+    theta = np.full(n_nos, np.nan)
+    ep = np.full(n_nos, np.nan)
+    parada = np.zeros(n_nos, dtype=bool)
+
+    theta_inic = theta_proficiencia_inicial(profic_inic)
+    item[0] = selecionar_item(banco, theta_inic, [])
+
+    # Cada entrada: (nó, itens aplicados até o nó, respostas até o nó)
+    pendentes = [(0, [], [])]
+    while pendentes:
+        no, administrado_idx, acertos = pendentes.pop()
+        if parada[no] or len(acertos) == profundidade:
+            continue
+        caminho = administrado_idx + [int(item[no])]
+        for acerto in (0, 1):
+            filho = 2 * no + 1 + acerto
+            respostas = acertos + [acerto]
+            theta[filho], ep[filho] = EAP_grade(np.array(respostas), banco.grade(caminho))
+            validEixo = valid_eixo_contagem(len(caminho), banco.eixos_distintos)
+            motivo = motivo_parada(
+                theta[filho], ep[filho], Area=banco.componente, AnoEscolar=ano_escolar,
+                n_resp=len(respostas), n_Ij=n_Ij, validEixo=validEixo
+            )
+            if motivo is not None or len(caminho) >= banco.n_itens:
+                parada[filho] = True
+            else:
+                item[filho] = selecionar_item(banco, theta[filho], caminho)
+            pendentes.append((filho, caminho, respostas))
+
+    meta = {
+        "idBanco": banco.id,
+        "impressao": banco.impressao,
+        "perfis": perfis_pontuacao.atual.impressao,
+        "balancearEixos": BALANCEAR_EIXOS,
+        "componente": banco.componente,
+        "anoEscolar": int(ano_escolar),
+        "proficInic": float(profic_inic),
+        "nIj": int(n_Ij),
+        "profundidade": int(profundidade),
+    }
+    return ArvoreDecisao(meta, item, theta, ep, parada)
+
+
+class RegistroArvores:
+    """Árvores carregadas, por (idBanco, ano escolar, proficiência inicial, n.Ij)."""
+
+    def __init__(self):
+        self._arvores = {}
+        self._lock = threading.Lock()
+
+    def adicionar(self, arvore):
+        with self._lock:
+            self._arvores[arvore.chave] = arvore
+        return arvore
+
+    def remover_banco(self, id_banco):
+        with self._lock:
+            for chave in [c for c in self._arvores if c[0] == id_banco]:
+                del self._arvores[chave]
+
+    def carregar_diretorio(self, diretorio):
+        """Carrega todos os .npz do diretório; retorna quantas árvores foram carregadas."""
+        n = 0
+        for nome in sorted(os.listdir(diretorio)):
+            if nome.endswith(".npz"):
+                self.adicionar(ArvoreDecisao.carregar(os.path.join(diretorio, nome)))
+                n += 1
+        return n
+
+    def responder(self, banco, ano_escolar, profic_inic, n_Ij, administrado_idx, acertos, detalhes=None):
+        """
+        Resposta pré-calculada para o caminho, ou None se não houver árvore que o cubra
+        ou se ela foi gerada com outro banco, outros perfis de pontuação ou outra
+        configuração do balanceamento de eixos (árvores anteriores aos perfis não trazem
+        a impressão deles e continuam válidas). Também devolve None quando o item previsto
+        pela árvore já está entre os administrados, para que a seleção usual escolha outro.
+        Se detalhes for um dicionário, recebe os valores da auditoria lidos do nó.
+        """
+        arvore = self._arvores.get(chave_arvore(banco.id, ano_escolar, profic_inic, n_Ij))
+        if arvore is None or arvore.meta["impressao"] != banco.impressao:
+            return None
+        impressao_perfis = perfis_pontuacao.atual.impressao
+        if arvore.meta.get("perfis", impressao_perfis) != impressao_perfis:
+            return None
+        if arvore.meta.get("balancearEixos", False) != BALANCEAR_EIXOS:
+            return None
+        no = arvore.no(administrado_idx, acertos)
+        if no is None:
+            return None
+        if not (len(acertos) and arvore.parada[no]) and int(arvore.item[no]) in set(map(int, administrado_idx)):
+            return None
+        if detalhes is not None:
+            detalhes.update(arvore.detalhes(banco, no, len(acertos)))
+        return arvore.resposta(banco, no, len(acertos))
+
+    def __len__(self):
+        return len(self._arvores)
+
+
+registro_arvores = RegistroArvores()
+
+
+def nome_arquivo(arvore):
+    m = arvore.meta
+    return f"{m['idBanco']}_ano{m['anoEscolar']}_p{m['proficInic']:g}_n{m['nIj']}.npz"
+
+
+def main(argv=None):
+    from services.banco import banco_de_csv
+
+    parser = argparse.ArgumentParser(description="Gera a árvore de decisão das primeiras etapas do teste")
+    parser.add_argument("--banco", required=True, help="CSV do banco (idItem, parA, parB, parC, idEixo, idHabilidade)")
+    parser.add_argument("--componente", required=True)
+    parser.add_argument("--id-banco", help="idBanco usado no /proximo (padrão: hash do conteúdo)")
+    parser.add_argument("--ano-escolar", type=int, required=True)
+    parser.add_argument("--profic-inic", type=float, required=True)
+    parser.add_argument("--n-ij", type=int, default=45)
+    parser.add_argument("--profundidade", type=int, default=8)
+    parser.add_argument("--saida", default=".", help="diretório de saída")
+    args = parser.parse_args(argv)
+
+    banco = banco_de_csv(args.banco, args.componente, id_banco=args.id_banco)
+    arvore = construir_arvore(banco, args.ano_escolar, args.profic_inic, args.n_ij, args.profundidade)
+    os.makedirs(args.saida, exist_ok=True)
+    caminho = os.path.join(args.saida, nome_arquivo(arvore))
+    arvore.salvar(caminho)
+    print(f"Árvore com {int(np.sum(arvore.item >= 0))} decisões gravada em {caminho}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Auditoria das decisões do teste adaptativo: cada decisão (entradas, theta/EP, motivo da
+parada, item selecionado e sua informação) vira um registro compacto em uma fila
+limitada. Uma thread em segundo plano grava os registros em lotes em arquivos JSONL
+(ou JSONL comprimido com gzip) com rotação por tamanho.
+
+A requisição nunca espera por disco: se a fila estiver cheia, o registro é descartado
+e contado em tai_auditoria_registros_total{resultado="descartado"}. Com vários
+processos (workers ou pool de processos), cada processo grava os próprios arquivos.
+"""
+import atexit
+import gzip
+import json
+import os
+import queue
+import threading
+import time
+
+from services.metricas import metricas
+
+REGISTROS_AUDITORIA = metricas.contador(
+    "tai_auditoria_registros_total", "Registros de auditoria gravados ou descartados por fila cheia", ("resultado",)
+)
+FILA_AUDITORIA = metricas.gauge(
+    "tai_auditoria_fila", "Registros de auditoria aguardando gravação"
+)
+
+
+class Auditoria:
+    """Fila limitada de registros e thread que os grava em lotes, com rotação de arquivos."""
+
+    def __init__(self, diretorio=None, max_fila=10_000, tamanho_lote=500, intervalo=1.0,
+                 max_bytes=64 * 1024 * 1024, comprimir=False):
+        self.diretorio = diretorio
+        self.tamanho_lote = tamanho_lote
+        self.intervalo = intervalo
+        self.max_bytes = max_bytes
+        self.comprimir = comprimir
+        self._fila = queue.Queue(maxsize=max_fila)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._parar = threading.Event()
+        self._arquivo = None
+        self._bytes = 0
+        self._sequencia = 0
+
+    @property
+    def ativo(self):
+        return bool(self.diretorio)
+
+    def registrar(self, registro):
+        """Enfileira o registro sem bloquear; descarta se a fila estiver cheia."""
+        if not self.ativo:
+            return False
+        self._garantir_thread()
+        try:
+            self._fila.put_nowait(registro)
+        except queue.Full:
+            REGISTROS_AUDITORIA.inc(resultado="descartado")
+            return False
+        return True
+
+    def _garantir_thread(self):
+        # A thread é criada no primeiro registro de cada processo (inclusive após fork)
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid != os.getpid():
+                if self._pid is not None:
+                    # Processo filho: a fila e o arquivo herdados pertencem ao pai
+                    self._fila = queue.Queue(maxsize=self._fila.maxsize)
+                    self._arquivo = None
+                atexit.register(self.encerrar)
+            self._pid = os.getpid()
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._executar, name="tai-auditoria", daemon=True)
+            self._thread.start()
+
+    def _executar(self):
+        while not self._parar.is_set() or not self._fila.empty():
+            lote = []
+            try:
+                lote.append(self._fila.get(timeout=self.intervalo))
+                while len(lote) < self.tamanho_lote:
+                    lote.append(self._fila.get_nowait())
+            except queue.Empty:
+                pass
+            FILA_AUDITORIA.set(self._fila.qsize())
+            if lote:
+                self._gravar(lote)
+        self._fechar_arquivo()
+
+    def _gravar(self, lote):
+        texto = "".join(json.dumps(r, ensure_ascii=False, separators=(",", ":")) + "\n" for r in lote)
+        if self._arquivo is None or self._bytes >= self.max_bytes:
+            self._rotacionar()
+        self._arquivo.write(texto)
+        self._arquivo.flush()
+        self._bytes += len(texto)
+        REGISTROS_AUDITORIA.inc(len(lote), resultado="gravado")
+
+    def _rotacionar(self):
+        self._fechar_arquivo()
+        os.makedirs(self.diretorio, exist_ok=True)
+        self._sequencia += 1
+        nome = f"auditoria-{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}-{self._sequencia}.jsonl"
+        caminho = os.path.join(self.diretorio, nome)
+        if self.comprimir:
+            self._arquivo = gzip.open(caminho + ".gz", "wt", encoding="utf-8")
+        else:
+            self._arquivo = open(caminho, "w", encoding="utf-8")
+        self._bytes = 0
+
+    def _fechar_arquivo(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+            self._arquivo = None
+
+    def encerrar(self, timeout=5.0):
+        """Grava os registros pendentes e encerra a thread."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._parar.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+
+def registro_decisao(rota, banco, estudante, ano_escolar, profic_inic, n_Ij, administrado_idx, acertos,
+                     resultado, detalhes=None, origem="calculo"):
+    """
+    Registro compacto de uma decisão. detalhes traz theta (escala theta), EP, motivo
+    da parada e informação do item; nas decisões vindas do cache são os guardados com
+    a resposta e, nas da árvore, os lidos do nó.
+    """
+    detalhes = detalhes or {}
+    return {
+        "ts": round(time.time(), 3),
+        "rota": rota,
+        "estudante": estudante,
+        "idBanco": banco.id,
+        "versao": banco.versao,
+        "componente": banco.componente,
+        "anoEscolar": ano_escolar,
+        "proficInic": profic_inic,
+        "nIj": n_Ij,
+        "administrado": [int(i) for i in administrado_idx],
+        "acertos": "".join(str(int(a)) for a in acertos),
+        "theta": detalhes.get("theta"),
+        "ep": detalhes.get("ep"),
+        "motivo": detalhes.get("motivo"),
+        "item": resultado[0],
+        "informacao": detalhes.get("informacao"),
+        "proficiencia": resultado[6],
+        "erroPadrao": resultado[7],
+        "origem": origem,
+    }
+
+
+auditoria = Auditoria(
+    diretorio=os.getenv("TAI_DIR_AUDITORIA") or None,
+    max_fila=int(os.getenv("TAI_MAX_FILA_AUDITORIA", "10000")),
+    tamanho_lote=int(os.getenv("TAI_LOTE_AUDITORIA", "500")),
+    max_bytes=int(os.getenv("TAI_MAX_BYTES_AUDITORIA", str(64 * 1024 * 1024))),
+    comprimir=os.getenv("TAI_COMPRIMIR_AUDITORIA", "0") == "1",
+)
@@ -0,0 +1,536 @@
+import csv
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import cached_property
+
+import numpy as np
+
+from services.adaptive_testing import transformar_parametros, quadratura, probabilidades_grade, maxima_informacao_th
+from services.perfis_pontuacao import perfis_pontuacao
+from services.informacao import TabelaInformacao, CRITERIO_SELECAO, BALANCEAR_EIXOS
+from services.cache import cache_decisoes
+from services.metricas import ITENS_BANCO, BANCOS_REGISTRADOS
+from utils.helpers import decodificar_vetor, decodificar_textos, normalizar_componente
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+@dataclass(eq=False)
+class BancoItens:
+    """
+    Banco de itens já preparado para o teste adaptativo: parâmetros transformados
+    para a escala do componente, índice idItem -> posição e grade de probabilidades
+    nos nós da quadratura do EAP.
+    """
+    id: str
+    componente: str
+    id_item: list
+    PAR: np.ndarray
+    id_eixo: np.ndarray
+    id_habilidade: np.ndarray
+    versao: int = 0
+    # (inclinação, intercepto) do perfil de pontuação com que PAR foi transformado;
+    # None em bancos gravados antes de a escala ser registrada
+    escala: tuple = None
+    indice: dict = field(init=False, repr=False)
+
+    # Estruturas derivadas que não são serializadas: são recalculadas sob demanda
+    # (ou por preparar()) no processo que recebe o banco
+    _DERIVADOS = (
+        "P_grade", "tabela_informacao", "informacao_grade", "log_P_grade", "particao_eixos", "posicao_eixo",
+        "posicao_particao",
+    )
+
+    def __post_init__(self):
+        self.indice = {item: idx for idx, item in enumerate(self.id_item)}
+
+    def __getstate__(self):
+        estado = self.__dict__.copy()
+        for nome in self._DERIVADOS:
+            estado.pop(nome, None)
+        return estado
+
+    @property
+    def n_itens(self):
+        return len(self.id_item)
+
+    @cached_property
+    def impressao(self):
+        """Hash do conteúdo preparado do banco, para validar artefatos gerados a partir dele."""
+        h = hashlib.sha256()
+        h.update(self.componente.encode())
+        h.update("\x1f".join(self.id_item).encode())
+        h.update(np.ascontiguousarray(self.PAR, dtype=np.float64).tobytes())
+        h.update(np.asarray(self.id_eixo, dtype=np.int64).tobytes())
+        return h.hexdigest()[:32]
+
+    @cached_property
+    def eixos_distintos(self):
+        return len(np.unique(self.id_eixo))
+
+    @cached_property
+    def particao_eixos(self):
+        """
+        Itens agrupados por eixo: (eixos, ordem, inicios), em que
+        ordem[inicios[k]:inicios[k + 1]] são as posições dos itens do eixo eixos[k].
+        """
+        ordem = np.argsort(self.id_eixo, kind="stable")
+        eixos, inicios = np.unique(np.asarray(self.id_eixo)[ordem], return_index=True)
+        return eixos, ordem, np.append(inicios, len(ordem))
+
+    @cached_property
+    def posicao_eixo(self):
+        """Índice (em particao_eixos) do eixo de cada item."""
+        eixos, ordem, inicios = self.particao_eixos
+        posicao = np.empty(len(ordem), dtype=np.intp)
+        posicao[ordem] = np.repeat(np.arange(len(eixos)), np.diff(inicios))
+        return posicao
+
+    @cached_property
+    def posicao_particao(self):
+        """Posição de cada item em particao_eixos[1] (a permutação inversa da ordem por eixo)."""
+        _, ordem, _ = self.particao_eixos
+        posicao = np.empty(len(ordem), dtype=np.intp)
+        posicao[ordem] = np.arange(len(ordem))
+        return posicao
+
+    @cached_property
+    def P_grade(self):
+        """Probabilidade de acerto de cada item em cada nó da quadratura (q x n_itens)."""
+        Xr, _ = quadratura()
+        return probabilidades_grade(self.PAR, Xr)
+
+    @cached_property
+    def tabela_informacao(self):
+        """Informação de Fisher dos itens em uma grade fina de theta."""
+        return TabelaInformacao(self.PAR)
+
+    @cached_property
+    def informacao_grade(self):
+        """Informação de Fisher de cada item em cada nó da quadratura (q x n_itens), para o critério pwi."""
+        Xr, _ = quadratura()
+        with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+            return np.nan_to_num(maxima_informacao_th(Xr[:, None], self.PAR))
+
+    @cached_property
+    def log_P_grade(self):
+        """log P e log(1 - P) de cada item em cada nó (2 x q x n_itens), para o critério kl."""
+        P = np.clip(self.P_grade, np.finfo(float).tiny, 1 - np.finfo(float).eps)
+        return np.stack((np.log(P), np.log1p(-P)))
+
+    def informacao(self, theta, itens=None):
+        """
+        Informação de Fisher de todos os itens (ou só das posições em itens) em theta
+        (escalar ou vetor). Usa a tabela pré-calculada quando o banco foi preparado;
+        senão, calcula a 3PL.
+        """
+        if "tabela_informacao" in self.__dict__:
+            return self.tabela_informacao.informacao(theta, itens)
+        theta = np.asarray(theta, dtype=float)
+        PAR = self.PAR if itens is None else self.PAR[itens]
+        return maxima_informacao_th(theta[..., None] if theta.ndim else theta, PAR)
+
+    def grade(self, indices):
+        """
+        Colunas da grade de probabilidades para os itens informados. Enquanto a
+        grade completa não tiver sido calculada, calcula apenas as colunas pedidas.
+        """
+        if "P_grade" in self.__dict__:
+            return self.P_grade[:, indices]
+        Xr, _ = quadratura()
+        return probabilidades_grade(self.PAR[indices, :], Xr)
+
+    def indices(self, itens):
+        """Converte idItem em posições no banco, na ordem recebida."""
+        try:
+            return [self.indice[item] for item in itens]
+        except KeyError as e:
+            raise ValueError(f"Item administrado não encontrado no banco: {e.args[0]}")
+
+    def preparar(self):
+        """Calcula antecipadamente as estruturas derivadas (as do critério de seleção configurado)."""
+        self.P_grade
+        self.eixos_distintos
+        self.tabela_informacao
+        if CRITERIO_SELECAO == "pwi":
+            self.informacao_grade
+        elif CRITERIO_SELECAO == "kl":
+            self.log_P_grade
+        if BALANCEAR_EIXOS:
+            self.posicao_eixo
+            self.posicao_particao
+        return self
+
+
+def chave_banco(componente, id_item, parA, parB, parC, id_eixo, id_habilidade):
+    """Hash do conteúdo do banco, usado como identificador quando nenhum é informado."""
+    h = hashlib.sha256()
+    h.update(componente.encode())
+    h.update("\x1f".join(id_item).encode())
+    for valores in (parA, parB, parC):
+        h.update(np.asarray(valores, dtype=np.float64).tobytes())
+    for valores in (id_eixo, id_habilidade):
+        h.update(np.asarray(valores, dtype=np.int64).tobytes())
+    return h.hexdigest()[:32]
+
+
+def criar_banco(componente, id_item, parA, parB, parC, id_eixo, id_habilidade, id_banco=None):
+    """Monta um BancoItens a partir dos campos já convertidos do payload."""
+    n = len(id_item)
+    if not (len(parA) == len(parB) == len(parC) == n):
+        raise ValueError("idItem, parA, parB e parC devem ter o mesmo tamanho")
+
+    if id_banco is None:
+        id_banco = chave_banco(componente, id_item, parA, parB, parC, id_eixo, id_habilidade)
+
+    perfis = perfis_pontuacao.atual
+    PAR = np.column_stack((parA, parB, parC)).astype(float)
+    PAR = perfis.transformar(PAR, componente)
+
+    return BancoItens(
+        id=id_banco,
+        componente=componente,
+        id_item=list(id_item),
+        PAR=PAR,
+        id_eixo=np.asarray(id_eixo, dtype=int),
+        id_habilidade=np.asarray(id_habilidade, dtype=int),
+        escala=perfis.escala(componente),
+    )
+
+
+def na_escala_atual(banco):
+    """Se PAR foi transformado com a inclinação e o intercepto dos perfis de pontuação em uso."""
+    return banco.escala is None or banco.escala == perfis_pontuacao.atual.escala(banco.componente)
+
+
+def reescalar_banco(banco):
+    """
+    O banco com PAR na escala dos perfis de pontuação em uso. Depois de uma recarga que
+    muda a inclinação ou o intercepto do componente, um banco preparado com os perfis
+    anteriores misturaria os parâmetros antigos com a escala SAEB nova: PAR volta à
+    escala SAEB, é transformado de novo e as estruturas derivadas são recalculadas
+    (versao + 1). Sem mudança, retorna o próprio banco.
+    """
+    if na_escala_atual(banco):
+        return banco
+    perfis = perfis_pontuacao.atual
+    inclinacao, intercepto = banco.escala
+    PAR = np.array(banco.PAR, dtype=float)
+    PAR[:, 0] = PAR[:, 0] / inclinacao
+    PAR[:, 1] = PAR[:, 1] * inclinacao + intercepto
+    return BancoItens(
+        id=banco.id,
+        componente=banco.componente,
+        id_item=list(banco.id_item),
+        PAR=perfis.transformar(PAR, banco.componente),
+        id_eixo=np.array(banco.id_eixo),
+        id_habilidade=np.array(banco.id_habilidade),
+        versao=banco.versao + 1,
+        escala=perfis.escala(banco.componente),
+    )
+
+
+def banco_do_payload(body, id_banco=None):
+    """
+    Monta o banco a partir dos campos do payload: texto separado por vírgula,
+    listas JSON ou vetores binários em base64 (ver utils.helpers.decodificar_vetor).
+    """
+    return criar_banco(
+        componente=normalizar_componente(body["componente"]),
+        id_item=decodificar_textos(body["idItem"]),
+        parA=decodificar_vetor(body["parA"]),
+        parB=decodificar_vetor(body["parB"]),
+        parC=decodificar_vetor(body["parC"]),
+        id_eixo=decodificar_vetor(body["idEixo"], np.int64),
+        id_habilidade=decodificar_vetor(body["idHabilidade"], np.int64),
+        id_banco=id_banco,
+    )
+
+
+def alterar_banco(banco, remover=(), recalibrar=None, adicionar=None):
+    """
+    Nova versão do banco com itens removidos, recalibrados ou adicionados. recalibrar e
+    adicionar trazem os campos do payload (idItem, parA, parB, parC e, para adicionar,
+    idEixo e idHabilidade) só dos itens alterados.
+
+    Apenas as colunas dos itens alterados são recalculadas na grade de probabilidades
+    e na tabela de informação já preparadas; as demais são reaproveitadas. O banco
+    original não é modificado (requisições e sessões em andamento continuam com ele) e
+    a versão nova tem versao + 1, o que muda a chave do cache de decisões.
+    """
+    banco = reescalar_banco(banco)
+    id_item = list(banco.id_item)
+    PAR = np.array(banco.PAR, dtype=float)
+    id_eixo = np.array(banco.id_eixo)
+    id_habilidade = np.array(banco.id_habilidade)
+    derivados = {}
+    if "P_grade" in banco.__dict__:
+        derivados["P_grade"] = np.array(banco.P_grade)
+    if "tabela_informacao" in banco.__dict__:
+        derivados["tabela_informacao"] = np.array(banco.tabela_informacao.tabela)
+    for nome in ("informacao_grade", "log_P_grade"):
+        if nome in banco.__dict__:
+            derivados[nome] = np.array(banco.__dict__[nome])
+    tabela = banco.__dict__.get("tabela_informacao")
+
+    def colunas(PAR_itens):
+        """Colunas das estruturas derivadas para os parâmetros (já transformados) informados."""
+        novas = {}
+        if "P_grade" in derivados:
+            novas["P_grade"] = probabilidades_grade(PAR_itens, quadratura()[0])
+        if "tabela_informacao" in derivados:
+            novas["tabela_informacao"] = TabelaInformacao(PAR_itens, tabela.passo, tabela.limite).tabela
+        if "informacao_grade" in derivados:
+            with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+                novas["informacao_grade"] = np.nan_to_num(maxima_informacao_th(quadratura()[0][:, None], PAR_itens))
+        if "log_P_grade" in derivados:
+            P = np.clip(probabilidades_grade(PAR_itens, quadratura()[0]), np.finfo(float).tiny, 1 - np.finfo(float).eps)
+            novas["log_P_grade"] = np.stack((np.log(P), np.log1p(-P)))
+        return novas
+
+    if remover:
+        manter = np.ones(len(id_item), dtype=bool)
+        manter[banco.indices(remover)] = False
+        id_item = [item for item, m in zip(id_item, manter) if m]
+        PAR, id_eixo, id_habilidade = PAR[manter], id_eixo[manter], id_habilidade[manter]
+        derivados = {nome: valores[..., manter] for nome, valores in derivados.items()}
+
+    if recalibrar:
+        itens = decodificar_textos(recalibrar["idItem"])
+        indice = {item: idx for idx, item in enumerate(id_item)}
+        try:
+            pos = [indice[item] for item in itens]
+        except KeyError as e:
+            raise ValueError(f"Item a recalibrar não encontrado no banco: {e.args[0]}")
+        novos = np.column_stack([decodificar_vetor(recalibrar[k]) for k in ("parA", "parB", "parC")])
+        if len(novos) != len(pos):
+            raise ValueError("idItem, parA, parB e parC devem ter o mesmo tamanho")
+        PAR[pos] = transformar_parametros(novos, banco.componente)
+        for nome, valores in colunas(PAR[pos]).items():
+            derivados[nome][..., pos] = valores
+        if "idEixo" in recalibrar:
+            id_eixo[pos] = decodificar_vetor(recalibrar["idEixo"], np.int64)
+        if "idHabilidade" in recalibrar:
+            id_habilidade[pos] = decodificar_vetor(recalibrar["idHabilidade"], np.int64)
+
+    if adicionar:
+        novo = banco_do_payload({**adicionar, "componente": banco.componente}, id_banco=banco.id)
+        repetidos = set(novo.id_item) & set(id_item)
+        if repetidos:
+            raise ValueError(f"Item já existe no banco: {sorted(repetidos)[0]}")
+        id_item += novo.id_item
+        PAR = np.vstack((PAR, novo.PAR))
+        id_eixo = np.concatenate((id_eixo, novo.id_eixo))
+        id_habilidade = np.concatenate((id_habilidade, novo.id_habilidade))
+        for nome, valores in colunas(novo.PAR).items():
+            derivados[nome] = np.concatenate((derivados[nome], valores), axis=-1)
+
+    alterado = BancoItens(
+        id=banco.id,
+        componente=banco.componente,
+        id_item=id_item,
+        PAR=PAR,
+        id_eixo=id_eixo,
+        id_habilidade=id_habilidade,
+        versao=banco.versao + 1,
+        escala=banco.escala,
+    )
+    for nome in ("P_grade", "informacao_grade", "log_P_grade"):
+        if nome in derivados:
+            alterado.__dict__[nome] = derivados[nome]
+    if "tabela_informacao" in derivados:
+        alterado.__dict__["tabela_informacao"] = TabelaInformacao.de_tabela(
+            derivados["tabela_informacao"], tabela.passo, tabela.limite
+        )
+    return alterado
+
+
+def banco_de_csv(caminho, componente, id_banco=None):
+    """
+    Lê um banco de um CSV com as colunas idItem, parA, parB, parC, idEixo e
+    idHabilidade (mesmos nomes dos campos do payload).
+    """
+    with open(caminho, newline="", encoding="utf-8") as f:
+        linhas = list(csv.DictReader(f))
+    return criar_banco(
+        componente=normalizar_componente(componente),
+        id_item=[l["idItem"] for l in linhas],
+        parA=[float(l["parA"]) for l in linhas],
+        parB=[float(l["parB"]) for l in linhas],
+        parC=[float(l["parC"]) for l in linhas],
+        id_eixo=[int(l["idEixo"]) for l in linhas],
+        id_habilidade=[int(l["idHabilidade"]) for l in linhas],
+        id_banco=id_banco,
+    )
+
+
+def banco_sintetico(n_itens, componente="LP", semente=0):
+    """Banco aleatório com parâmetros na escala SAEB, para simulações e benchmarks."""
+    rng = np.random.default_rng(semente)
+    return criar_banco(
+        componente=componente,
+        id_item=[f"ITEM{i}" for i in range(1, n_itens + 1)],
+        parA=rng.lognormal(np.log(0.02), 0.3, n_itens),
+        parB=rng.normal(250, 50, n_itens),
+        parC=rng.uniform(0.1, 0.25, n_itens),
+        id_eixo=np.arange(n_itens) % 4 + 1,
+        id_habilidade=np.arange(n_itens) % 20 + 1,
+        id_banco=f"sintetico-{n_itens}-{semente}",
+    )
+
+
+class RegistroBancos:
+    """
+    Bancos registrados em memória, com descarte LRU ao atingir o limite. Com um
+    diretório de bancos gravados (services.armazenamento), um idBanco ausente da
+    memória é procurado e mapeado a partir do diretório, e a cada intervalo segundos
+    o meta.json de um banco gravado é verificado: se outro worker alterou (PATCH) ou
+    removeu (DELETE) o banco, a versão em memória é recarregada ou descartada.
+    """
+
+    def __init__(self, max_bancos=64, diretorio=None, intervalo=1.0):
+        self.max_bancos = max_bancos
+        self.diretorio = diretorio
+        self.intervalo = intervalo
+        self._bancos = OrderedDict()
+        # idBanco -> (assinatura do meta.json carregado, última verificação)
+        self._gravados = {}
+        self._locks_alteracao = {}
+        self._lock = threading.Lock()
+
+    def _assinatura(self, id_banco):
+        """Identifica a gravação atual do banco (o diretório é trocado a cada gravação); None se não existe."""
+        from services.armazenamento import caminho_banco
+        try:
+            estado = os.stat(os.path.join(caminho_banco(self.diretorio, id_banco), "meta.json"))
+        except FileNotFoundError:
+            return None
+        return estado.st_ino, estado.st_mtime_ns, estado.st_size
+
+    def _assinatura_estavel(self, id_banco, tentativas=3):
+        # salvar_banco troca o diretório em dois passos: um meta.json ausente por um
+        # instante não significa que o banco foi removido
+        for _ in range(tentativas):
+            assinatura = self._assinatura(id_banco)
+            if assinatura is not None:
+                return assinatura
+            time.sleep(0.005)
+        return None
+
+    def registrar(self, banco, assinatura=None):
+        """
+        Registra o banco. Com diretório, assinatura é a da gravação de onde o banco foi
+        lido (padrão: a gravação atual, se houver).
+        """
+        banco.preparar()
+        if self.diretorio and assinatura is None:
+            assinatura = self._assinatura(banco.id)
+        with self._lock:
+            if banco.id in self._bancos:
+                # Mesmo id com conteúdo possivelmente diferente: decisões antigas não valem mais
+                cache_decisoes.invalidar(banco.id)
+            self._bancos[banco.id] = banco
+            self._bancos.move_to_end(banco.id)
+            if assinatura is None:
+                self._gravados.pop(banco.id, None)
+            else:
+                self._gravados[banco.id] = (assinatura, time.monotonic())
+            ITENS_BANCO.set(banco.n_itens, banco=banco.id)
+            while len(self._bancos) > self.max_bancos:
+                descartado, _ = self._bancos.popitem(last=False)
+                self._gravados.pop(descartado, None)
+                ITENS_BANCO.remover(banco=descartado)
+            BANCOS_REGISTRADOS.set(len(self._bancos))
+        return banco
+
+    def obter(self, id_banco, verificar=False):
+        """
+        Banco registrado ou gravado no diretório, ou None. verificar força a comparação
+        com a gravação em disco mesmo antes do intervalo (antes de alterar o banco).
+        Um banco preparado com outra escala dos perfis de pontuação (recarregados depois)
+        é reescalado e registrado de novo (ver reescalar_banco).
+        """
+        banco = self._obter(id_banco, verificar)
+        if banco is None or na_escala_atual(banco):
+            return banco
+        return self.registrar(reescalar_banco(banco))
+
+    def _obter(self, id_banco, verificar):
+        with self._lock:
+            banco = self._bancos.get(id_banco)
+            gravado = self._gravados.get(id_banco)
+            if banco is not None:
+                self._bancos.move_to_end(id_banco)
+                if gravado is None or (not verificar and time.monotonic() - gravado[1] < self.intervalo):
+                    return banco
+                self._gravados[id_banco] = (gravado[0], time.monotonic())
+        if not (self.diretorio and id_banco):
+            return banco
+
+        # Banco gravado por outro worker (ou pela CLI) depois da inicialização, ou
+        # alterado/removido por outro worker depois de carregado
+        assinatura = self._assinatura_estavel(id_banco) if banco is not None else self._assinatura(id_banco)
+        if banco is not None and assinatura == gravado[0]:
+            return banco
+        if assinatura is None:
+            if banco is not None:
+                self.remover(id_banco)
+            return None
+        from services.armazenamento import carregar_id
+        novo = carregar_id(self.diretorio, id_banco)
+        if novo is None:
+            self.remover(id_banco)
+            return None
+        return self.registrar(novo, assinatura)
+
+    @contextmanager
+    def bloqueio(self, id_banco):
+        """
+        Exclusão mútua para ler, alterar e gravar um banco: entre as threads deste
+        processo e, com diretório (e fcntl disponível), entre os workers.
+        """
+        with self._lock:
+            lock = self._locks_alteracao.setdefault(id_banco, threading.Lock())
+        with lock:
+            if not (self.diretorio and fcntl):
+                yield
+                return
+            from services.armazenamento import caminho_banco
+            os.makedirs(self.diretorio, exist_ok=True)
+            with open(caminho_banco(self.diretorio, id_banco) + ".lock", "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def remover(self, id_banco):
+        with self._lock:
+            self._gravados.pop(id_banco, None)
+            removido = self._bancos.pop(id_banco, None) is not None
+            if removido:
+                cache_decisoes.invalidar(id_banco)
+                ITENS_BANCO.remover(banco=id_banco)
+                BANCOS_REGISTRADOS.set(len(self._bancos))
+            return removido
+
+    def __len__(self):
+        return len(self._bancos)
+
+    def __contains__(self, id_banco):
+        return id_banco in self._bancos
+
+
+registro_bancos = RegistroBancos(
+    max_bancos=int(os.getenv("TAI_MAX_BANCOS", "64")),
+    diretorio=os.getenv("TAI_DIR_BANCOS") or None,
+    intervalo=float(os.getenv("TAI_INTERVALO_BANCOS", "1")),
+)
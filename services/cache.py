@@ -0,0 +1,96 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from services.metricas import metricas
+from services.perfis_pontuacao import perfis_pontuacao
+
+CONSULTAS_CACHE = metricas.contador(
+    "tai_cache_decisoes_total", "Consultas ao cache de decisões por resultado (hit/miss)", ("resultado",)
+)
+ENTRADAS_CACHE = metricas.gauge(
+    "tai_cache_decisoes_entradas", "Decisões armazenadas no cache"
+)
+
+
+class CacheDecisoes:
+    """
+    Cache LRU das respostas do /proximo. A seleção é determinística dado o banco, o
+    ano escolar, a proficiência inicial e o padrão de respostas corrigidas, então a
+    mesma entrada sempre produz a mesma resposta.
+
+    Cada banco tem uma geração que entra na chave: invalidar um banco apenas troca a
+    geração, e as entradas antigas deixam de ser alcançadas e saem pelo LRU. O mesmo
+    vale para os perfis de pontuação: a impressão dos perfis em uso entra na chave.
+    """
+
+    def __init__(self, max_entradas=100_000):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._geracoes = {}
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def chave(self, banco, ano_escolar, profic_inic, n_Ij, administrado_idx, acertos, estimador="eap",
+              proficiencia=None):
+        """
+        Chave da decisão; acertos é o vetor de respostas corrigidas (0/1) e estimador o
+        nome do estimador de proficiência usado. proficiencia é o ponto de partida dos
+        estimadores iterativos (MAP), que muda o resultado; None para os demais.
+        """
+        return (
+            banco.id, banco.versao, self._geracoes.get(banco.id, 0), banco.componente, estimador,
+            perfis_pontuacao.atual.impressao,
+            ano_escolar, profic_inic, n_Ij, tuple(administrado_idx), np.asarray(acertos, dtype=np.uint8).tobytes(),
+            proficiencia
+        )
+
+    def obter(self, chave, detalhes=None):
+        """
+        Resposta guardada para a chave, ou None. Se detalhes for um dicionário, recebe
+        os valores da auditoria guardados junto com a resposta.
+        """
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                self.falhas += 1
+            else:
+                self.acertos += 1
+                self._entradas.move_to_end(chave)
+        CONSULTAS_CACHE.inc(resultado="miss" if entrada is None else "hit")
+        if entrada is None:
+            return None
+        resultado, guardados = entrada
+        if detalhes is not None and guardados:
+            detalhes.update(guardados)
+        return list(resultado)
+
+    def guardar(self, chave, resultado, detalhes=None):
+        """Guarda a resposta e, opcionalmente, os valores da auditoria do cálculo."""
+        if self.max_entradas <= 0:
+            return
+        with self._lock:
+            self._entradas[chave] = (tuple(resultado), dict(detalhes) if detalhes else None)
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+            ENTRADAS_CACHE.set(len(self._entradas))
+
+    def invalidar(self, id_banco):
+        """Descarta (logicamente) todas as decisões de um banco."""
+        with self._lock:
+            self._geracoes[id_banco] = self._geracoes.get(id_banco, 0) + 1
+
+    def limpar(self):
+        with self._lock:
+            self._entradas.clear()
+            ENTRADAS_CACHE.set(0)
+
+    def __len__(self):
+        return len(self._entradas)
+
+
+cache_decisoes = CacheDecisoes(max_entradas=int(os.getenv("TAI_MAX_CACHE_DECISOES", "100000")))
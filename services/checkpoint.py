@@ -0,0 +1,131 @@
+"""
+Checkpoint da posteriori para o /proximo sem sessão no servidor. O cliente pede o
+checkpoint (campo "checkpoint" no payload) e o devolve na chamada seguinte; com ele,
+o servidor atualiza a posteriori só com as respostas novas, em O(q) por resposta, em
+vez de refazer a verossimilhança de todos os itens respondidos.
+
+O checkpoint é um texto base64 (URL-safe, sem "=") com a log-posteriori nos nós da
+quadratura padrão quantizada em uint16, o mapa de bits dos itens já incorporados e
+um HMAC-SHA256 (chave TAI_CHAVE_CHECKPOINT) que cobre também o banco e as respostas
+incorporadas. Checkpoints inválidos, de outro banco ou que não correspondem às
+respostas enviadas são ignorados e a posteriori é calculada do zero.
+
+Sem TAI_CHAVE_CHECKPOINT, cada processo usa uma chave aleatória: com vários workers,
+defina a chave para que um checkpoint emitido por um seja aceito pelos outros.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+import struct
+
+import numpy as np
+
+from services.adaptive_testing import Q_PONTOS, quadratura, log_verossimilhanca
+from services.metricas import metricas
+
+USOS_CHECKPOINT = metricas.contador(
+    "tai_checkpoint_total", "Checkpoints recebidos no /proximo por resultado (usado/invalido/ausente)", ("resultado",)
+)
+
+VERSAO = 1
+# versão, q, respostas incorporadas, piso da log-posteriori
+CABECALHO = struct.Struct("<BBHf")
+TAMANHO_HMAC = 16
+NIVEIS = np.iinfo(np.uint16).max
+# Nós com log-posteriori abaixo do máximo menos este valor têm peso desprezível
+PISO_LOG = -100.0
+
+
+def pedido(body):
+    """Se o payload pede checkpoint, e o checkpoint recebido ("" / true na primeira chamada)."""
+    if "checkpoint" not in body or body["checkpoint"] is False:
+        return False, None
+    valor = body["checkpoint"]
+    return True, valor if isinstance(valor, str) and valor else None
+
+
+class Checkpoints:
+    """Codificação, assinatura e uso dos checkpoints com uma chave fixa."""
+
+    def __init__(self, chave=None):
+        self.chave = chave.encode() if isinstance(chave, str) else (chave or os.urandom(32))
+
+    def _assinatura(self, banco, corpo, acertos_por_item):
+        mensagem = hmac.new(self.chave, banco.impressao.encode(), hashlib.sha256)
+        mensagem.update(corpo)
+        mensagem.update(acertos_por_item)
+        return mensagem.digest()[:TAMANHO_HMAC]
+
+    @staticmethod
+    def _mapa(banco, administrado_idx):
+        mapa = np.zeros(banco.n_itens, dtype=bool)
+        mapa[administrado_idx] = True
+        return mapa
+
+    @staticmethod
+    def _acertos_por_item(administrado_idx, acertos):
+        # As respostas na ordem dos itens no banco: a posteriori não depende da ordem de aplicação
+        ordem = np.argsort(administrado_idx, kind="stable")
+        return np.packbits(np.asarray(acertos, dtype=bool)[ordem]).tobytes()
+
+    def gerar(self, banco, log_posteriori, administrado_idx, acertos):
+        """Checkpoint da posteriori depois das respostas acertos aos itens administrado_idx."""
+        relativa = log_posteriori - np.max(log_posteriori)
+        # O piso vai no cabeçalho como float32: quantiza com o mesmo valor que será lido
+        piso = float(np.float32(min(max(float(np.min(relativa)), PISO_LOG), -1.0)))
+        quantizada = np.rint(np.clip(relativa, piso, 0.0) / piso * NIVEIS).astype("<u2")
+        corpo = (
+            CABECALHO.pack(VERSAO, len(quantizada), len(acertos), piso)
+            + quantizada.tobytes()
+            + np.packbits(self._mapa(banco, administrado_idx)).tobytes()
+        )
+        assinatura = self._assinatura(banco, corpo, self._acertos_por_item(administrado_idx, acertos))
+        return base64.urlsafe_b64encode(corpo + assinatura).rstrip(b"=").decode("ascii")
+
+    def ler(self, texto, banco, administrado_idx, acertos):
+        """
+        (log-posteriori, respostas incorporadas) se o checkpoint for válido para este banco
+        e corresponder ao início das respostas enviadas; senão, None.
+        """
+        try:
+            dados = base64.urlsafe_b64decode(texto + "=" * (-len(texto) % 4))
+            versao, q, n, piso = CABECALHO.unpack_from(dados)
+        except (binascii.Error, ValueError, struct.error):
+            return None
+        n_mapa = (banco.n_itens + 7) // 8
+        fim = CABECALHO.size + 2 * q + n_mapa
+        if versao != VERSAO or q != Q_PONTOS or len(dados) != fim + TAMANHO_HMAC or n > len(acertos):
+            return None
+        corpo = dados[:fim]
+        mapa = np.frombuffer(corpo, dtype=np.uint8, offset=CABECALHO.size + 2 * q)
+        if not np.array_equal(mapa, np.packbits(self._mapa(banco, administrado_idx[:n]))):
+            return None
+        esperada = self._assinatura(banco, corpo, self._acertos_por_item(administrado_idx[:n], acertos[:n]))
+        if not hmac.compare_digest(dados[fim:], esperada):
+            return None
+        quantizada = np.frombuffer(corpo, dtype="<u2", count=q, offset=CABECALHO.size)
+        return quantizada * (piso / NIVEIS), n
+
+    def posteriori(self, texto, banco, administrado_idx, acertos):
+        """
+        Log-posteriori nos nós da quadratura padrão depois de todas as respostas: a do
+        checkpoint mais as respostas que ele ainda não incorpora, ou, sem checkpoint
+        válido, calculada do zero. Retorna também se o checkpoint foi usado.
+        """
+        administrado_idx = np.asarray(administrado_idx, dtype=np.int64)
+        acertos = np.asarray(acertos, dtype=float)
+        lido = None if texto is None else self.ler(texto, banco, administrado_idx, acertos)
+        USOS_CHECKPOINT.inc(resultado="ausente" if texto is None else "invalido" if lido is None else "usado")
+        if lido is None:
+            _, log_priori = quadratura()
+            return log_priori + log_verossimilhanca(acertos, banco.grade(administrado_idx)), False
+        log_posteriori, n = lido
+        # Cada resposta nova soma uma linha já tabelada (log P ou log(1 - P) nos q nós)
+        for idx, acerto in zip(administrado_idx[n:], acertos[n:]):
+            log_posteriori = log_posteriori + banco.log_P_grade[0 if acerto else 1, :, idx]
+        return log_posteriori, True
+
+
+checkpoints = Checkpoints(os.getenv("TAI_CHAVE_CHECKPOINT") or None)
@@ -0,0 +1,125 @@
+import numpy as np
+
+from services.adaptive_testing import motivo_parada, escala_saeb, proximo_item_criterio, theta_proficiencia_inicial
+from services.informacao import (
+    top_k_informacao, informacao_criterio, refinar_exato, CRITERIO_SELECAO, CANDIDATOS_EXATOS, BALANCEAR_EIXOS,
+    contagem_eixos, eixo_menos_representado, itens_do_eixo, administrados_do_eixo
+)
+from services.metricas import medir, PARADAS
+
+_rng = np.random.default_rng()
+
+
+def resposta_item(banco, pos, ordem, proficiencia, erro):
+    """Resposta do /proximo quando há um próximo item a aplicar."""
+    PAR = banco.PAR
+    return [
+        banco.id_item[pos],
+        str(ordem),
+        str(pos),
+        str(round(PAR[pos, 0], 6)),
+        str(round(PAR[pos, 1], 14)),
+        str(round(PAR[pos, 2], 3)),
+        proficiencia,
+        erro
+    ]
+
+
+def resposta_final(theta_saeb, erro_saeb):
+    """Resposta do /proximo quando o teste atingiu o critério de parada."""
+    return [
+        -1,
+        "NA",
+        "NA",
+        "NA",
+        "NA",
+        "NA",
+        round(theta_saeb, 4),
+        round(erro_saeb, 4)
+    ]
+
+
+def selecionar_item(banco, theta_est, administrado_idx, randomesque=1, detalhes=None, pesos=None, criterio=None,
+                    balancear=None, contagem=None):
+    """
+    Item de máxima informação em theta_est ainda não administrado (administrado_idx:
+    posições ou máscara booleana). Com randomesque=k > 1, sorteia entre os k itens de
+    maior informação. Se detalhes for um dicionário, recebe a informação do item
+    selecionado.
+
+    Com os pesos da posteriori nos nós da quadratura e o critério "pwi" ou "kl"
+    (padrão: TAI_CRITERIO_SELECAO), a informação é a do critério correspondente
+    (ver services.informacao.informacao_criterio).
+
+    Com balancear (padrão: TAI_BALANCEAR_EIXOS), só os itens do eixo menos
+    representado são avaliados. contagem, os itens aplicados por eixo, pode vir já
+    mantida pelo chamador (sessões); senão é contada a partir de administrado_idx.
+    """
+    balancear = BALANCEAR_EIXOS if balancear is None else balancear
+    with medir("selecao"):
+        if balancear:
+            if contagem is None:
+                contagem = contagem_eixos(banco, administrado_idx)
+            eixo = eixo_menos_representado(banco, contagem)
+            itens = itens_do_eixo(banco, eixo)
+            administrado = administrados_do_eixo(banco, eixo, administrado_idx)
+        else:
+            itens, administrado = None, administrado_idx
+        criterio = criterio or CRITERIO_SELECAO
+        INFO = informacao_criterio(banco, theta_est, pesos, criterio, itens)
+        if criterio == "mfi" or pesos is None:
+            # A tabela interpolada só pré-seleciona; os melhores são comparados pela 3PL exata
+            INFO[administrado] = -np.inf
+            refinar_exato(banco, INFO, theta_est, itens, candidatos=CANDIDATOS_EXATOS + randomesque)
+        if randomesque <= 1:
+            pos = proximo_item_criterio(INFO, administrado)
+        else:
+            candidatos = top_k_informacao(INFO, administrado, randomesque)
+            pos = int(_rng.choice(candidatos))
+    if detalhes is not None:
+        detalhes["informacao"] = float(INFO[pos])
+    if itens is None:
+        return pos
+    _, ordem, inicios = banco.particao_eixos
+    return int(ordem[inicios[eixo] + pos])
+
+
+def primeiro_item(banco, profic_inic, administrado_idx, randomesque=1, detalhes=None):
+    """Seleciona o primeiro item a partir da proficiência inicial (escala SAEB)."""
+    theta_est_ep = theta_proficiencia_inicial(profic_inic)
+    if detalhes is not None:
+        detalhes["theta"] = theta_est_ep
+    pos = selecionar_item(banco, theta_est_ep, administrado_idx, randomesque, detalhes)
+    return resposta_item(banco, pos, 1, str(round(profic_inic, 13)), "NA")
+
+
+def proximo_passo(banco, theta_est, theta_ep, administrado_idx, n_resp, AnoEscolar, n_Ij, validEixo, randomesque=1,
+                  detalhes=None, pesos=None, criterio=None, contagem=None):
+    """
+    Dada a proficiência estimada, aplica o critério de parada e, se o teste
+    continuar, seleciona o item de máxima informação ainda não administrado.
+    Se detalhes for um dicionário, recebe theta, EP, motivo da parada e a
+    informação do item selecionado (para a auditoria). pesos, criterio e contagem
+    são os de selecionar_item.
+    """
+    with medir("criterio_parada"):
+        motivo = motivo_parada(
+            theta_est, theta_ep, Area=banco.componente, AnoEscolar=AnoEscolar,
+            n_resp=n_resp, n_Ij=n_Ij, validEixo=validEixo
+        )
+    if detalhes is not None:
+        detalhes.update(theta=float(theta_est), ep=float(theta_ep), motivo=motivo)
+
+    # Aplica a escala SAEB correta conforme o componente
+    theta_saeb, erro_saeb = escala_saeb(theta_est, theta_ep, banco.componente)
+
+    if motivo is not None:
+        PARADAS.inc(motivo=motivo)
+        return resposta_final(theta_saeb, erro_saeb)
+
+    pos = selecionar_item(banco, theta_est, administrado_idx, randomesque, detalhes, pesos, criterio, contagem=contagem)
+    return resposta_item(
+        banco, pos, n_resp + 1,
+        str(round(theta_saeb, 12)),
+        str(round(erro_saeb, 13))
+    )
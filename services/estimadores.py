@@ -0,0 +1,155 @@
+import os
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from services.adaptive_testing import (
+    Q_PONTOS,
+    LIMITE_QUADRATURA,
+    quadratura,
+    probabilidades_grade,
+    log_verossimilhanca,
+    estimar_posteriori
+)
+from services.metricas import metricas
+
+AVALIACOES = metricas.contador(
+    "tai_estimador_avaliacoes_total",
+    "Avaliações da 3PL (nós x itens ou iterações x itens) feitas por estimador", ("estimador",)
+)
+DURACAO_ESTIMADOR = metricas.histograma(
+    "tai_estimador_duracao_segundos", "Duração da estimativa de proficiência por estimador", ("estimador",)
+)
+
+
+@dataclass
+class Estimativa:
+    """Proficiência estimada (escala theta) e o custo para obtê-la."""
+    theta: float
+    ep: float
+    avaliacoes: int
+    segundos: float = 0.0
+    detalhes: dict = field(default_factory=dict)
+
+
+class Estimador:
+    """
+    Interface dos estimadores de proficiência. estimar recebe o banco, os índices dos
+    itens administrados, as respostas corrigidas (0/1) e, opcionalmente, um theta
+    inicial (usado pelos estimadores iterativos).
+    """
+    nome = ""
+    # O resultado depende do theta inicial (ponto de partida das iterações)
+    usa_theta_inicial = False
+
+    def estimar(self, banco, administrado_idx, acertos, theta_inicial=None):
+        inicio = time.perf_counter()
+        estimativa = self._estimar(banco, administrado_idx, np.asarray(acertos, dtype=float), theta_inicial)
+        estimativa.segundos = time.perf_counter() - inicio
+        AVALIACOES.inc(estimativa.avaliacoes, estimador=self.nome)
+        DURACAO_ESTIMADOR.observar(estimativa.segundos, estimador=self.nome)
+        return estimativa
+
+    def _estimar(self, banco, administrado_idx, acertos, theta_inicial):
+        raise NotImplementedError
+
+
+class EstimadorEAP(Estimador):
+    """EAP com número de nós configurável; nós e priori são cacheados por (q, limite)."""
+
+    def __init__(self, q=Q_PONTOS, limite=LIMITE_QUADRATURA):
+        self.q = q
+        self.limite = limite
+        self.nome = "eap" if (q, limite) == (Q_PONTOS, LIMITE_QUADRATURA) else f"eap:{q}"
+
+    @property
+    def padrao(self):
+        return self.nome == "eap"
+
+    def _estimar(self, banco, administrado_idx, acertos, theta_inicial):
+        Xr, log_priori = quadratura(self.q, self.limite)
+        if self.padrao:
+            # A grade padrão já pode estar pré-calculada no banco
+            P = banco.grade(administrado_idx)
+        else:
+            P = probabilidades_grade(banco.PAR[administrado_idx, :], Xr)
+        theta, ep = estimar_posteriori(log_verossimilhanca(acertos, P) + log_priori, Xr)
+        return Estimativa(theta, ep, avaliacoes=self.q * len(acertos), detalhes={"q": self.q})
+
+
+class EstimadorMAP(Estimador):
+    """
+    MAP com priori normal padrão por Newton-Raphson (escore de Fisher), partindo do
+    theta inicial (a proficiência já enviada no payload) em vez de zero.
+    """
+    nome = "map"
+    usa_theta_inicial = True
+
+    def __init__(self, max_iteracoes=20, tolerancia=1e-6):
+        self.max_iteracoes = max_iteracoes
+        self.tolerancia = tolerancia
+
+    def _estimar(self, banco, administrado_idx, acertos, theta_inicial):
+        PAR = banco.PAR[administrado_idx, :]
+        a, b, c = PAR[:, 0], PAR[:, 1], PAR[:, 2]
+        theta = 0.0 if theta_inicial is None or not np.isfinite(theta_inicial) else float(theta_inicial)
+        theta = float(np.clip(theta, -LIMITE_QUADRATURA, LIMITE_QUADRATURA))
+
+        iteracoes = 0
+        for iteracoes in range(1, self.max_iteracoes + 1):
+            with np.errstate(over="ignore"):
+                P = c + (1 - c) / (1 + np.exp(-a * (theta - b)))
+            P = np.clip(P, 1e-12, 1 - 1e-12)
+            fator = a * (P - c) / ((1 - c) * P)
+            gradiente = np.sum(fator * (acertos - P)) - theta
+            informacao = np.sum(fator ** 2 * P * (1 - P)) + 1
+            passo = gradiente / informacao
+            theta = float(np.clip(theta + passo, -LIMITE_QUADRATURA, LIMITE_QUADRATURA))
+            if abs(passo) < self.tolerancia:
+                break
+
+        return Estimativa(
+            theta, float(1 / np.sqrt(informacao)), avaliacoes=iteracoes * len(acertos),
+            detalhes={"iteracoes": iteracoes}
+        )
+
+
+class EstimadorAdaptativo(Estimador):
+    """
+    EAP com poucos nós no início do teste, quando a posteriori é larga, e mais nós
+    conforme as respostas se acumulam. etapas é uma lista de (máximo de respostas, q).
+    """
+    nome = "adaptativo"
+
+    def __init__(self, etapas=((4, 21), (12, 41)), q_final=Q_PONTOS):
+        self.etapas = tuple(etapas)
+        self.q_final = q_final
+        self._eaps = {}
+
+    def _eap(self, q):
+        if q not in self._eaps:
+            self._eaps[q] = EstimadorEAP(q)
+        return self._eaps[q]
+
+    def _estimar(self, banco, administrado_idx, acertos, theta_inicial):
+        q = next((q for n_max, q in self.etapas if len(acertos) <= n_max), self.q_final)
+        return self._eap(q)._estimar(banco, administrado_idx, acertos, theta_inicial)
+
+
+def criar_estimador(especificacao="eap"):
+    """
+    Estimador a partir de uma especificação em texto: "eap", "eap:<q>", "map" ou
+    "adaptativo".
+    """
+    nome, _, parametro = especificacao.strip().lower().partition(":")
+    if nome == "eap":
+        return EstimadorEAP(int(parametro)) if parametro else EstimadorEAP()
+    if nome == "map":
+        return EstimadorMAP()
+    if nome == "adaptativo":
+        return EstimadorAdaptativo()
+    raise ValueError(f"Estimador desconhecido: {especificacao}")
+
+
+estimador_padrao = criar_estimador(os.getenv("TAI_ESTIMADOR", "eap"))
@@ -0,0 +1,135 @@
+import asyncio
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from services.metricas import metricas
+from services.perfil import perfil_com_cprofile
+
+MODOS_EXECUCAO = ("inline", "thread", "process")
+
+EM_EXECUCAO = metricas.gauge(
+    "tai_execucao_em_andamento", "Cálculos aguardando ou em execução no pool"
+)
+ESPERA_FILA = metricas.histograma(
+    "tai_execucao_espera_segundos", "Tempo de espera na fila antes do cálculo começar"
+)
+REJEICOES = metricas.contador(
+    "tai_execucao_rejeicoes_total", "Requisições rejeitadas com 429 por fila cheia"
+)
+
+
+class FilaCheia(Exception):
+    """A fila de cálculos atingiu o limite; o cliente deve tentar novamente depois."""
+
+    def __init__(self, retry_after):
+        super().__init__("Servidor sobrecarregado, tente novamente")
+        self.retry_after = retry_after
+
+
+class BancoAusente(Exception):
+    """O processo do pool ainda não tem o banco (nesta versão); ele deve ser enviado."""
+
+
+def _executar_cronometrado(funcao, enfileirado, args):
+    # Roda no worker: mede a espera na fila (relógio de parede, comparável entre processos)
+    espera = time.time() - enfileirado
+    return funcao(*args), espera
+
+
+def _iniciar_processo():
+    # Com fork, o processo herda as métricas do principal: descarta para não contá-las de novo
+    metricas.extrair()
+
+
+def _executar_em_processo(funcao, enfileirado, args):
+    # As métricas registradas durante o cálculo (requisições, etapas, cache, paradas)
+    # voltam com o resultado, ou com a exceção, e são somadas no processo principal
+    espera = time.time() - enfileirado
+    try:
+        resultado, erro = funcao(*args), None
+    except Exception as e:
+        resultado, erro = None, e
+    return resultado, erro, espera, metricas.extrair()
+
+
+class ExecutorLimitado:
+    """
+    Executa cálculos de CPU fora do event loop, em um pool de threads ou de processos,
+    com no máximo max_workers em execução e max_fila aguardando. No modo "inline" o
+    cálculo roda diretamente, como antes.
+    """
+
+    def __init__(self, modo="inline", max_workers=None, max_fila=64, retry_after=1):
+        if modo not in MODOS_EXECUCAO:
+            raise ValueError(f"Modo de execução desconhecido: {modo}")
+        self.modo = modo
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_fila = max_fila
+        self.retry_after = retry_after
+        self.em_andamento = 0
+        self._pool = None
+
+    @property
+    def capacidade(self):
+        return self.max_workers + self.max_fila
+
+    def _obter_pool(self):
+        if self._pool is None:
+            if self.modo == "thread":
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tai")
+            else:
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_iniciar_processo)
+        return self._pool
+
+    async def executar(self, funcao, *args):
+        # Requisições sob cProfile rodam na thread do perfilador
+        if self.modo == "inline" or perfil_com_cprofile():
+            return funcao(*args)
+
+        # O contador só é alterado no event loop, portanto sem concorrência
+        if self.em_andamento >= self.capacidade:
+            REJEICOES.inc()
+            raise FilaCheia(self.retry_after)
+
+        self.em_andamento += 1
+        EM_EXECUCAO.set(self.em_andamento)
+        try:
+            loop = asyncio.get_running_loop()
+            if self.modo == "process":
+                resultado, erro, espera, extraidas = await loop.run_in_executor(
+                    self._obter_pool(), _executar_em_processo, funcao, time.time(), args
+                )
+                metricas.incorporar(extraidas)
+                ESPERA_FILA.observar(espera)
+                if erro is not None:
+                    raise erro
+                return resultado
+            # Propaga o contexto (perfil da requisição) para a thread do pool
+            resultado, espera = await loop.run_in_executor(
+                self._obter_pool(), contextvars.copy_context().run, _executar_cronometrado, funcao, time.time(), args
+            )
+            ESPERA_FILA.observar(espera)
+            return resultado
+        except BrokenProcessPool:
+            # Um worker morreu: o pool é recriado na próxima requisição
+            self._pool = None
+            raise
+        finally:
+            self.em_andamento -= 1
+            EM_EXECUCAO.set(self.em_andamento)
+
+    def encerrar(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+executor = ExecutorLimitado(
+    modo=os.getenv("TAI_MODO_EXECUCAO", "inline"),
+    max_workers=int(os.getenv("TAI_MAX_WORKERS", "0")) or None,
+    max_fila=int(os.getenv("TAI_MAX_FILA", "64")),
+    retry_after=int(os.getenv("TAI_RETRY_AFTER", "1")),
+)
@@ -0,0 +1,199 @@
+import os
+
+import numpy as np
+
+from services.adaptive_testing import maxima_informacao_th, LIMITE_QUADRATURA
+
+# Espaçamento da grade de theta da tabela de informação
+PASSO_INFORMACAO = float(os.getenv("TAI_PASSO_INFORMACAO", "0.05"))
+
+# Critérios de seleção: informação de Fisher no theta estimado (mfi), informação
+# ponderada pela posteriori (pwi) e informação de Kullback-Leibler (kl)
+CRITERIOS_SELECAO = ("mfi", "pwi", "kl")
+CRITERIO_SELECAO = os.getenv("TAI_CRITERIO_SELECAO", "mfi")
+if CRITERIO_SELECAO not in CRITERIOS_SELECAO:
+    raise ValueError(f"Critério de seleção desconhecido: {CRITERIO_SELECAO}")
+
+# Balanceamento de conteúdo: o próximo item é o de maior informação dentro do eixo
+# com menos itens aplicados (entre os que ainda têm itens disponíveis)
+BALANCEAR_EIXOS = os.getenv("TAI_BALANCEAR_EIXOS", "0") == "1"
+
+# Itens de maior informação interpolada que têm a informação recalculada pela 3PL
+# exata antes da escolha
+CANDIDATOS_EXATOS = int(os.getenv("TAI_CANDIDATOS_EXATOS", "8"))
+
+
+class TabelaInformacao:
+    """
+    Informação de Fisher de todos os itens do banco pré-calculada em uma grade fina
+    de theta. A informação em um theta qualquer é obtida por interpolação linear
+    entre os dois nós vizinhos, sem recalcular a 3PL.
+    """
+
+    def __init__(self, PAR, passo=PASSO_INFORMACAO, limite=LIMITE_QUADRATURA):
+        self.passo = passo
+        self.limite = limite
+        n_nos = int(round(2 * limite / passo)) + 1
+        self.nos = np.linspace(-limite, limite, n_nos)
+        with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+            self.tabela = np.nan_to_num(maxima_informacao_th(self.nos[:, None], PAR))
+
+    @classmethod
+    def de_tabela(cls, tabela, passo, limite):
+        """Tabela já calculada (por exemplo, mapeada de um arquivo .npy), sem recalcular a 3PL."""
+        objeto = cls.__new__(cls)
+        objeto.passo = passo
+        objeto.limite = limite
+        objeto.nos = np.linspace(-limite, limite, tabela.shape[0])
+        objeto.tabela = tabela
+        return objeto
+
+    @property
+    def nbytes(self):
+        return self.tabela.nbytes
+
+    def informacao(self, theta, itens=None):
+        """
+        Informação de todos os itens (ou só das posições em itens) em theta. Para theta
+        escalar retorna (n_itens,); para um vetor de N valores retorna (N x n_itens).
+        """
+        theta = np.clip(np.asarray(theta, dtype=float), -self.limite, self.limite)
+        posicao = (theta + self.limite) / self.passo
+        k = np.minimum(posicao.astype(int), len(self.nos) - 2)
+        w = (posicao - k)[..., None]
+        if k.ndim == 0:
+            # Índice inteiro: as linhas são views da tabela, sem cópia
+            k = int(k)
+        if itens is None:
+            return (1 - w) * self.tabela[k] + w * self.tabela[k + 1]
+        # Só as colunas de itens das duas linhas vizinhas
+        return (1 - w) * self.tabela[k][..., itens] + w * self.tabela[k + 1][..., itens]
+
+    def top_k(self, theta, administrado, k=1):
+        """Os k itens não administrados de maior informação em theta, do maior para o menor."""
+        return top_k_informacao(self.informacao(theta), administrado, k)
+
+
+def top_k_informacao(INFO, administrado, k=1):
+    """
+    Posições dos k itens de maior informação, excluindo os administrados, ordenadas
+    da maior para a menor informação. Usa argpartition, sem ordenar o banco inteiro.
+    Com menos de k itens disponíveis, retorna só os disponíveis.
+    """
+    INFO = np.array(INFO, dtype=float)
+    INFO[administrado] = -np.inf
+    k = max(1, min(k, int(np.isfinite(INFO).sum())))
+    if k == 1:
+        return np.array([np.argmax(INFO)])
+    candidatos = np.argpartition(-INFO, k - 1)[:k]
+    return candidatos[np.argsort(-INFO[candidatos], kind="stable")]
+
+
+def refinar_exato(banco, INFO, theta_est, itens=None, candidatos=CANDIDATOS_EXATOS):
+    """
+    Com a tabela de informação preparada, troca (no próprio INFO) a informação
+    interpolada dos candidatos itens de maior valor pela da 3PL exata, de modo que a
+    tabela só pré-seleciona e a escolha é a mesma de um banco sem tabela. INFO é (n,)
+    com theta escalar ou (N x n) com theta (N,), já com -inf nos itens administrados;
+    itens são as posições de INFO no banco (padrão: todas).
+    """
+    if "tabela_informacao" not in banco.__dict__ or INFO.shape[-1] == 0:
+        return INFO
+    c = min(candidatos, INFO.shape[-1])
+    idx = np.argpartition(-INFO, c - 1, axis=-1)[..., :c]
+    PAR = banco.PAR if itens is None else banco.PAR[itens]
+    theta = np.asarray(theta_est, dtype=float)
+    with np.errstate(over="ignore", invalid="ignore", divide="ignore"):
+        exata = maxima_informacao_th(theta[..., None] if theta.ndim else theta, PAR[idx])
+    disponivel = np.isfinite(np.take_along_axis(INFO, idx, axis=-1))
+    np.put_along_axis(INFO, idx, np.where(disponivel, exata, -np.inf), axis=-1)
+    return INFO
+
+
+def pesos_posteriori(log_posteriori):
+    """Posteriori normalizada (soma 1) nos nós da quadratura, para (q,) ou (N x q)."""
+    pesos = np.exp(log_posteriori - np.max(log_posteriori, axis=-1, keepdims=True))
+    return pesos / np.sum(pesos, axis=-1, keepdims=True)
+
+
+def informacao_criterio(banco, theta_est, pesos=None, criterio=CRITERIO_SELECAO, itens=None):
+    """
+    Valor do critério de seleção de todos os itens do banco (ou só das posições em
+    itens). theta_est é escalar ou vetor (N,); pesos, a posteriori nos nós da
+    quadratura padrão, (q,) ou (N x q). Sem pesos (primeiro item), usa a informação de
+    Fisher em theta_est.
+
+    pwi: soma da informação de Fisher nos nós ponderada pela posteriori.
+    kl: KL esperado entre a resposta em theta_est e nos nós, ponderado pela posteriori:
+        P log P + (1 - P) log(1 - P) - P (w . log P_k) - (1 - P) (w . log(1 - P_k)).
+    Os dois usam tabelas itens x nós do banco e custam um produto matriz-vetor.
+    """
+    todos = slice(None) if itens is None else itens
+    if criterio == "mfi" or pesos is None:
+        return banco.informacao(theta_est, itens)
+    if criterio == "pwi":
+        return pesos @ banco.informacao_grade[:, todos]
+    if criterio == "kl":
+        # (2 x q x n) -> (2 x n) ou (2 x N x n)
+        esperado_log_P, esperado_log_1mP = np.matmul(pesos, banco.log_P_grade[:, :, todos])
+        theta = np.asarray(theta_est, dtype=float)
+        PAR = banco.PAR[todos]
+        a, b, c = PAR[:, 0], PAR[:, 1], PAR[:, 2]
+        with np.errstate(over="ignore"):
+            P = c + (1 - c) / (1 + np.exp(-a * ((theta[..., None] if theta.ndim else theta) - b)))
+        P = np.clip(P, np.finfo(float).tiny, 1 - np.finfo(float).eps)
+        return P * np.log(P) + (1 - P) * np.log1p(-P) - P * esperado_log_P - (1 - P) * esperado_log_1mP
+    raise ValueError(f"Critério de seleção desconhecido: {criterio}")
+
+
+def contagem_eixos(banco, administrado):
+    """
+    Itens aplicados por eixo, na ordem de banco.particao_eixos. administrado são as
+    posições aplicadas ou a máscara booleana (n,); uma máscara (N x n) dá (N x k).
+    """
+    administrado = np.asarray(administrado)
+    if administrado.dtype != bool:
+        administrado = administrado.astype(np.intp)
+    if administrado.ndim == 2:
+        _, ordem, inicios = banco.particao_eixos
+        return np.add.reduceat(administrado[:, ordem], inicios[:-1], axis=1, dtype=np.int64)
+    return np.bincount(banco.posicao_eixo[administrado], minlength=len(banco.particao_eixos[0]))
+
+
+def eixo_menos_representado(banco, contagem):
+    """
+    Índice (em banco.particao_eixos) do eixo com menos itens aplicados entre os que
+    ainda têm itens disponíveis; contagem (k,) ou (N x k). Empates ficam com o menor idEixo.
+    """
+    _, ordem, inicios = banco.particao_eixos
+    contagem = np.asarray(contagem)
+    # Eixos esgotados ficam depois de todos os outros
+    return np.argmin(contagem + (contagem >= np.diff(inicios)) * len(ordem), axis=-1)
+
+
+def itens_do_eixo(banco, k):
+    """
+    Itens do k-ésimo eixo de banco.particao_eixos: um slice quando ocupam posições
+    consecutivas no banco (planilhas ordenadas por eixo), e as tabelas do banco são
+    lidas sem cópia; senão, o vetor das posições.
+    """
+    _, ordem, inicios = banco.particao_eixos
+    inicio, fim = inicios[k], inicios[k + 1]
+    # A ordem é estável: dentro do eixo as posições são crescentes
+    if ordem[fim - 1] - ordem[inicio] == fim - 1 - inicio:
+        return slice(int(ordem[inicio]), int(ordem[fim - 1]) + 1)
+    return ordem[inicio:fim]
+
+
+def administrados_do_eixo(banco, k, administrado):
+    """
+    Itens aplicados do k-ésimo eixo, relativos a itens_do_eixo(banco, k): máscara, se
+    administrado for uma máscara (n,), senão as posições dentro do eixo. Com posições,
+    custa O(itens aplicados), sem percorrer o eixo.
+    """
+    administrado = np.asarray(administrado)
+    if administrado.dtype == bool:
+        return administrado[itens_do_eixo(banco, k)]
+    administrado = administrado.astype(np.intp)
+    administrado = administrado[banco.posicao_eixo[administrado] == k]
+    return banco.posicao_particao[administrado] - banco.particao_eixos[2][k]
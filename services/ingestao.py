@@ -0,0 +1,274 @@
+"""
+Ingestão de bancos de itens a partir das planilhas exportadas (CSV ou Parquet): lê as
+colunas idItem, parA, parB, parC, idEixo e idHabilidade, valida o banco, transforma os
+parâmetros para a escala theta e grava o banco preparado no diretório de bancos
+(formato de services.armazenamento), carregado pela API na inicialização
+(TAI_DIR_BANCOS) sem recalcular nada. Uso:
+
+    python -m services.ingestao --entrada banco.csv --componente LP --id-banco LP-8-2025 \\
+        --saida bancos/
+    python -m services.ingestao --entrada banco.parquet --componente MT --eixos 1,2,3,4 \\
+        --apenas-validar
+
+O CSV pode ser separado por vírgula ou por ponto e vírgula (neste caso, com vírgula
+decimal). Parquet requer o pacote opcional pyarrow. Gravar de novo um banco com o
+mesmo idBanco e conteúdo diferente incrementa a versão; com o mesmo conteúdo, nada
+é gravado.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from services.adaptive_testing import minimo_itens_eixo
+from services.armazenamento import caminho_banco, salvar_banco
+from services.banco import criar_banco
+from utils.helpers import normalizar_componente
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depende do ambiente
+    pq = None
+
+COLUNAS = ("idItem", "parA", "parB", "parC", "idEixo", "idHabilidade")
+
+# Faixas aceitas dos parâmetros na escala SAEB: (mínimo, máximo, mínimo incluído)
+LIMITES_PARAMETROS = {
+    "parA": (0.0, 10.0, False),
+    "parB": (-1000.0, 1500.0, True),
+    "parC": (0.0, 1.0, True),
+}
+
+
+@dataclass
+class RelatorioValidacao:
+    """Problemas encontrados no banco: erros impedem a gravação, avisos não."""
+    n_itens: int = 0
+    erros: list = field(default_factory=list)
+    avisos: list = field(default_factory=list)
+    itens_por_eixo: dict = field(default_factory=dict)
+    # Linha do arquivo de cada item (None: uma por linha, depois do cabeçalho)
+    linhas: list = field(default=None, repr=False)
+
+    @property
+    def valido(self):
+        return not self.erros
+
+    def linha(self, i):
+        return i + 2 if self.linhas is None else self.linhas[i]
+
+    def resumo(self):
+        return {
+            "nItens": self.n_itens,
+            "valido": self.valido,
+            "erros": self.erros,
+            "avisos": self.avisos,
+            "itensPorEixo": self.itens_por_eixo,
+        }
+
+
+def ler_csv(caminho, max_erros_listados=20):
+    """
+    Colunas do CSV como listas de texto; detecta ";" (com vírgula decimal) ou ",".
+    Retorna (colunas, linha do arquivo de cada item, erros). Linhas em branco são
+    ignoradas; linhas com quantidade de campos diferente do cabeçalho viram erros e as
+    colunas não são montadas.
+    """
+    with open(caminho, newline="", encoding="utf-8-sig") as f:
+        cabecalho = f.readline()
+        separador = ";" if cabecalho.count(";") > cabecalho.count(",") else ","
+        f.seek(0)
+        leitor = csv.reader(f, delimiter=separador)
+        linhas = [(leitor.line_num, linha) for linha in leitor if any(v.strip() for v in linha)]
+    if not linhas:
+        return {}, [], []
+    nomes = [n.strip() for n in linhas[0][1]]
+    erradas = [(numero, len(linha)) for numero, linha in linhas[1:] if len(linha) != len(nomes)]
+    if erradas:
+        erros = [
+            f"Linha {numero} com {n} campos; o cabeçalho tem {len(nomes)}"
+            for numero, n in erradas[:max_erros_listados]
+        ]
+        if len(erradas) > max_erros_listados:
+            erros.append(f"Mais {len(erradas) - max_erros_listados} linhas com quantidade de campos errada")
+        return {}, [], erros
+    valores = list(zip(*(linha for _, linha in linhas[1:]))) or [()] * len(nomes)
+    colunas = {n: [v.strip() for v in coluna] for n, coluna in zip(nomes, valores)}
+    if separador == ";":
+        for nome in ("parA", "parB", "parC"):
+            if nome in colunas:
+                colunas[nome] = [v.replace(",", ".") for v in colunas[nome]]
+    return colunas, [numero for numero, _ in linhas[1:]], []
+
+
+def ler_parquet(caminho):
+    """Colunas do Parquet; mesmo retorno de ler_csv (sem linhas de arquivo)."""
+    if pq is None:
+        raise RuntimeError("A leitura de Parquet requer o pacote pyarrow")
+    tabela = pq.read_table(caminho, columns=[c for c in COLUNAS if c in pq.read_schema(caminho).names])
+    return {nome: tabela.column(nome).to_numpy(zero_copy_only=False) for nome in tabela.column_names}, None, []
+
+
+def ler_tabela(caminho):
+    if caminho.endswith(".parquet") or caminho.endswith(".pq"):
+        return ler_parquet(caminho)
+    return ler_csv(caminho)
+
+
+def _converter(relatorio, colunas, nome, inteiro=False):
+    """Coluna convertida em vetor (de uma vez); valores inválidos viram erros do relatório."""
+    texto = colunas[nome]
+    try:
+        valores = np.asarray(texto, dtype=np.float64)
+    except (TypeError, ValueError):
+        valores = np.full(len(texto), np.nan)
+        for i, v in enumerate(texto):
+            try:
+                valores[i] = float(v)
+            except (TypeError, ValueError):
+                relatorio.erros.append(f"{nome} inválido na linha {relatorio.linha(i)}: {v!r}")
+    if not inteiro:
+        return valores
+    inteiros = np.isfinite(valores) & (valores == np.round(valores))
+    for i in np.flatnonzero(~inteiros & ~np.isnan(valores)):
+        relatorio.erros.append(f"{nome} deve ser inteiro na linha {relatorio.linha(i)}: {texto[i]!r}")
+    return np.where(inteiros, valores, -1).astype(np.int64)
+
+
+def validar_tabela(colunas, eixos_esperados=None, min_itens_eixo=1, max_erros_listados=20, linhas=None):
+    """
+    Valida as colunas lidas e retorna (relatório, campos convertidos). Verifica colunas
+    obrigatórias, faixas dos parâmetros, idItem vazio ou repetido, habilidades em mais de
+    um eixo, eixos esperados ausentes ou com menos de min_itens_eixo itens e se o banco
+    tem itens suficientes para a regra do validEixo. linhas, se informadas, são as linhas
+    do arquivo de cada item, usadas nas mensagens.
+    """
+    relatorio = RelatorioValidacao(linhas=linhas)
+    faltando = [c for c in COLUNAS if c not in colunas]
+    if faltando:
+        relatorio.erros.append(f"Colunas ausentes: {', '.join(faltando)}")
+        return relatorio, None
+    id_item = [str(v).strip() for v in colunas["idItem"]]
+    relatorio.n_itens = n = len(id_item)
+    if n == 0:
+        relatorio.erros.append("Banco sem itens")
+        return relatorio, None
+
+    campos = {"idItem": id_item}
+    for nome in ("parA", "parB", "parC"):
+        campos[nome] = valores = _converter(relatorio, colunas, nome)
+        minimo, maximo, incluido = LIMITES_PARAMETROS[nome]
+        # NaN já foi reportado como inválido
+        fora = np.isinf(valores) | (valores > maximo) | ((valores < minimo) if incluido else (valores <= minimo))
+        for i in np.flatnonzero(fora)[:max_erros_listados]:
+            relatorio.erros.append(
+                f"{nome} fora da faixa na linha {relatorio.linha(i)} ({id_item[i]}): {colunas[nome][i]!r}"
+            )
+        if fora.sum() > max_erros_listados:
+            relatorio.erros.append(f"{nome}: mais {int(fora.sum()) - max_erros_listados} valores fora da faixa")
+    for nome in ("idEixo", "idHabilidade"):
+        campos[nome] = _converter(relatorio, colunas, nome, inteiro=True)
+
+    vazios = [relatorio.linha(i) for i, item in enumerate(id_item) if not item]
+    if vazios:
+        relatorio.erros.append(f"idItem vazio nas linhas {vazios[:max_erros_listados]}")
+    itens, contagens = np.unique(np.array(id_item), return_counts=True)
+    repetidos = [str(i) for i in itens[contagens > 1] if i]
+    if repetidos:
+        relatorio.erros.append(f"idItem repetido: {', '.join(repetidos[:max_erros_listados])}")
+
+    # Cobertura: cada habilidade pertence a um único eixo e os eixos têm itens suficientes
+    eixos, por_eixo = np.unique(campos["idEixo"], return_counts=True)
+    relatorio.itens_por_eixo = {int(e): int(c) for e, c in zip(eixos, por_eixo)}
+    pares = np.unique(np.column_stack((campos["idHabilidade"], campos["idEixo"])), axis=0)
+    habilidades, n_eixos = np.unique(pares[:, 0], return_counts=True)
+    for h in habilidades[n_eixos > 1]:
+        relatorio.erros.append(
+            f"Habilidade {int(h)} aparece em mais de um eixo: {sorted(int(e) for e in pares[pares[:, 0] == h, 1])}"
+        )
+    if eixos_esperados:
+        ausentes = sorted(set(int(e) for e in eixos_esperados) - set(relatorio.itens_por_eixo))
+        if ausentes:
+            relatorio.erros.append(f"Eixos sem itens: {ausentes}")
+        extras = sorted(set(relatorio.itens_por_eixo) - set(int(e) for e in eixos_esperados))
+        if extras:
+            relatorio.avisos.append(f"Eixos não esperados: {extras}")
+    poucos = {e: c for e, c in relatorio.itens_por_eixo.items() if c < min_itens_eixo}
+    if poucos:
+        relatorio.erros.append(f"Eixos com menos de {min_itens_eixo} itens: {poucos}")
+    necessarios = minimo_itens_eixo(len(eixos))
+    if n < necessarios:
+        relatorio.erros.append(f"O banco tem {n} itens; a regra do validEixo com {len(eixos)} eixos exige {necessarios}")
+    return relatorio, campos
+
+
+def ingerir(caminho, componente, saida=None, id_banco=None, eixos_esperados=None, min_itens_eixo=1):
+    """
+    Lê, valida e, se o banco for válido e saida for informada, grava o banco preparado.
+    Retorna o relatório (com o banco gravado e a versão, quando houver).
+    """
+    colunas, linhas, erros_leitura = ler_tabela(caminho)
+    if erros_leitura:
+        return RelatorioValidacao(erros=erros_leitura).resumo()
+    relatorio, campos = validar_tabela(colunas, eixos_esperados, min_itens_eixo, linhas=linhas)
+    resumo = relatorio.resumo()
+    if not relatorio.valido:
+        return resumo
+
+    banco = criar_banco(
+        componente=normalizar_componente(componente),
+        id_item=campos["idItem"],
+        parA=campos["parA"],
+        parB=campos["parB"],
+        parC=campos["parC"],
+        id_eixo=campos["idEixo"],
+        id_habilidade=campos["idHabilidade"],
+        id_banco=id_banco,
+    )
+    resumo.update(idBanco=banco.id, impressao=banco.impressao)
+    if saida is None:
+        return resumo
+
+    # Versão: a gravada + 1 se o conteúdo mudou; o mesmo conteúdo não é regravado
+    meta_anterior = os.path.join(caminho_banco(saida, banco.id), "meta.json")
+    if os.path.isfile(meta_anterior):
+        with open(meta_anterior, encoding="utf-8") as f:
+            anterior = json.load(f)
+        if anterior["impressao"] == banco.impressao:
+            resumo.update(versao=anterior["versao"], gravado=False)
+            return resumo
+        banco.versao = anterior["versao"] + 1
+    os.makedirs(saida, exist_ok=True)
+    resumo.update(versao=banco.versao, gravado=True, caminho=salvar_banco(banco, saida))
+    return resumo
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Valida e grava bancos de itens a partir de CSV ou Parquet")
+    parser.add_argument("--entrada", required=True, help="CSV ou .parquet com " + ", ".join(COLUNAS))
+    parser.add_argument("--componente", required=True)
+    parser.add_argument("--id-banco", help="idBanco usado no /proximo (padrão: hash do conteúdo)")
+    parser.add_argument("--saida", default=os.getenv("TAI_DIR_BANCOS"), help="diretório dos bancos (TAI_DIR_BANCOS)")
+    parser.add_argument("--eixos", help="eixos que o banco deve cobrir, separados por vírgula")
+    parser.add_argument("--min-itens-eixo", type=int, default=1, help="mínimo de itens por eixo")
+    parser.add_argument("--apenas-validar", action="store_true", help="valida sem gravar")
+    args = parser.parse_args(argv)
+    if not args.apenas_validar and not args.saida:
+        parser.error("informe --saida (ou TAI_DIR_BANCOS) ou use --apenas-validar")
+
+    resumo = ingerir(
+        args.entrada, args.componente, saida=None if args.apenas_validar else args.saida, id_banco=args.id_banco,
+        eixos_esperados=[int(e) for e in args.eixos.split(",")] if args.eixos else None,
+        min_itens_eixo=args.min_itens_eixo,
+    )
+    print(json.dumps(resumo, indent=2, ensure_ascii=False))
+    if not resumo["valido"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from services.adaptive_testing import (
+    quadratura,
+    log_posteriori_lote,
+    estimar_posteriori_lote,
+    motivo_parada_lote,
+    escala_saeb,
+    theta_proficiencia_inicial,
+    valid_eixo_contagem
+)
+from services.decisao import resposta_item, resposta_final
+from services.informacao import (
+    CRITERIO_SELECAO, BALANCEAR_EIXOS, informacao_criterio, refinar_exato, pesos_posteriori, contagem_eixos,
+    eixo_menos_representado
+)
+from services.metricas import medir, PARADAS
+from utils.helpers import validar_respostas
+
+
+@dataclass
+class EstudanteLote:
+    """Dados de um estudante já convertidos para o cálculo em lote."""
+    ano_escolar: int
+    profic_inic: float
+    n_Ij: int
+    administrado_idx: list
+    acertos: list
+
+
+def proximo_lote(banco, estudantes, detalhes=None, criterio=None, balancear=None):
+    """
+    Calcula o próximo passo de vários estudantes sobre o mesmo banco em uma única
+    passagem: EAP, critério de parada e informação (do critério de seleção) como
+    operações matriciais. Retorna uma resposta no formato do /proximo por estudante.
+    Se detalhes for uma lista, recebe theta, EP, motivo e informação de cada estudante.
+    Com balancear (padrão: TAI_BALANCEAR_EIXOS), cada estudante recebe o item do seu
+    eixo menos representado, como em selecionar_item.
+    """
+    criterio = criterio or CRITERIO_SELECAO
+    balancear = BALANCEAR_EIXOS if balancear is None else balancear
+    N = len(estudantes)
+    if N == 0:
+        return []
+
+    n_resp = np.array([len(e.acertos) for e in estudantes])
+    ano_escolar = np.array([e.ano_escolar for e in estudantes])
+    n_Ij = np.array([e.n_Ij for e in estudantes])
+
+    # Respostas na posição de cada item no banco (NaN = não respondido); antes da
+    # primeira resposta, administrado pode listar itens já vistos, sem resposta
+    U = np.full((N, banco.n_itens), np.nan)
+    administrado = np.zeros((N, banco.n_itens), dtype=bool)
+    for j, e in enumerate(estudantes):
+        validar_respostas(e.administrado_idx, e.acertos)
+        administrado[j, e.administrado_idx] = True
+        if len(e.acertos):
+            U[j, e.administrado_idx] = e.acertos
+
+    # Quem ainda não respondeu parte da proficiência inicial
+    inicio = n_resp == 0
+    theta_est = np.empty(N)
+    theta_ep = np.full(N, np.nan)
+    theta_est[inicio] = theta_proficiencia_inicial(np.array([e.profic_inic for e in estudantes])[inicio])
+
+    parar = np.zeros(N, dtype=bool)
+    motivo = np.full(N, None, dtype=object)
+    andamento = ~inicio
+    pesos = None
+    if andamento.any():
+        with medir("eap_lote"):
+            log_posteriori = log_posteriori_lote(U[andamento], banco.P_grade)
+            theta_est[andamento], theta_ep[andamento] = estimar_posteriori_lote(log_posteriori, quadratura()[0])
+            if criterio != "mfi":
+                pesos = np.empty((N, len(log_posteriori[0])))
+                pesos[andamento] = pesos_posteriori(log_posteriori)
+        with medir("criterio_parada_lote"):
+            validEixo = valid_eixo_contagem(n_resp[andamento], banco.eixos_distintos)
+            motivos = motivo_parada_lote(
+                theta_est[andamento], theta_ep[andamento], n_resp[andamento], validEixo,
+                ano_escolar[andamento], n_Ij[andamento], Area=banco.componente
+            )
+        parar[andamento] = motivos != ""
+        motivo[andamento] = np.where(parar[andamento], motivos, None)
+        for nome_motivo, n in zip(*np.unique(motivos[parar[andamento]], return_counts=True)):
+            PARADAS.inc(int(n), motivo=nome_motivo)
+
+    # Item de máxima informação para todos os que continuam; quem está no início
+    # (sem posteriori) usa a informação de Fisher na proficiência inicial
+    pos = np.full(N, -1)
+    informacao = np.full(N, np.nan)
+    continuar = ~parar
+    if continuar.any():
+        with medir("selecao_lote"):
+            if pesos is None:
+                INFO = banco.informacao(theta_est[continuar])
+            else:
+                INFO = np.empty((int(continuar.sum()), banco.n_itens))
+                com_pesos = andamento[continuar]
+                INFO[~com_pesos] = banco.informacao(theta_est[continuar & inicio])
+                INFO[com_pesos] = informacao_criterio(
+                    banco, theta_est[continuar & andamento], pesos[continuar & andamento], criterio
+                )
+            INFO[administrado[continuar]] = -np.inf
+            if balancear:
+                alvo = eixo_menos_representado(banco, contagem_eixos(banco, administrado[continuar]))
+                INFO[banco.posicao_eixo != alvo[:, None]] = -np.inf
+            # Informação de Fisher: os melhores pela tabela são comparados pela 3PL exata
+            fisher = np.ones(len(INFO), dtype=bool) if pesos is None else ~andamento[continuar]
+            if fisher.any():
+                INFO[fisher] = refinar_exato(banco, INFO[fisher], theta_est[continuar][fisher])
+            INFO[administrado[continuar]] = 0
+            pos[continuar] = np.argmax(INFO, axis=1)
+            informacao[continuar] = INFO[np.arange(len(INFO)), pos[continuar]]
+
+    theta_saeb, erro_saeb = escala_saeb(theta_est, theta_ep, banco.componente)
+
+    if detalhes is not None:
+        detalhes.extend(
+            {
+                "theta": float(theta_est[j]),
+                "ep": None if inicio[j] else float(theta_ep[j]),
+                "motivo": motivo[j],
+                "informacao": None if parar[j] else float(informacao[j]),
+            }
+            for j in range(N)
+        )
+
+    resultados = []
+    for j, e in enumerate(estudantes):
+        if inicio[j]:
+            resultados.append(resposta_item(banco, int(pos[j]), 1, str(round(e.profic_inic, 13)), "NA"))
+        elif parar[j]:
+            resultados.append(resposta_final(float(theta_saeb[j]), float(erro_saeb[j])))
+        else:
+            resultados.append(resposta_item(
+                banco, int(pos[j]), int(n_resp[j]) + 1,
+                str(round(float(theta_saeb[j]), 12)),
+                str(round(float(erro_saeb[j]), 13))
+            ))
+    return resultados
@@ -0,0 +1,220 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Limites (em segundos) dos histogramas de latência
+BUCKETS_LATENCIA = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5
+)
+
+
+def _rotulos(nomes, valores):
+    if not nomes:
+        return ""
+    pares = ",".join(f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores))
+    return "{" + pares + "}"
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome, descricao, rotulos=()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def _chave(self, rotulos):
+        return tuple(str(rotulos[n]) for n in self.rotulos)
+
+    def limpar(self):
+        with self._lock:
+            self._valores.clear()
+
+    def exportar(self):
+        linhas = [f"# HELP {self.nome} {self.descricao}", f"# TYPE {self.nome} {self.tipo}"]
+        with self._lock:
+            itens = sorted(self._valores.items())
+            linhas.extend(self._linhas(chave, valor) for chave, valor in itens)
+        return "\n".join(linhas)
+
+    def _linhas(self, chave, valor):
+        return f"{self.nome}{_rotulos(self.rotulos, chave)} {valor}"
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def inc(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def valor(self, **rotulos):
+        return self._valores.get(self._chave(rotulos), 0)
+
+    def _somar(self, valores):
+        with self._lock:
+            for chave, valor in valores.items():
+                self._valores[chave] = self._valores.get(chave, 0) + valor
+
+
+class Gauge(_Metrica):
+    tipo = "gauge"
+
+    def set(self, valor, **rotulos):
+        with self._lock:
+            self._valores[self._chave(rotulos)] = valor
+
+    def inc(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def remover(self, **rotulos):
+        with self._lock:
+            self._valores.pop(self._chave(rotulos), None)
+
+    def valor(self, **rotulos):
+        return self._valores.get(self._chave(rotulos), 0)
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nome, descricao, rotulos=(), buckets=BUCKETS_LATENCIA):
+        super().__init__(nome, descricao, rotulos)
+        self.buckets = tuple(buckets)
+
+    def observar(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        posicao = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            estado = self._valores.get(chave)
+            if estado is None:
+                estado = self._valores[chave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            estado[0][posicao] += 1
+            estado[1] += valor
+            estado[2] += 1
+
+    def _somar(self, valores):
+        with self._lock:
+            for chave, (contagens, soma, total) in valores.items():
+                estado = self._valores.get(chave)
+                if estado is None:
+                    estado = self._valores[chave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                estado[0] = [a + b for a, b in zip(estado[0], contagens)]
+                estado[1] += soma
+                estado[2] += total
+
+    def contagem(self, **rotulos):
+        estado = self._valores.get(self._chave(rotulos))
+        return estado[2] if estado else 0
+
+    def _linhas(self, chave, estado):
+        contagens, soma, total = estado
+        nomes = self.rotulos + ("le",)
+        linhas, acumulado = [], 0
+        for limite, n in zip(self.buckets + ("+Inf",), contagens):
+            acumulado += n
+            linhas.append(f"{self.nome}_bucket{_rotulos(nomes, chave + (limite,))} {acumulado}")
+        linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {soma}")
+        linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, chave)} {total}")
+        return "\n".join(linhas)
+
+
+class RegistroMetricas:
+    """Conjunto de métricas exportadas no formato texto do Prometheus."""
+
+    def __init__(self):
+        self._metricas = []
+
+    def _adicionar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def contador(self, nome, descricao, rotulos=()):
+        return self._adicionar(Contador(nome, descricao, rotulos))
+
+    def gauge(self, nome, descricao, rotulos=()):
+        return self._adicionar(Gauge(nome, descricao, rotulos))
+
+    def histograma(self, nome, descricao, rotulos=(), buckets=BUCKETS_LATENCIA):
+        return self._adicionar(Histograma(nome, descricao, rotulos, buckets))
+
+    def exportar(self):
+        return "\n".join(m.exportar() for m in self._metricas) + "\n"
+
+    def extrair(self):
+        """
+        Valores acumulados dos contadores e histogramas, que são zerados em seguida.
+        Usado nos processos do pool de execução para devolver ao processo principal
+        o que foi registrado em cada cálculo (gauges descrevem o próprio processo e ficam).
+        """
+        extraidos = []
+        for metrica in self._metricas:
+            if isinstance(metrica, (Contador, Histograma)):
+                with metrica._lock:
+                    if metrica._valores:
+                        extraidos.append((metrica.nome, metrica._valores))
+                        metrica._valores = {}
+        return extraidos
+
+    def incorporar(self, extraidos):
+        """Soma os valores extraídos em outro processo (ver extrair) às métricas deste."""
+        por_nome = {m.nome: m for m in self._metricas}
+        for nome, valores in extraidos:
+            if nome in por_nome:
+                por_nome[nome]._somar(valores)
+
+
+metricas = RegistroMetricas()
+
+DURACAO_ETAPA = metricas.histograma(
+    "tai_etapa_duracao_segundos", "Duração de cada etapa do cálculo do próximo item", ("etapa",)
+)
+REQUISICOES = metricas.contador(
+    "tai_requisicoes_total", "Requisições de próximo item por rota, componente e ano escolar",
+    ("rota", "componente", "ano_escolar")
+)
+PARADAS = metricas.contador(
+    "tai_paradas_total", "Testes encerrados por motivo do critério de parada", ("motivo",)
+)
+ITENS_BANCO = metricas.gauge(
+    "tai_banco_itens", "Número de itens de cada banco registrado", ("banco",)
+)
+BANCOS_REGISTRADOS = metricas.gauge(
+    "tai_bancos_registrados", "Número de bancos registrados em memória"
+)
+SESSOES_ATIVAS = metricas.gauge(
+    "tai_sessoes_ativas", "Número de sessões de teste em memória"
+)
+
+
+# Perfil da requisição em andamento (services.perfil). Só é consultado quando a
+# coleta de perfis está ativa, para não custar nada quando está desligada.
+PERFIL_ATUAL = ContextVar("perfil_atual", default=None)
+coletando_perfis = False
+
+
+@contextmanager
+def medir(etapa):
+    """Registra a duração do bloco no histograma de etapas (e no perfil da requisição)."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        DURACAO_ETAPA.observar(duracao, etapa=etapa)
+        if coletando_perfis:
+            perfil = PERFIL_ATUAL.get()
+            if perfil is not None:
+                perfil.registrar_etapa(etapa, duracao)
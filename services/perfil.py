@@ -0,0 +1,155 @@
+"""
+Perfis de requisições individuais, sob demanda. Uma requisição é perfilada quando traz
+o cabeçalho X-TAI-Perfil (se TAI_PERFIL_HEADER=1) ou é sorteada pela taxa de amostragem
+TAI_PERFIL_AMOSTRA. O perfil guarda a duração de cada etapa medida com
+services.metricas.medir e, opcionalmente, o relatório do cProfile da requisição
+(cabeçalho "X-TAI-Perfil: cprofile" ou TAI_PERFIL_CPROFILE=1 para as amostradas).
+
+Os perfis mais recentes ficam em memória e são consultados em /debug/perfis. Com a
+coleta desligada, o middleware não é instalado e medir não consulta o perfil.
+"""
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from services import metricas as _metricas
+from services.metricas import PERFIL_ATUAL
+
+CABECALHO_PERFIL = "X-TAI-Perfil"
+CABECALHO_ID_PERFIL = "X-TAI-Perfil-Id"
+
+
+class PerfilRequisicao:
+    """Etapas cronometradas (e cProfile, se pedido) de uma única requisição."""
+
+    def __init__(self, rota, com_cprofile=False):
+        self.id = uuid.uuid4().hex[:16]
+        self.rota = rota
+        self.inicio = time.time()
+        self.duracao = None
+        self.status = None
+        self.etapas = {}
+        self.com_cprofile = com_cprofile
+        self.cprofile = None
+
+    def registrar_etapa(self, etapa, duracao):
+        n, total = self.etapas.get(etapa, (0, 0.0))
+        self.etapas[etapa] = (n + 1, total + duracao)
+
+    def resumo(self):
+        return {
+            "id": self.id,
+            "rota": self.rota,
+            "inicio": round(self.inicio, 3),
+            "duracaoMs": None if self.duracao is None else 1000 * self.duracao,
+            "status": self.status,
+            "etapas": {e: {"n": n, "totalMs": 1000 * t} for e, (n, t) in self.etapas.items()},
+            "cprofile": self.cprofile is not None,
+        }
+
+
+class ColetorPerfis:
+    """Decide quais requisições perfilar e guarda os max_perfis perfis mais recentes."""
+
+    def __init__(self, aceitar_cabecalho=False, amostra=0.0, cprofile_amostras=False, max_perfis=100,
+                 linhas_cprofile=40):
+        self.aceitar_cabecalho = aceitar_cabecalho
+        self.amostra = amostra
+        self.cprofile_amostras = cprofile_amostras
+        self.max_perfis = max_perfis
+        self.linhas_cprofile = linhas_cprofile
+        self._perfis = OrderedDict()
+        self._lock = threading.Lock()
+        # O cProfile só pode estar ativo uma vez por vez no processo
+        self._cprofile_livre = threading.Lock()
+
+    @property
+    def ativo(self):
+        return self.aceitar_cabecalho or self.amostra > 0
+
+    def ativar(self):
+        _metricas.coletando_perfis = self.ativo
+        return self
+
+    def escolher(self, cabecalho):
+        """None se a requisição não deve ser perfilada; senão, se deve usar o cProfile."""
+        if self.aceitar_cabecalho and cabecalho:
+            return cabecalho.strip().lower() == "cprofile"
+        if self.amostra > 0 and random.random() < self.amostra:
+            return self.cprofile_amostras
+        return None
+
+    @contextmanager
+    def perfilar(self, rota, com_cprofile=False):
+        perfil = PerfilRequisicao(rota, com_cprofile)
+        token = PERFIL_ATUAL.set(perfil)
+        perfilador = None
+        if com_cprofile and self._cprofile_livre.acquire(blocking=False):
+            perfilador = cProfile.Profile()
+            perfilador.enable()
+        inicio = time.perf_counter()
+        try:
+            yield perfil
+        finally:
+            perfil.duracao = time.perf_counter() - inicio
+            if perfilador is not None:
+                perfilador.disable()
+                self._cprofile_livre.release()
+                perfil.cprofile = self._relatorio_cprofile(perfilador)
+            PERFIL_ATUAL.reset(token)
+            self._guardar(perfil)
+
+    def _relatorio_cprofile(self, perfilador):
+        saida = io.StringIO()
+        pstats.Stats(perfilador, stream=saida).sort_stats("cumulative").print_stats(self.linhas_cprofile)
+        return saida.getvalue()
+
+    def _guardar(self, perfil):
+        with self._lock:
+            self._perfis[perfil.id] = perfil
+            while len(self._perfis) > self.max_perfis:
+                self._perfis.popitem(last=False)
+
+    def obter(self, id_perfil):
+        return self._perfis.get(id_perfil)
+
+    def listar(self):
+        with self._lock:
+            return [p.resumo() for p in reversed(self._perfis.values())]
+
+    def limpar(self):
+        with self._lock:
+            self._perfis.clear()
+
+
+def perfil_com_cprofile():
+    """Se a requisição atual está sob cProfile (o cálculo deve rodar na mesma thread)."""
+    perfil = PERFIL_ATUAL.get() if _metricas.coletando_perfis else None
+    return perfil is not None and perfil.com_cprofile
+
+
+async def middleware_perfil(request, call_next):
+    """Middleware HTTP instalado só quando a coleta de perfis está ativa."""
+    com_cprofile = perfis.escolher(request.headers.get(CABECALHO_PERFIL))
+    if com_cprofile is None:
+        return await call_next(request)
+    with perfis.perfilar(request.url.path, com_cprofile) as perfil:
+        resposta = await call_next(request)
+        perfil.status = resposta.status_code
+    resposta.headers[CABECALHO_ID_PERFIL] = perfil.id
+    return resposta
+
+
+perfis = ColetorPerfis(
+    aceitar_cabecalho=os.getenv("TAI_PERFIL_HEADER", "0") == "1",
+    amostra=float(os.getenv("TAI_PERFIL_AMOSTRA", "0")),
+    cprofile_amostras=os.getenv("TAI_PERFIL_CPROFILE", "0") == "1",
+    max_perfis=int(os.getenv("TAI_MAX_PERFIS", "100")),
+).ativar()
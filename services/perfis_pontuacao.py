@@ -0,0 +1,210 @@
+"""
+Perfis de pontuação por componente e ano escolar: escala SAEB (inclinação e
+intercepto), pontos de corte dos níveis, limiar do EP e número mínimo/máximo de itens
+do critério de parada.
+
+Os perfis vêm de um arquivo JSON (TAI_ARQUIVO_PERFIS; padrão: perfis_pontuacao.json
+ao lado deste módulo), lido uma vez na inicialização e compilado em vetores NumPy
+indexados pelo ano escolar, para que a conversão de escala e o critério de parada
+sejam avaliados para muitos estudantes de uma vez. A cada TAI_INTERVALO_PERFIS
+segundos (0 desativa), o arquivo é verificado e, se mudou, recarregado em cada
+processo, sem reiniciar os workers. Um arquivo inválido não substitui os perfis
+em uso.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from services.metricas import metricas
+
+ARQUIVO_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "perfis_pontuacao.json")
+
+RECARGAS_PERFIS = metricas.contador(
+    "tai_perfis_recargas_total", "Recargas do arquivo de perfis de pontuação por resultado", ("resultado",)
+)
+
+# Parâmetros do critério de parada que podem ser definidos por componente ou ano
+CAMPOS_PARADA = {"ep": "ep", "nMin": "n_min", "nMinEp": "n_min_ep", "nMax": "n_max"}
+
+
+@dataclass(frozen=True)
+class PerfilAno:
+    """Perfil de um componente em um ano escolar."""
+    inclinacao: float
+    intercepto: float
+    pontos_corte: np.ndarray
+    ep: float
+    n_min: int
+    n_min_ep: int
+    n_max: int
+
+
+class PerfilComponente:
+    """
+    Perfis de um componente. Além do PerfilAno de cada ano, guarda os mesmos valores
+    em vetores com uma linha por ano (e uma última linha para anos sem perfil), com os
+    pontos de corte completados com NaN quando os anos têm quantidades diferentes.
+    """
+
+    def __init__(self, inclinacao, intercepto, anos, padrao):
+        if not inclinacao > 0:
+            raise ValueError(f"Inclinação da escala deve ser positiva: {inclinacao}")
+        self.inclinacao = float(inclinacao)
+        self.intercepto = float(intercepto)
+        self.sem_ano = PerfilAno(self.inclinacao, self.intercepto, np.empty(0), **padrao)
+        self.anos = {}
+        for ano, dados in anos.items():
+            pontos_corte = np.asarray(dados.get("pontosCorte", []), dtype=float)
+            if np.any(np.diff(pontos_corte) < 0):
+                raise ValueError(f"Pontos de corte fora de ordem no ano {ano}")
+            parada = dict(padrao, **{CAMPOS_PARADA[k]: v for k, v in dados.items() if k in CAMPOS_PARADA})
+            self.anos[int(ano)] = PerfilAno(self.inclinacao, self.intercepto, pontos_corte, **parada)
+
+        perfis = [self.anos[a] for a in sorted(self.anos)] + [self.sem_ano]
+        self._anos = np.array(sorted(self.anos), dtype=np.int64)
+        n_cortes = max(len(p.pontos_corte) for p in perfis)
+        self.pontos_corte = np.full((len(perfis), n_cortes), np.nan)
+        for i, p in enumerate(perfis):
+            self.pontos_corte[i, :len(p.pontos_corte)] = p.pontos_corte
+        self.ep = np.array([p.ep for p in perfis], dtype=float)
+        self.n_min = np.array([p.n_min for p in perfis], dtype=np.int64)
+        self.n_min_ep = np.array([p.n_min_ep for p in perfis], dtype=np.int64)
+        self.n_max = np.array([p.n_max for p in perfis], dtype=np.int64)
+
+    def perfil(self, ano):
+        return self.anos.get(int(ano), self.sem_ano)
+
+    def linhas(self, anos):
+        """Linha dos vetores de cada ano escolar (a última para anos sem perfil)."""
+        anos = np.asarray(anos, dtype=np.int64)
+        pos = np.searchsorted(self._anos, anos)
+        encontrado = pos < len(self._anos)
+        encontrado[encontrado] = self._anos[pos[encontrado]] == anos[encontrado]
+        return np.where(encontrado, pos, len(self._anos))
+
+
+class PerfisPontuacao:
+    """Perfis compilados a partir da configuração (dicionário lido do JSON)."""
+
+    def __init__(self, config):
+        padrao = {CAMPOS_PARADA[k]: v for k, v in config.get("padrao", {}).items()}
+        self.componentes = {}
+        for nome, dados in config["componentes"].items():
+            padrao_componente = dict(padrao, **{CAMPOS_PARADA[k]: v for k, v in dados.items() if k in CAMPOS_PARADA})
+            self.componentes[nome] = PerfilComponente(
+                dados["inclinacao"], dados["intercepto"], dados.get("anos", {}), padrao_componente
+            )
+        # Componentes sem perfil: escala do componente padrão e nenhum ponto de corte
+        base = self.componentes[config["componentePadrao"]]
+        self._desconhecido = PerfilComponente(base.inclinacao, base.intercepto, {}, padrao)
+        self.componente_profic_inicial = config.get("componenteProficInicial", config["componentePadrao"])
+        self.impressao = hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+
+    @classmethod
+    def de_arquivo(cls, caminho):
+        with open(caminho, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def componente(self, nome):
+        return self.componentes.get(nome, self._desconhecido)
+
+    def perfil(self, componente, ano):
+        return self.componente(componente).perfil(ano)
+
+    def transformar(self, PAR, componente):
+        """parA e parB da escala SAEB para a escala theta (no próprio PAR)."""
+        inclinacao, intercepto = self.escala(componente)
+        PAR[:, 0] = PAR[:, 0] * inclinacao
+        PAR[:, 1] = (PAR[:, 1] - intercepto) / inclinacao
+        return PAR
+
+    def escala(self, componente):
+        """(inclinação, intercepto) usados por transformar nos parâmetros do componente."""
+        if componente not in self.componentes:
+            raise ValueError(f"Componente desconhecido: {componente}")
+        perfil = self.componentes[componente]
+        return perfil.inclinacao, perfil.intercepto
+
+    def escala_saeb(self, theta, ep, componente):
+        """theta e EP (escalares ou vetores) na escala SAEB do componente."""
+        perfil = self.componente(componente)
+        return theta * perfil.inclinacao + perfil.intercepto, ep * perfil.inclinacao
+
+    def theta_da_escala(self, valor_saeb, componente):
+        perfil = self.componente(componente)
+        return (valor_saeb - perfil.intercepto) / perfil.inclinacao
+
+    def theta_inicial(self, profic_inic):
+        """Proficiência inicial (escala SAEB) em theta, sempre na escala de componenteProficInicial."""
+        return self.theta_da_escala(profic_inic, self.componente_profic_inicial)
+
+
+class RegistroPerfis:
+    """Perfis em uso e recarga do arquivo quando ele muda."""
+
+    def __init__(self, caminho=ARQUIVO_PADRAO, intervalo=5.0):
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self._lock = threading.Lock()
+        self._assinatura = None
+        self._verificado = time.monotonic()
+        self._perfis = None
+        self.carregar()
+
+    def carregar(self, caminho=None):
+        """Lê e compila o arquivo (levanta erro se for inválido) e passa a usá-lo."""
+        caminho = caminho or self.caminho
+        assinatura = self._assinatura_arquivo(caminho)
+        perfis = PerfisPontuacao.de_arquivo(caminho)
+        with self._lock:
+            self.caminho, self._perfis, self._assinatura = caminho, perfis, assinatura
+            self._verificado = time.monotonic()
+        return perfis
+
+    @staticmethod
+    def _assinatura_arquivo(caminho):
+        estado = os.stat(caminho)
+        return estado.st_mtime_ns, estado.st_size
+
+    @property
+    def atual(self):
+        if self.intervalo > 0 and time.monotonic() - self._verificado >= self.intervalo:
+            self._verificar()
+        return self._perfis
+
+    def _verificar(self):
+        with self._lock:
+            if time.monotonic() - self._verificado < self.intervalo:
+                return
+            self._verificado = time.monotonic()
+            try:
+                mudou = self._assinatura_arquivo(self.caminho) != self._assinatura
+            except OSError:
+                RECARGAS_PERFIS.inc(resultado="erro")
+                return
+        if mudou:
+            try:
+                self.carregar()
+                RECARGAS_PERFIS.inc(resultado="ok")
+            except (OSError, ValueError, KeyError, TypeError):
+                # Mantém os perfis em uso; a assinatura nova evita tentar de novo até a próxima mudança
+                with self._lock:
+                    self._assinatura = self._assinatura_arquivo_ou_none()
+                RECARGAS_PERFIS.inc(resultado="erro")
+
+    def _assinatura_arquivo_ou_none(self):
+        try:
+            return self._assinatura_arquivo(self.caminho)
+        except OSError:
+            return None
+
+
+perfis_pontuacao = RegistroPerfis(
+    caminho=os.getenv("TAI_ARQUIVO_PERFIS") or ARQUIVO_PADRAO,
+    intervalo=float(os.getenv("TAI_INTERVALO_PERFIS", "5")),
+)
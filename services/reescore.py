@@ -0,0 +1,257 @@
+"""
+Reescore em massa de testes concluídos: recalcula a proficiência final (a mesma que o
+/proximo retorna na parada) de muitos padrões de resposta, por exemplo após uma
+recalibração do banco, sem passar pela API. Uso:
+
+    python -m services.reescore --entrada testes.jsonl --banco banco.csv --componente LP \\
+        --saida proficiencias.csv
+    python -m services.reescore --entrada testes.csv --dir-bancos bancos/ --processos 8
+
+Cada teste (linha do JSONL ou do CSV) traz ESTUDANTE, administrado e respostas +
+gabarito (ou acertos), nos mesmos formatos do /proximo, e o idBanco quando há mais de
+um banco (--dir-bancos, ver services.armazenamento). Os testes são lidos em fluxo,
+agrupados por banco e componente em blocos de --bloco testes, pontuados em um pool de
+processos e gravados à medida que ficam prontos: a memória usada depende do tamanho dos
+blocos, não do arquivo. A ordem da saída não é a da entrada.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+from services.adaptive_testing import quadratura, estimar_posteriori_lote, escala_saeb
+from utils.helpers import ler_respostas
+
+CAMPOS_SAIDA = ("ESTUDANTE", "idBanco", "componente", "nResp", "theta", "ep", "proficiencia", "erroPadrao", "erro")
+
+
+def ler_testes(caminho):
+    """Testes concluídos, um dicionário por vez, de um JSONL ou CSV ("-" = stdin JSONL)."""
+    if caminho == "-":
+        arquivo = sys.stdin
+    else:
+        arquivo = open(caminho, newline="", encoding="utf-8")
+    try:
+        if caminho.endswith(".csv"):
+            yield from csv.DictReader(arquivo)
+        else:
+            for linha in arquivo:
+                if linha.strip():
+                    yield json.loads(linha)
+    finally:
+        if arquivo is not sys.stdin:
+            arquivo.close()
+
+
+def pontuar_bloco(banco, testes):
+    """
+    EAP final de um bloco de testes do mesmo banco. A log-verossimilhança é somada só
+    sobre os itens respondidos de cada teste (sem matriz estudantes x itens do banco).
+    Retorna um dicionário de saída por teste, na ordem recebida.
+    """
+    Xr, log_priori = quadratura()
+    P = np.clip(banco.P_grade, np.finfo(float).tiny, 1 - np.finfo(float).eps)
+
+    saidas, posicoes, acertos, tamanhos, validos = [], [], [], [], []
+    for teste in testes:
+        saida = {"ESTUDANTE": teste.get("ESTUDANTE"), "idBanco": banco.id, "componente": banco.componente}
+        try:
+            administrado, corrigidas = ler_respostas(teste)
+            if len(administrado) != len(corrigidas):
+                raise ValueError("administrado e respostas devem ter o mesmo tamanho")
+            posicoes.append(banco.indices(administrado))
+            acertos.append(np.asarray(corrigidas, dtype=bool))
+            tamanhos.append(len(administrado))
+            validos.append(len(saidas))
+            saida["nResp"] = len(administrado)
+        except Exception as e:
+            saida["erro"] = str(e)
+        saidas.append(saida)
+
+    if validos:
+        log_posteriori = np.tile(log_priori, (len(validos), 1))
+        tamanhos = np.array(tamanhos)
+        com_respostas = np.flatnonzero(tamanhos > 0)
+        if len(com_respostas):
+            idx = np.concatenate([posicoes[j] for j in com_respostas]).astype(int)
+            u = np.concatenate([acertos[j] for j in com_respostas])
+            # Uma coluna por resposta (q x total de respostas), somadas por teste
+            contribuicao = np.where(u, np.log(P[:, idx]), np.log1p(-P[:, idx]))
+            inicios = np.concatenate(([0], np.cumsum(tamanhos[com_respostas])[:-1]))
+            log_posteriori[com_respostas] += np.add.reduceat(contribuicao, inicios, axis=1).T
+        theta, ep = estimar_posteriori_lote(log_posteriori, Xr)
+        theta_saeb, erro_saeb = escala_saeb(theta, ep, banco.componente)
+        for k, j in enumerate(validos):
+            saidas[j].update({
+                "theta": float(theta[k]),
+                "ep": float(ep[k]),
+                "proficiencia": round(float(theta_saeb[k]), 4),
+                "erroPadrao": round(float(erro_saeb[k]), 4),
+            })
+    return saidas
+
+
+class FonteBancos:
+    """Bancos do reescore: os informados diretamente e os gravados em um diretório."""
+
+    def __init__(self, bancos=None, diretorio=None):
+        self.bancos = dict(bancos or {})
+        self.diretorio = diretorio
+        self._mapeados = {}
+
+    def obter(self, id_banco):
+        if id_banco in self.bancos:
+            return self.bancos[id_banco]
+        if id_banco not in self._mapeados and self.diretorio:
+            from services.armazenamento import carregar_id
+            self._mapeados[id_banco] = carregar_id(self.diretorio, id_banco)
+        return self._mapeados.get(id_banco)
+
+    def __getstate__(self):
+        # Os bancos do diretório são mapeados de novo em cada processo
+        return {"bancos": self.bancos, "diretorio": self.diretorio, "_mapeados": {}}
+
+
+_fonte_processo = None
+
+
+def _iniciar_processo(fonte):
+    global _fonte_processo
+    _fonte_processo = fonte
+    for banco in fonte.bancos.values():
+        banco.preparar()
+
+
+def _pontuar_no_processo(args):
+    id_banco, testes = args
+    banco = _fonte_processo.obter(id_banco)
+    if banco is None:
+        return [{"ESTUDANTE": t.get("ESTUDANTE"), "idBanco": id_banco, "erro": f"Banco não encontrado: {id_banco}"}
+                for t in testes]
+    return pontuar_bloco(banco, testes)
+
+
+def blocos(testes, tamanho_bloco, id_padrao=None):
+    """
+    Agrupa o fluxo de testes por banco (e, portanto, componente) em blocos de até
+    tamanho_bloco testes. Guarda no máximo um bloco incompleto por banco.
+    """
+    pendentes = {}
+    for teste in testes:
+        id_banco = teste.get("idBanco") or id_padrao
+        bloco = pendentes.setdefault(id_banco, [])
+        bloco.append(teste)
+        if len(bloco) >= tamanho_bloco:
+            yield id_banco, pendentes.pop(id_banco)
+    yield from pendentes.items()
+
+
+class EscritorSaida:
+    """Grava os resultados em JSONL ou, se o arquivo terminar em .csv, em CSV."""
+
+    def __init__(self, caminho=None):
+        self.arquivo = open(caminho, "w", newline="", encoding="utf-8") if caminho else sys.stdout
+        self.csv = None
+        if caminho and caminho.endswith(".csv"):
+            self.csv = csv.DictWriter(self.arquivo, CAMPOS_SAIDA, extrasaction="ignore")
+            self.csv.writeheader()
+
+    def gravar(self, saidas):
+        if self.csv is not None:
+            self.csv.writerows(saidas)
+        else:
+            self.arquivo.writelines(json.dumps(s, ensure_ascii=False) + "\n" for s in saidas)
+
+    def fechar(self):
+        if self.arquivo is not sys.stdout:
+            self.arquivo.close()
+
+
+def reescorar(testes, fonte, escritor, tamanho_bloco=2000, processos=None, id_padrao=None):
+    """
+    Pontua todos os testes e grava os resultados. Com processos=1, roda no próprio
+    processo; senão, mantém no máximo 2 blocos por processo em andamento. Retorna o
+    relatório de vazão.
+    """
+    inicio = time.perf_counter()
+    total, erros, por_banco = 0, 0, {}
+
+    def registrar(saidas):
+        nonlocal total, erros
+        escritor.gravar(saidas)
+        total += len(saidas)
+        for s in saidas:
+            erros += "erro" in s
+            por_banco[s["idBanco"]] = por_banco.get(s["idBanco"], 0) + 1
+
+    tarefas = blocos(testes, tamanho_bloco, id_padrao)
+    if processos == 1:
+        _iniciar_processo(fonte)
+        for tarefa in tarefas:
+            registrar(_pontuar_no_processo(tarefa))
+    else:
+        processos = processos or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_processo, initargs=(fonte,)) as pool:
+            em_andamento = set()
+            for tarefa in tarefas:
+                if len(em_andamento) >= 2 * processos:
+                    prontos, em_andamento = wait(em_andamento, return_when=FIRST_COMPLETED)
+                    for futuro in prontos:
+                        registrar(futuro.result())
+                em_andamento.add(pool.submit(_pontuar_no_processo, tarefa))
+            for futuro in em_andamento:
+                registrar(futuro.result())
+
+    duracao = time.perf_counter() - inicio
+    return {
+        "testes": total,
+        "erros": erros,
+        "porBanco": por_banco,
+        "duracaoSeg": duracao,
+        "testesPorSeg": total / duracao if duracao else None,
+    }
+
+
+def main(argv=None):
+    from services.banco import banco_de_csv
+
+    parser = argparse.ArgumentParser(description="Reescore em massa de testes concluídos")
+    parser.add_argument("--entrada", required=True, help="JSONL ou CSV dos testes (- = stdin)")
+    parser.add_argument("--saida", help="JSONL ou .csv dos resultados (padrão: stdout)")
+    parser.add_argument("--banco", help="CSV do banco usado pelos testes sem idBanco")
+    parser.add_argument("--componente", help="componente do --banco")
+    parser.add_argument("--id-banco", help="idBanco do --banco (padrão: hash do conteúdo)")
+    parser.add_argument("--dir-bancos", default=os.getenv("TAI_DIR_BANCOS"),
+                        help="diretório de bancos gravados (services.armazenamento)")
+    parser.add_argument("--bloco", type=int, default=2000, help="testes por tarefa")
+    parser.add_argument("--processos", type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    bancos, id_padrao = {}, None
+    if args.banco:
+        if not args.componente:
+            parser.error("--componente é obrigatório com --banco")
+        banco = banco_de_csv(args.banco, args.componente, id_banco=args.id_banco)
+        bancos[banco.id] = banco
+        id_padrao = banco.id
+    elif not args.dir_bancos:
+        parser.error("informe --banco ou --dir-bancos")
+
+    escritor = EscritorSaida(args.saida)
+    try:
+        relatorio = reescorar(
+            ler_testes(args.entrada), FonteBancos(bancos, args.dir_bancos), escritor,
+            tamanho_bloco=args.bloco, processos=args.processos, id_padrao=id_padrao
+        )
+    finally:
+        escritor.fechar()
+    print(json.dumps(relatorio, indent=2, ensure_ascii=False), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from services.adaptive_testing import quadratura, estimar_posteriori, valid_eixo_contagem
+from services.banco import na_escala_atual
+from services.decisao import primeiro_item, proximo_passo
+from services.informacao import CRITERIO_SELECAO, pesos_posteriori, contagem_eixos
+from services.metricas import medir, SESSOES_ATIVAS
+
+
+class RespostaConflitante(Exception):
+    """A resposta não é ao item atual da sessão (repetida, fora de ordem ou sessão já finalizada)."""
+
+
+@dataclass(eq=False)
+class SessaoTeste:
+    """
+    Estado de um teste adaptativo em andamento. A posteriori é mantida em escala
+    log sobre os nós da quadratura e atualizada em O(q) a cada resposta.
+    """
+    id: str
+    banco: object
+    ano_escolar: int
+    profic_inic: float
+    n_Ij: int
+    estudante: str = ""
+    log_posteriori: np.ndarray = field(default=None, repr=False)
+    administrado: np.ndarray = field(default=None, repr=False)
+    ordem: list = field(default_factory=list)
+    acertos: list = field(default_factory=list)
+    contagem_eixo: np.ndarray = field(default=None, repr=False)
+    item_atual: int = None
+    resultado: list = None
+    finalizada: bool = False
+    ultimo_acesso: float = field(default_factory=time.monotonic)
+    # Respostas simultâneas à mesma sessão são aplicadas uma de cada vez
+    _lock: threading.Lock = field(default_factory=threading.Lock, init=False, repr=False)
+
+    def __post_init__(self):
+        _, log_priori = quadratura()
+        self.log_posteriori = log_priori.copy()
+        self.administrado = np.zeros(self.banco.n_itens, dtype=bool)
+        # Itens aplicados por eixo (ordem de banco.particao_eixos), mantidos a cada resposta
+        self.contagem_eixo = contagem_eixos(self.banco, self.administrado)
+
+    @property
+    def n_resp(self):
+        return len(self.ordem)
+
+    @property
+    def tamanho_bytes(self):
+        """Estimativa da memória ocupada pela sessão."""
+        return (
+            self.log_posteriori.nbytes + self.administrado.nbytes + self.contagem_eixo.nbytes
+            + 96 * len(self.ordem) + 512
+        )
+
+    def iniciar(self, detalhes=None):
+        self.resultado = primeiro_item(self.banco, self.profic_inic, [], detalhes=detalhes)
+        self.item_atual = int(self.resultado[2])
+        return self.resultado
+
+    def responder(self, acerto, detalhes=None, id_item=None):
+        """
+        Registra a resposta ao item atual e decide o próximo passo. id_item, se informado,
+        é o item que o estudante respondeu: se não for o atual (um reenvio da resposta
+        anterior, por exemplo), levanta RespostaConflitante sem alterar a sessão.
+        detalhes (opcional) recebe os valores da auditoria, como em proximo_passo.
+
+        Retorna o resultado e a variação de tamanho_bytes, medida com a sessão bloqueada.
+        """
+        with self._lock:
+            if self.finalizada:
+                raise RespostaConflitante("Sessão já finalizada")
+            if not na_escala_atual(self.banco):
+                # A posteriori foi acumulada na escala anterior: não há como continuar
+                raise ValueError("Os perfis de pontuação do componente mudaram durante a sessão; inicie uma nova")
+            pos = self.item_atual
+            if id_item is not None and id_item != self.banco.id_item[pos]:
+                raise RespostaConflitante(
+                    f"Resposta ao item {id_item}, mas o item atual da sessão é {self.banco.id_item[pos]}"
+                )
+            tamanho_anterior = self.tamanho_bytes
+            with medir("eap_incremental"):
+                # Evita log(0) quando a probabilidade satura, como em log_verossimilhanca
+                P = np.clip(self.banco.grade([pos])[:, 0], np.finfo(float).tiny, 1 - np.finfo(float).eps)
+                self.log_posteriori += np.log(P) if acerto else np.log1p(-P)
+                theta_est, theta_ep = self.estimativa()
+            self.administrado[pos] = True
+            self.ordem.append(pos)
+            self.acertos.append(int(acerto))
+            self.contagem_eixo[self.banco.posicao_eixo[pos]] += 1
+
+            validEixo = valid_eixo_contagem(self.n_resp, self.banco.eixos_distintos)
+            # pwi e kl reutilizam a posteriori já mantida pela sessão
+            pesos = None if CRITERIO_SELECAO == "mfi" else pesos_posteriori(self.log_posteriori)
+            self.resultado = proximo_passo(
+                self.banco, theta_est, theta_ep, self.administrado,
+                n_resp=self.n_resp, AnoEscolar=self.ano_escolar, n_Ij=self.n_Ij, validEixo=validEixo,
+                detalhes=detalhes, pesos=pesos, contagem=self.contagem_eixo
+            )
+            if self.resultado[0] == -1:
+                self.finalizada = True
+                self.item_atual = None
+            else:
+                self.item_atual = int(self.resultado[2])
+            return self.resultado, self.tamanho_bytes - tamanho_anterior
+
+    def estimativa(self):
+        Xr, _ = quadratura()
+        return estimar_posteriori(self.log_posteriori, Xr)
+
+
+class ArmazemSessoes:
+    """
+    Sessões em memória com limite de quantidade e de bytes, expiração por
+    inatividade (TTL) e descarte LRU.
+    """
+
+    def __init__(self, max_sessoes=100_000, max_bytes=256 * 1024 * 1024, ttl=3 * 60 * 60):
+        self.max_sessoes = max_sessoes
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sessoes = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def criar(self, banco, ano_escolar, profic_inic, n_Ij, estudante=""):
+        sessao = SessaoTeste(
+            id=uuid.uuid4().hex, banco=banco, ano_escolar=ano_escolar,
+            profic_inic=profic_inic, n_Ij=n_Ij, estudante=estudante
+        )
+        with self._lock:
+            self._sessoes[sessao.id] = sessao
+            self._bytes += sessao.tamanho_bytes
+            SESSOES_ATIVAS.inc()
+            self._limpar()
+        return sessao
+
+    def obter(self, id_sessao):
+        with self._lock:
+            sessao = self._sessoes.get(id_sessao)
+            if sessao is None:
+                return None
+            if time.monotonic() - sessao.ultimo_acesso > self.ttl:
+                self._descartar(id_sessao)
+                return None
+            sessao.ultimo_acesso = time.monotonic()
+            self._sessoes.move_to_end(id_sessao)
+            return sessao
+
+    def atualizar(self, sessao, variacao):
+        """Ajusta a contabilidade de memória após a sessão crescer variacao bytes (ver SessaoTeste.responder)."""
+        with self._lock:
+            if sessao.id in self._sessoes:
+                self._bytes += variacao
+                self._limpar()
+
+    def remover(self, id_sessao):
+        with self._lock:
+            return self._descartar(id_sessao) is not None
+
+    def _descartar(self, id_sessao):
+        sessao = self._sessoes.pop(id_sessao, None)
+        if sessao is not None:
+            self._bytes -= sessao.tamanho_bytes
+            SESSOES_ATIVAS.inc(-1)
+        return sessao
+
+    def _limpar(self):
+        # As sessões menos usadas ficam no início; as expiradas estão entre elas
+        agora = time.monotonic()
+        while self._sessoes:
+            id_sessao, sessao = next(iter(self._sessoes.items()))
+            if agora - sessao.ultimo_acesso <= self.ttl:
+                break
+            self._descartar(id_sessao)
+        while self._sessoes and (len(self._sessoes) > self.max_sessoes or self._bytes > self.max_bytes):
+            self._descartar(next(iter(self._sessoes)))
+
+    def __len__(self):
+        return len(self._sessoes)
+
+    def __contains__(self, id_sessao):
+        return id_sessao in self._sessoes
+
+    @property
+    def bytes_em_uso(self):
+        return self._bytes
+
+
+armazem_sessoes = ArmazemSessoes(
+    max_sessoes=int(os.getenv("TAI_MAX_SESSOES", "100000")),
+    max_bytes=int(os.getenv("TAI_MAX_BYTES_SESSOES", str(256 * 1024 * 1024))),
+    ttl=float(os.getenv("TAI_TTL_SESSAO", str(3 * 60 * 60))),
+)
@@ -0,0 +1,262 @@
+"""
+Simulação de testes adaptativos completos com examinandos virtuais de theta conhecido.
+
+Cada lote de examinandos percorre o mesmo fluxo do /proximo (EAP, critério de parada,
+informação do critério de seleção e seleção do item) como operações matriciais; os
+lotes são distribuídos entre processos. Uso:
+
+    python -m services.simulacao --examinandos 100000 --n-itens 200 --processos 8
+    python -m services.simulacao --banco banco.csv --componente LP --saida resultado.json
+    python -m services.simulacao --criterio kl   # compara critérios de seleção
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from services.adaptive_testing import (
+    quadratura,
+    estimar_posteriori_lote,
+    criterio_parada_lote,
+    escala_saeb,
+    theta_proficiencia_inicial,
+    valid_eixo_contagem
+)
+from services.banco import banco_de_csv, banco_sintetico
+from services.informacao import (
+    CRITERIOS_SELECAO, CRITERIO_SELECAO, BALANCEAR_EIXOS, informacao_criterio, refinar_exato, pesos_posteriori,
+    eixo_menos_representado
+)
+
+ETAPAS = ("resposta", "eap", "parada", "selecao")
+
+
+@dataclass
+class ResultadoLote:
+    """Resultado bruto de um lote de examinandos."""
+    theta_real: np.ndarray
+    theta_est: np.ndarray
+    theta_ep: np.ndarray
+    n_itens: np.ndarray
+    exposicao: np.ndarray
+    tempos: dict = field(default_factory=dict)
+
+
+def simular_lote(banco, theta_real, ano_escolar=8, n_Ij=45, profic_inic=500.0, semente=None,
+                 criterio=CRITERIO_SELECAO, balancear=BALANCEAR_EIXOS):
+    """
+    Aplica o teste adaptativo completo a todos os examinandos de theta_real
+    simultaneamente. As respostas são sorteadas pela 3PL no theta real. Com
+    balancear, cada examinando recebe o item do seu eixo menos representado.
+    """
+    rng = np.random.default_rng(semente)
+    theta_real = np.asarray(theta_real, dtype=float)
+    N, n_itens_banco = len(theta_real), banco.n_itens
+    Xr, log_priori = quadratura()
+    P = np.clip(banco.P_grade, np.finfo(float).tiny, 1 - np.finfo(float).eps)
+    log_P, log_1mP = np.log(P), np.log1p(-P)
+    a, b, c = banco.PAR[:, 0], banco.PAR[:, 1], banco.PAR[:, 2]
+    tempos = dict.fromkeys(ETAPAS, 0.0)
+
+    log_posteriori = np.tile(log_priori, (N, 1))
+    administrado = np.zeros((N, n_itens_banco), dtype=bool)
+    n_resp = np.zeros(N, dtype=int)
+    theta_est = np.full(N, theta_proficiencia_inicial(profic_inic))
+    theta_ep = np.full(N, np.nan)
+    exposicao = np.zeros(n_itens_banco, dtype=np.int64)
+    if balancear:
+        posicao_eixo = banco.posicao_eixo
+        contagem = np.zeros((N, len(banco.particao_eixos[0])), dtype=np.int64)
+
+    t = time.perf_counter()
+    INFO = banco.informacao(theta_est)
+    if balancear:
+        INFO[:, posicao_eixo != eixo_menos_representado(banco, contagem[0])] = -np.inf
+    # Como no /proximo: a tabela interpolada pré-seleciona e a 3PL exata escolhe
+    pos = np.argmax(refinar_exato(banco, INFO, theta_est), axis=1)
+    tempos["selecao"] += time.perf_counter() - t
+
+    ativos = np.arange(N)
+    while len(ativos):
+        t = time.perf_counter()
+        p = c[pos] + (1 - c[pos]) / (1 + np.exp(-a[pos] * (theta_real[ativos] - b[pos])))
+        acerto = rng.random(len(ativos)) < p
+        administrado[ativos, pos] = True
+        n_resp[ativos] += 1
+        if balancear:
+            contagem[ativos, posicao_eixo[pos]] += 1
+        exposicao += np.bincount(pos, minlength=n_itens_banco)
+        tempos["resposta"] += time.perf_counter() - t
+
+        # Atualização incremental da posteriori: só o item recém-respondido
+        t = time.perf_counter()
+        log_posteriori[ativos] += np.where(acerto[:, None], log_P[:, pos].T, log_1mP[:, pos].T)
+        theta_est[ativos], theta_ep[ativos] = estimar_posteriori_lote(log_posteriori[ativos], Xr)
+        tempos["eap"] += time.perf_counter() - t
+
+        t = time.perf_counter()
+        parar = criterio_parada_lote(
+            theta_est[ativos], theta_ep[ativos], n_resp[ativos],
+            valid_eixo_contagem(n_resp[ativos], banco.eixos_distintos),
+            ano_escolar, n_Ij, Area=banco.componente
+        )
+        parar |= n_resp[ativos] >= n_itens_banco
+        tempos["parada"] += time.perf_counter() - t
+
+        ativos = ativos[~parar]
+        if not len(ativos):
+            break
+
+        t = time.perf_counter()
+        pesos = None if criterio == "mfi" else pesos_posteriori(log_posteriori[ativos])
+        INFO = informacao_criterio(banco, theta_est[ativos], pesos, criterio)
+        INFO[administrado[ativos]] = -np.inf
+        if balancear:
+            alvo = eixo_menos_representado(banco, contagem[ativos])
+            INFO[posicao_eixo != alvo[:, None]] = -np.inf
+        if pesos is None:
+            refinar_exato(banco, INFO, theta_est[ativos])
+        INFO[administrado[ativos]] = 0
+        pos = np.argmax(INFO, axis=1)
+        tempos["selecao"] += time.perf_counter() - t
+
+    return ResultadoLote(theta_real, theta_est, theta_ep, n_resp, exposicao, tempos)
+
+
+_banco_processo = None
+
+
+def _iniciar_processo(banco):
+    global _banco_processo
+    _banco_processo = banco.preparar()
+
+
+def _simular_no_processo(args):
+    theta_real, opcoes, semente = args
+    return simular_lote(_banco_processo, theta_real, semente=semente, **opcoes)
+
+
+def simular(banco, n_examinandos, tamanho_lote=2000, processos=None, semente=0,
+            ano_escolar=8, n_Ij=45, profic_inic=500.0, criterio=CRITERIO_SELECAO, balancear=BALANCEAR_EIXOS):
+    """
+    Simula n_examinandos com theta ~ N(0, 1) em lotes distribuídos entre processos
+    e retorna o relatório consolidado.
+    """
+    banco.preparar()
+    rng = np.random.default_rng(semente)
+    theta_real = rng.standard_normal(n_examinandos)
+    opcoes = {
+        "ano_escolar": ano_escolar, "n_Ij": n_Ij, "profic_inic": profic_inic, "criterio": criterio,
+        "balancear": balancear,
+    }
+    sementes = rng.integers(0, 2**32, size=(n_examinandos + tamanho_lote - 1) // tamanho_lote)
+    tarefas = [
+        (theta_real[i:i + tamanho_lote], opcoes, int(s))
+        for i, s in zip(range(0, n_examinandos, tamanho_lote), sementes)
+    ]
+
+    inicio = time.perf_counter()
+    if processos == 1:
+        _iniciar_processo(banco)
+        resultados = [_simular_no_processo(t) for t in tarefas]
+    else:
+        with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_processo, initargs=(banco,)) as pool:
+            resultados = list(pool.map(_simular_no_processo, tarefas))
+    duracao = time.perf_counter() - inicio
+
+    return relatorio(banco, resultados, duracao, criterio, balancear)
+
+
+def relatorio(banco, resultados, duracao, criterio=CRITERIO_SELECAO, balancear=BALANCEAR_EIXOS):
+    """Tamanho do teste, viés/RMSE, exposição dos itens, itens por eixo e tempo por etapa."""
+    theta_real = np.concatenate([r.theta_real for r in resultados])
+    theta_est = np.concatenate([r.theta_est for r in resultados])
+    theta_ep = np.concatenate([r.theta_ep for r in resultados])
+    n_itens = np.concatenate([r.n_itens for r in resultados])
+    exposicao = np.sum([r.exposicao for r in resultados], axis=0) / len(theta_real)
+
+    erro = theta_est - theta_real
+    escala = escala_saeb(1.0, 1.0, banco.componente)[1]
+    tempos = {e: sum(r.tempos[e] for r in resultados) for e in ETAPAS}
+    passos = int(n_itens.sum())
+    eixos, ordem, inicios = banco.particao_eixos
+    itens_por_eixo = np.add.reduceat(exposicao[ordem], inicios[:-1])
+
+    return {
+        "banco": banco.id,
+        "componente": banco.componente,
+        "criterio": criterio,
+        "balancearEixos": balancear,
+        "nItensBanco": banco.n_itens,
+        "examinandos": len(theta_real),
+        "tamanhoTeste": {
+            "media": float(n_itens.mean()),
+            "min": int(n_itens.min()),
+            "p50": float(np.percentile(n_itens, 50)),
+            "p95": float(np.percentile(n_itens, 95)),
+            "max": int(n_itens.max()),
+        },
+        "vies": float(erro.mean()),
+        "rmse": float(np.sqrt(np.mean(erro ** 2))),
+        "viesSaeb": float(erro.mean() * escala),
+        "rmseSaeb": float(np.sqrt(np.mean(erro ** 2)) * escala),
+        "epMedio": float(np.nanmean(theta_ep)),
+        "exposicao": {
+            "maxima": float(exposicao.max()),
+            "media": float(exposicao.mean()),
+            "itensNaoUsados": int(np.sum(exposicao == 0)),
+        },
+        # Média de itens aplicados de cada eixo por examinando
+        "itensPorEixo": {str(e): float(m) for e, m in zip(eixos, itens_por_eixo)},
+        "tempoEtapas": {
+            e: {"totalSeg": tempos[e], "porItemUs": 1e6 * tempos[e] / max(passos, 1)} for e in ETAPAS
+        },
+        "duracaoSeg": duracao,
+        "examinandosPorSeg": len(theta_real) / duracao if duracao else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulação de testes adaptativos")
+    parser.add_argument("--banco", help="CSV do banco (idItem, parA, parB, parC, idEixo, idHabilidade)")
+    parser.add_argument("--componente", default="LP")
+    parser.add_argument("--n-itens", type=int, default=200, help="tamanho do banco sintético (sem --banco)")
+    parser.add_argument("--examinandos", type=int, default=10000)
+    parser.add_argument("--ano-escolar", type=int, default=8)
+    parser.add_argument("--n-ij", type=int, default=45)
+    parser.add_argument("--profic-inic", type=float, default=500.0)
+    parser.add_argument("--criterio", choices=CRITERIOS_SELECAO, default=CRITERIO_SELECAO,
+                        help="critério de seleção dos itens")
+    parser.add_argument("--balancear", action="store_true", default=BALANCEAR_EIXOS,
+                        help="seleciona no eixo menos representado (TAI_BALANCEAR_EIXOS)")
+    parser.add_argument("--lote", type=int, default=2000, help="examinandos por tarefa")
+    parser.add_argument("--processos", type=int, default=os.cpu_count())
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--saida", help="arquivo JSON do relatório (padrão: stdout)")
+    args = parser.parse_args(argv)
+
+    if args.banco:
+        banco = banco_de_csv(args.banco, args.componente)
+    else:
+        banco = banco_sintetico(args.n_itens, args.componente, args.semente)
+
+    resultado = simular(
+        banco, args.examinandos, tamanho_lote=args.lote, processos=args.processos,
+        semente=args.semente, ano_escolar=args.ano_escolar, n_Ij=args.n_ij,
+        profic_inic=args.profic_inic, criterio=args.criterio, balancear=args.balancear
+    )
+
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    else:
+        print(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,7 @@ from services.adaptive_testing import (
     proximo_item_criterio
 )
 import numpy as np
+import json
 
 client = TestClient(app)
 
@@ -70,6 +71,40 @@ def test_EAP_basic():
     assert isinstance(theta, float)
     assert isinstance(ep, float)
 
+def _EAP_referencia(U, PAR):
+    # Implementação original (laço em Python) usada como referência
+    q = 61
+    Xr = np.linspace(-6, 6, q).reshape(-1, 1)
+    AXr = 1 / np.sqrt(2 * np.pi) * np.exp(-(Xr**2) / 2) * 8 / (q - 1)
+    a, b, c = PAR[:, 0], PAR[:, 1], PAR[:, 2]
+    P = c + (1 - c) / (1 + np.exp(-a * (Xr - b)))
+    Pjt = np.ones((q, 1))
+    for l in range(q):
+        for i in range(len(U)):
+            Pjt[l] *= P[l, i] ** U[i] * (1 - P[l, i]) ** (1 - U[i])
+    Pj = Pjt * AXr
+    theta = np.sum(Xr * Pj) / np.sum(Pj)
+    ep = np.sqrt(np.sum((Xr - theta) ** 2 * Pj) / np.sum(Pj))
+    return theta, ep
+
+def test_EAP_igual_referencia():
+    rng = np.random.default_rng(0)
+    for n in [1, 5, 20, 45]:
+        PAR = np.column_stack((rng.uniform(0.5, 2.5, n), rng.normal(0, 1, n), rng.uniform(0, 0.3, n)))
+        U = rng.integers(0, 2, n)
+        theta, ep = EAP(U, PAR, list(range(n)))
+        theta_ref, ep_ref = _EAP_referencia(U, PAR)
+        assert np.isclose(theta, theta_ref, atol=1e-10)
+        assert np.isclose(ep, ep_ref, atol=1e-10)
+
+def test_EAP_teste_longo_sem_underflow():
+    n = 2000
+    PAR = np.column_stack((np.full(n, 1.5), np.zeros(n), np.full(n, 0.2)))
+    U = np.tile([1, 0], n // 2)
+    theta, ep = EAP(U, PAR, list(range(n)))
+    assert np.isfinite(theta) and np.isfinite(ep)
+    assert abs(theta) < 1
+
 # Testes para parar_teste
 def test_parar_teste_continuar():
     pontos_corte = [-1.0, 0.0, 1.0]
@@ -382,3 +417,1202 @@ def test_proximo_item_criterio_todos_administrados():
     # ou o índice de maior informação, ignorando esse fato
     assert pos in [0, 1, 2]
 
+
+# Testes para o registro de bancos
+def _campos_banco(request_data):
+    campos = ["idItem", "parA", "parB", "parC", "componente", "idEixo", "idHabilidade"]
+    return {k: request_data[k] for k in campos}
+
+def test_registrar_banco_e_proximo_por_id(sample_request_data):
+    response = client.post("/bancos", json=_campos_banco(sample_request_data))
+    assert response.status_code == 200
+    id_banco = response.json()["idBanco"]
+    assert response.json()["nItens"] == 2
+
+    request_por_id = {k: v for k, v in sample_request_data.items() if k not in _campos_banco(sample_request_data)}
+    request_por_id["idBanco"] = id_banco
+    por_id = client.post("/proximo", json=request_por_id)
+    completo = client.post("/proximo", json=sample_request_data)
+    assert por_id.status_code == 200
+    assert por_id.json() == completo.json()
+
+def test_registrar_banco_hash_deterministico(sample_request_data):
+    r1 = client.post("/bancos", json=_campos_banco(sample_request_data)).json()
+    r2 = client.post("/bancos", json=_campos_banco(sample_request_data)).json()
+    assert r1["idBanco"] == r2["idBanco"]
+
+def test_proximo_banco_nao_registrado(sample_request_data):
+    request_data = sample_request_data.copy()
+    request_data["idBanco"] = "inexistente"
+    response = client.post("/proximo", json=request_data)
+    assert response.status_code == 404
+
+def test_registro_bancos_descarte_lru():
+    from services.banco import RegistroBancos, criar_banco
+    registro = RegistroBancos(max_bancos=2)
+    for nome in ["A", "B", "C"]:
+        registro.registrar(criar_banco("LP", ["I1"], [1.0], [250.0], [0.2], [1], [1], id_banco=nome))
+    assert "A" not in registro
+    assert registro.obter("B") is not None and registro.obter("C") is not None
+
+def test_banco_indices_na_ordem_de_aplicacao():
+    from services.banco import criar_banco
+    banco = criar_banco("LP", ["I1", "I2", "I3"], [1.0] * 3, [250.0] * 3, [0.2] * 3, [1, 1, 2], [1, 2, 3])
+    assert banco.indices(["I3", "I1"]) == [2, 0]
+    with pytest.raises(ValueError):
+        banco.indices(["I9"])
+
+# Testes para sessões com estado no servidor
+def _banco_sintetico(n_itens=45, seed=1):
+    rng = np.random.default_rng(seed)
+    return {
+        "idItem": ",".join(f"ITEM{i}" for i in range(1, n_itens + 1)),
+        "parA": ",".join(f"{v:.4f}" for v in rng.uniform(0.01, 0.04, n_itens)),
+        "parB": ",".join(f"{v:.4f}" for v in rng.normal(250, 50, n_itens)),
+        "parC": ",".join(f"{v:.4f}" for v in rng.uniform(0.1, 0.25, n_itens)),
+        "componente": "LP",
+        "idEixo": ",".join(str(i % 3 + 1) for i in range(n_itens)),
+        "idHabilidade": ",".join(str(i) for i in range(n_itens)),
+    }
+
+def test_sessao_equivale_ao_proximo():
+    banco = _banco_sintetico()
+    inicio = client.post("/sessoes", json={
+        **banco, "ESTUDANTE": "Aluno1", "AnoEscolarEstudante": "8", "profic.inic": "500.0", "n.Ij": "45"
+    })
+    assert inicio.status_code == 200
+    id_sessao = inicio.json()["idSessao"]
+    item = inicio.json()["item"]
+
+    administrado, respostas = [], []
+    while item[0] != -1:
+        administrado.append(item[0])
+        respostas.append("A" if len(respostas) % 3 else "B")
+        sem_estado = client.post("/proximo", json={
+            **banco, "ESTUDANTE": "Aluno1", "AnoEscolarEstudante": "8", "proficiencia": "500.0",
+            "profic.inic": "500.0", "administrado": ",".join(administrado), "respostas": ",".join(respostas),
+            "gabarito": ",".join(["A"] * len(respostas)), "erropadrao": "0.5", "n.Ij": "45"
+        }).json()
+        resposta = {"idItem": item[0], "resposta": respostas[-1], "gabarito": "A"}
+        com_estado = client.post(f"/sessoes/{id_sessao}/respostas", json=resposta)
+        assert com_estado.status_code == 200
+        # O reenvio da mesma resposta não é aplicado ao item seguinte
+        if com_estado.json()["item"][0] != -1:
+            assert client.post(f"/sessoes/{id_sessao}/respostas", json=resposta).status_code == 409
+        item = com_estado.json()["item"]
+        assert item[:6] == sem_estado[:6]
+        assert np.allclose(np.array(item[6:], dtype=float), np.array(sem_estado[6:], dtype=float))
+
+    assert client.post(f"/sessoes/{id_sessao}/respostas", json=resposta).status_code == 409
+    final = client.delete(f"/sessoes/{id_sessao}")
+    assert final.status_code == 200
+    assert final.json()["nRespostas"] == len(respostas)
+    assert client.post(f"/sessoes/{id_sessao}/respostas", json={"resposta": "A", "gabarito": "A"}).status_code == 404
+
+def test_armazem_sessoes_limites():
+    from services.banco import criar_banco
+    from services.sessoes import ArmazemSessoes
+    banco = criar_banco("LP", ["I1", "I2"], [1.0] * 2, [250.0] * 2, [0.2] * 2, [1, 2], [1, 2])
+
+    armazem = ArmazemSessoes(max_sessoes=2)
+    s1 = armazem.criar(banco, 8, 500.0, 45)
+    s2 = armazem.criar(banco, 8, 500.0, 45)
+    armazem.obter(s1.id)
+    s3 = armazem.criar(banco, 8, 500.0, 45)
+    assert s2.id not in armazem and s1.id in armazem and s3.id in armazem
+
+    armazem = ArmazemSessoes(ttl=0)
+    s1 = armazem.criar(banco, 8, 500.0, 45)
+    assert armazem.obter(s1.id) is None
+
+    armazem = ArmazemSessoes(max_bytes=s1.tamanho_bytes)
+    armazem.criar(banco, 8, 500.0, 45)
+    armazem.criar(banco, 8, 500.0, 45)
+    assert len(armazem) == 1
+
+# Testes para o /proximo em lote
+def test_proximo_lote_igual_individual():
+    banco = _banco_sintetico()
+    itens = banco["idItem"].split(",")
+    rng = np.random.default_rng(3)
+    estudantes = []
+    for n in [0, 1, 5, 10, 20, 32]:
+        administrado = list(rng.choice(itens, n, replace=False))
+        respostas = ["A" if v else "B" for v in rng.integers(0, 2, n)]
+        estudantes.append({
+            "ESTUDANTE": f"Aluno{n}", "AnoEscolarEstudante": "8", "proficiencia": "500.0",
+            "profic.inic": "480.0", "administrado": ",".join(administrado), "respostas": ",".join(respostas),
+            "gabarito": ",".join(["A"] * n), "erropadrao": "0.5", "n.Ij": "45"
+        })
+    estudantes.append({**estudantes[1], "gabarito": "A,A"})
+
+    response = client.post("/proximo/lote", json={**banco, "estudantes": estudantes})
+    assert response.status_code == 200
+    resultados = response.json()["resultados"]
+    assert len(resultados) == len(estudantes)
+    assert "erro" in resultados[-1]
+
+    for estudante, resultado in zip(estudantes[:-1], resultados):
+        individual = client.post("/proximo", json={**banco, **estudante}).json()
+        assert resultado[:6] == individual[:6]
+        if resultado[0] == -1:
+            assert np.allclose(resultado[6:], individual[6:])
+        elif resultado[7] != "NA":
+            assert np.allclose(np.array(resultado[6:], dtype=float), np.array(individual[6:], dtype=float))
+
+def test_proximo_lote_isola_estudantes_invalidos(monkeypatch):
+    from routers import api
+    banco = _banco_sintetico(seed=5)
+    itens = banco["idItem"].split(",")
+    base = {"ESTUDANTE": "Aluno1", "AnoEscolarEstudante": "8", "profic.inic": "500.0", "n.Ij": "45"}
+    estudantes = [
+        {**base, "administrado": ",".join(itens[:3]), "respostas": "A,B", "gabarito": "A,A"},
+        {**base, "administrado": ",".join(itens[:2]), "respostas": "A", "gabarito": "A"},
+        {**base, "administrado": ",".join(itens[:2]), "respostas": "A,B", "gabarito": "A,A"},
+        {**base, "administrado": itens[0], "respostas": "", "gabarito": ""},
+    ]
+    response = client.post("/proximo/lote", json={**banco, "estudantes": estudantes})
+    assert response.status_code == 200
+    resultados = response.json()["resultados"]
+    assert resultados[0] == resultados[1] == {"erro": "administrado e respostas devem ter o mesmo tamanho"}
+    for estudante, resultado in zip(estudantes[2:], resultados[2:]):
+        individual = client.post("/proximo", json={**banco, **estudante, "proficiencia": "500.0", "erropadrao": "0.5"})
+        assert resultado[:6] == individual.json()[:6]
+    assert resultados[3][0] != itens[0]
+    assert client.post("/proximo", json={**banco, **base, **estudantes[1], "proficiencia": "500.0",
+                                         "erropadrao": "0.5"}).status_code == 400
+
+    # Uma falha no cálculo conjunto é isolada no estudante que a provoca
+    original = api.proximo_lote
+    def falha_no_terceiro(banco, estudantes, detalhes=None):
+        if any(e.n_Ij == 3 for e in estudantes):
+            raise RuntimeError("falha no estudante")
+        return original(banco, estudantes, detalhes)
+    monkeypatch.setattr(api, "proximo_lote", falha_no_terceiro)
+    estudantes = [{**base, "administrado": "", "respostas": "", "gabarito": ""} for _ in range(3)]
+    estudantes[1]["n.Ij"] = "3"
+    resultados = client.post("/proximo/lote", json={**banco, "estudantes": estudantes}).json()["resultados"]
+    assert resultados[1] == {"erro": "falha no estudante"}
+    assert resultados[0] == resultados[2] and resultados[0][0] != -1
+
+def test_criterio_parada_lote_igual_escalar():
+    from services.adaptive_testing import criterio_parada_lote
+    rng = np.random.default_rng(4)
+    N = 200
+    theta = rng.normal(0, 1, N)
+    ep = rng.uniform(0.05, 1.0, N)
+    n_resp = rng.integers(0, 40, N)
+    valid = rng.integers(0, 2, N).astype(bool)
+    anos = rng.integers(2, 10, N)
+    for area in ["LP", "MT", "CN"]:
+        lote = criterio_parada_lote(theta, ep, n_resp, valid, anos, 45, Area=area)
+        escalar = [
+            criterio_parada(theta[j], ep[j], n_resp=int(n_resp[j]), validEixo=bool(valid[j]),
+                            Area=area, AnoEscolar=int(anos[j]), n_Ij=45)
+            for j in range(N)
+        ]
+        assert lote.tolist() == escalar
+
+# Testes para a tabela de informação
+def test_tabela_informacao_interpola():
+    from services.informacao import TabelaInformacao
+    rng = np.random.default_rng(5)
+    PAR = np.column_stack((rng.uniform(0.5, 2.0, 100), rng.normal(0, 1, 100), rng.uniform(0, 0.3, 100)))
+    tabela = TabelaInformacao(PAR, passo=0.01)
+    for theta in [-2.345, 0.0, 0.517, 3.2]:
+        assert np.allclose(tabela.informacao(theta), maxima_informacao_th(theta, PAR), atol=1e-3)
+    thetas = np.array([-1.0, 0.25])
+    assert tabela.informacao(thetas).shape == (2, 100)
+
+def test_top_k_informacao():
+    from services.informacao import top_k_informacao
+    INFO = np.array([0.1, 0.9, 0.5, 0.7, 0.3])
+    assert top_k_informacao(INFO, [1], k=3).tolist() == [3, 2, 4]
+    assert top_k_informacao(INFO, [1], k=1).tolist() == [3]
+    # Perto do fim do banco, só os itens ainda disponíveis são candidatos
+    assert top_k_informacao(INFO, [0, 1, 2], k=4).tolist() == [3, 4]
+    assert top_k_informacao(INFO, np.array([1, 1, 0, 1, 1], dtype=bool), k=3).tolist() == [2]
+
+    from services.banco import banco_sintetico
+    from services.decisao import selecionar_item
+    banco = banco_sintetico(6)
+    sorteados = {selecionar_item(banco, 0.0, [0, 1, 2, 3], randomesque=5) for _ in range(50)}
+    assert sorteados <= {4, 5}
+
+def test_proximo_randomesque(sample_request_data):
+    banco = _banco_sintetico()
+    request_data = {**sample_request_data, **banco, "administrado": "ITEM1", "randomesque": "5"}
+    for _ in range(10):
+        response = client.post("/proximo", json=request_data)
+        assert response.status_code == 200
+        assert response.json()[0] != "ITEM1"
+
+# Testes para a simulação
+def test_simulacao_relatorio():
+    from services.banco import banco_sintetico
+    from services.simulacao import simular
+    resultado = simular(banco_sintetico(60), 300, tamanho_lote=100, processos=1, semente=2)
+    assert resultado["examinandos"] == 300
+    assert 8 <= resultado["tamanhoTeste"]["media"] <= 45
+    assert resultado["rmse"] < 1.0
+    assert abs(resultado["vies"]) < 0.3
+    assert 0 < resultado["exposicao"]["maxima"] <= 1
+
+# Testes para métricas
+def test_motivo_parada():
+    from services.adaptive_testing import motivo_parada, PARADA_EP, PARADA_MAXIMO
+    assert motivo_parada(0.0, 0.4, n_resp=16) == PARADA_EP
+    assert motivo_parada(0.0, 1.0, n_resp=32) == PARADA_MAXIMO
+    assert motivo_parada(0.0, 1.0, n_resp=5) is None
+
+def test_metrics_endpoint():
+    from services.cache import cache_decisoes
+    from services.metricas import PARADAS, DURACAO_ETAPA
+    cache_decisoes.limpar()
+    paradas_antes = PARADAS.valor(motivo="maximo")
+    eap_antes = DURACAO_ETAPA.contagem(etapa="eap")
+    test_proximo_item_parada()
+    assert PARADAS.valor(motivo="maximo") == paradas_antes + 1
+    assert DURACAO_ETAPA.contagem(etapa="eap") == eap_antes + 1
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    texto = response.text
+    assert '# TYPE tai_etapa_duracao_segundos histogram' in texto
+    assert 'tai_etapa_duracao_segundos_bucket{etapa="eap",le="+Inf"}' in texto
+    assert 'tai_requisicoes_total{rota="/proximo",componente="LP",ano_escolar="8"}' in texto
+    assert 'tai_paradas_total{motivo="maximo"}' in texto
+
+# Testes para o formato de payload com vetores
+def test_decodificar_vetor_formatos():
+    from utils.helpers import decodificar_vetor, codificar_vetor
+    esperado = np.array([1.0, 2.5, -3.0])
+    assert np.array_equal(decodificar_vetor("1.0,2.5,-3.0"), esperado)
+    assert np.array_equal(decodificar_vetor([1.0, 2.5, -3.0]), esperado)
+    assert np.array_equal(decodificar_vetor(codificar_vetor(esperado)), esperado)
+    assert np.array_equal(decodificar_vetor(codificar_vetor([1, 2], "<i4"), np.int64), [1, 2])
+    assert decodificar_vetor("").size == 0
+    with pytest.raises(ValueError):
+        decodificar_vetor({"b64": "", "dtype": ">f8"})
+
+def test_proximo_payload_vetores(sample_request_data):
+    from utils.helpers import codificar_vetor
+    banco = _banco_sintetico()
+    texto = {**sample_request_data, **banco, "administrado": "ITEM3,ITEM7", "respostas": "A,B", "gabarito": "A,A"}
+    listas = {
+        **texto,
+        "idItem": banco["idItem"].split(","),
+        "parA": [float(v) for v in banco["parA"].split(",")],
+        "parB": [float(v) for v in banco["parB"].split(",")],
+        "parC": [float(v) for v in banco["parC"].split(",")],
+        "idEixo": [int(v) for v in banco["idEixo"].split(",")],
+        "idHabilidade": [int(v) for v in banco["idHabilidade"].split(",")],
+        "administrado": ["ITEM3", "ITEM7"],
+        "respostas": ["A", "B"],
+        "gabarito": ["A", "A"],
+    }
+    binario = {
+        **listas,
+        "parA": codificar_vetor(listas["parA"]),
+        "parB": codificar_vetor(listas["parB"]),
+        "parC": codificar_vetor(listas["parC"]),
+        "idEixo": codificar_vetor(listas["idEixo"], "<i4"),
+        "acertos": [1, 0],
+    }
+    esperado = client.post("/proximo", json=texto).json()
+    assert client.post("/proximo", json=listas).json() == esperado
+    assert client.post("/proximo", json=binario).json() == esperado
+
+# Testes para a execução fora do event loop
+def test_executor_limitado_rejeita_fila_cheia():
+    import asyncio
+    import threading
+    from services.execucao import ExecutorLimitado, FilaCheia
+
+    executor = ExecutorLimitado(modo="thread", max_workers=1, max_fila=1, retry_after=3)
+    liberar = threading.Event()
+
+    async def cenario():
+        tarefas = [asyncio.create_task(executor.executar(liberar.wait, 5)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        assert executor.em_andamento == 2
+        with pytest.raises(FilaCheia) as erro:
+            await executor.executar(sum, [1, 2])
+        assert erro.value.retry_after == 3
+        liberar.set()
+        await asyncio.gather(*tarefas)
+        assert await executor.executar(sum, [1, 2]) == 3
+        assert executor.em_andamento == 0
+
+    asyncio.run(cenario())
+    executor.encerrar()
+
+def test_execucao_em_processos_envia_banco_uma_vez(sample_request_data, monkeypatch):
+    import routers.api
+    from services.banco import BancoItens, banco_sintetico, registro_bancos
+    from services.execucao import ExecutorLimitado
+    from services.metricas import REQUISICOES, DURACAO_ETAPA
+
+    executor = ExecutorLimitado(modo="process", max_workers=1)
+    monkeypatch.setattr(routers.api, "executor", executor)
+    request_data = {**sample_request_data, "idBanco": "processo-teste", "administrado": "", "respostas": "",
+                    "gabarito": ""}
+    banco = banco_sintetico(40)
+    banco.id = "processo-teste"
+    registro_bancos.registrar(banco)
+    try:
+        assert client.post("/proximo", json=request_data).status_code == 200
+
+        # Nova versão do banco depois de o processo do pool existir: vai uma única vez
+        banco = banco_sintetico(50, semente=4)
+        banco.id = "processo-teste"
+        registro_bancos.registrar(banco)
+        enviados = []
+        getstate = BancoItens.__getstate__
+        monkeypatch.setattr(BancoItens, "__getstate__", lambda b: enviados.append(b.id) or getstate(b))
+        requisicoes = REQUISICOES.valor(rota="/proximo", componente="LP", ano_escolar=8)
+        etapas = DURACAO_ETAPA.contagem(etapa="parse")
+        esperado = routers.api.calcular_proximo(request_data, banco)
+        for _ in range(3):
+            assert client.post("/proximo", json=request_data).json() == esperado
+        assert enviados == ["processo-teste"]
+        # Métricas registradas no processo do pool chegam ao /metrics do principal
+        assert REQUISICOES.valor(rota="/proximo", componente="LP", ano_escolar=8) == requisicoes + 4
+        assert DURACAO_ETAPA.contagem(etapa="parse") == etapas + 4
+    finally:
+        executor.encerrar()
+        registro_bancos.remover("processo-teste")
+
+def test_proximo_429_com_retry_after(sample_request_data, monkeypatch):
+    import routers.api
+    from services.execucao import FilaCheia
+
+    class ExecutorCheio:
+        modo = "thread"
+
+        async def executar(self, funcao, *args):
+            raise FilaCheia(2)
+
+    monkeypatch.setattr(routers.api, "executor", ExecutorCheio())
+    response = client.post("/proximo", json=sample_request_data)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+
+# Testes para o cache de decisões
+def test_cache_decisoes_hit_e_invalidacao(sample_request_data):
+    from services.cache import cache_decisoes
+    banco = _banco_sintetico(seed=11)
+    id_banco = client.post("/bancos", json={**banco, "idBanco": "cache-teste"}).json()["idBanco"]
+    request_data = {**sample_request_data, "idBanco": id_banco, "administrado": "ITEM2", "respostas": "A", "gabarito": "A"}
+
+    falhas, acertos = cache_decisoes.falhas, cache_decisoes.acertos
+    primeiro = client.post("/proximo", json=request_data).json()
+    segundo = client.post("/proximo", json=request_data).json()
+    assert primeiro == segundo
+    assert cache_decisoes.falhas == falhas + 1
+    assert cache_decisoes.acertos == acertos + 1
+
+    # Registrar de novo o mesmo id invalida as decisões anteriores
+    client.post("/bancos", json={**banco, "parB": banco["parB"].replace("2", "3"), "idBanco": "cache-teste"})
+    client.post("/proximo", json=request_data)
+    assert cache_decisoes.falhas == falhas + 2
+
+def test_cache_decisoes_com_estimador_iterativo(sample_request_data, monkeypatch):
+    import routers.api
+    from services.cache import cache_decisoes
+    from services.estimadores import criar_estimador
+
+    # O MAP parte da proficiência enviada: pontos de partida diferentes não compartilham a decisão
+    monkeypatch.setattr(routers.api, "estimador_padrao", criar_estimador("map"))
+    cache_decisoes.limpar()
+    request_data = {**sample_request_data, **_banco_sintetico(seed=9)}
+    request_data.update(administrado="ITEM1,ITEM2,ITEM3", respostas="A,B,A", gabarito="A,A,A")
+    falhas, acertos = cache_decisoes.falhas, cache_decisoes.acertos
+    for proficiencia in ("500.0", "350.0", "500.0"):
+        assert client.post("/proximo", json={**request_data, "proficiencia": proficiencia}).status_code == 200
+    assert (cache_decisoes.falhas, cache_decisoes.acertos) == (falhas + 2, acertos + 1)
+
+def test_cache_decisoes_lru():
+    from services.banco import criar_banco
+    from services.cache import CacheDecisoes
+    banco = criar_banco("LP", ["I1", "I2"], [1.0] * 2, [250.0] * 2, [0.2] * 2, [1, 2], [1, 2])
+    cache = CacheDecisoes(max_entradas=2)
+    chaves = [cache.chave(banco, 8, 500.0, 45, [i], [1]) for i in range(3)]
+    for i, chave in enumerate(chaves):
+        cache.guardar(chave, [i])
+    assert len(cache) == 2
+    assert cache.obter(chaves[0]) is None
+    assert cache.obter(chaves[2]) == [2]
+
+# Testes para a árvore de decisão
+def test_arvore_decisao_igual_calculo(tmp_path):
+    import itertools
+    from routers.api import decidir_proximo
+    from services.arvore import construir_arvore, ArvoreDecisao, RegistroArvores
+    from services.banco import banco_sintetico
+    banco = banco_sintetico(60, semente=7).preparar()
+    arvore = construir_arvore(banco, ano_escolar=8, profic_inic=500.0, n_Ij=45, profundidade=4)
+
+    caminho = tmp_path / "arvore.npz"
+    arvore.salvar(caminho)
+    registro = RegistroArvores()
+    registro.adicionar(ArvoreDecisao.carregar(caminho))
+
+    for n in range(0, 5):
+        for acertos in itertools.product([0, 1], repeat=n):
+            # Reconstrói o caminho aplicando as decisões calculadas
+            administrado = []
+            for k in range(n):
+                anterior = decidir_proximo(banco, 8, 500.0, 45, administrado, np.array(acertos[:k]))
+                administrado.append(int(anterior[2]))
+            detalhes_calculo, detalhes_arvore = {}, {}
+            esperado = decidir_proximo(banco, 8, 500.0, 45, administrado, np.array(acertos), detalhes=detalhes_calculo)
+            assert registro.responder(banco, 8, 500.0, 45, administrado, list(acertos), detalhes_arvore) == esperado
+            # A auditoria das decisões da árvore traz os mesmos valores do cálculo
+            assert detalhes_arvore.keys() >= detalhes_calculo.keys()
+            assert detalhes_arvore == pytest.approx({"ep": None, "motivo": None, **detalhes_calculo}, rel=1e-12)
+
+    # Fora da árvore: caminho diferente ou mais profundo
+    assert registro.responder(banco, 8, 500.0, 45, [59], [1]) is None
+    assert registro.responder(banco, 8, 480.0, 45, [], []) is None
+
+    # Item previsto já listado entre os administrados: volta para a seleção usual
+    raiz = int(arvore.item[0])
+    assert registro.responder(banco, 8, 500.0, 45, [raiz], []) is None
+    esperado = decidir_proximo(banco, 8, 500.0, 45, [raiz], np.array([], dtype=int))
+    assert int(esperado[2]) != raiz
+
+def test_arvores_endpoint(sample_request_data):
+    banco = _banco_sintetico(seed=12)
+    client.post("/bancos", json={**banco, "idBanco": "arvore-teste"})
+    response = client.post("/arvores", json={
+        "idBanco": "arvore-teste", "AnoEscolarEstudante": "8", "profic.inic": "500.0", "n.Ij": "45", "profundidade": 3
+    })
+    assert response.status_code == 200
+    assert response.json()["nDecisoes"] == 15
+    request_data = {**sample_request_data, "idBanco": "arvore-teste", "administrado": "", "respostas": "", "gabarito": ""}
+    assert client.post("/proximo", json=request_data).status_code == 200
+    assert client.post("/arvores", json={"idBanco": "nao-existe"}).status_code == 404
+    for profundidade in (-1, 13, 30):
+        response = client.post("/arvores", json={
+            "idBanco": "arvore-teste", "AnoEscolarEstudante": "8", "profic.inic": "500.0", "profundidade": profundidade
+        })
+        assert response.status_code == 400
+
+# Testes para os estimadores alternativos
+def test_estimadores_convergem_para_eap():
+    from services.banco import banco_do_payload
+    from services.estimadores import criar_estimador, EstimadorAdaptativo
+    from services.adaptive_testing import EAP_grade
+
+    banco = banco_do_payload(_banco_sintetico(seed=13))
+    administrado = list(range(20))
+    acertos = np.random.default_rng(13).integers(0, 2, 20)
+    theta_ref, ep_ref = EAP_grade(acertos, banco.grade(administrado))
+
+    eap = criar_estimador("eap").estimar(banco, administrado, acertos)
+    assert (eap.theta, eap.ep) == (theta_ref, ep_ref)
+    assert eap.avaliacoes == 61 * 20
+
+    eap_41 = criar_estimador("eap:41").estimar(banco, administrado, acertos)
+    assert eap_41.theta == pytest.approx(theta_ref, abs=1e-3)
+
+    # MAP com partida a quente converge para o mesmo ponto que partindo de zero
+    frio = criar_estimador("map").estimar(banco, administrado, acertos)
+    quente = criar_estimador("map").estimar(banco, administrado, acertos, theta_inicial=frio.theta + 0.1)
+    assert quente.theta == pytest.approx(frio.theta, abs=1e-5)
+    assert quente.detalhes["iteracoes"] <= frio.detalhes["iteracoes"]
+    assert frio.theta == pytest.approx(theta_ref, abs=0.15)
+
+    adaptativo = EstimadorAdaptativo(etapas=((4, 21),))
+    assert adaptativo.estimar(banco, administrado[:3], acertos[:3]).detalhes["q"] == 21
+    assert adaptativo.estimar(banco, administrado, acertos).detalhes["q"] == 61
+
+    with pytest.raises(ValueError):
+        criar_estimador("ml")
+
+def test_proximo_com_estimador_map(sample_request_data):
+    from routers.api import decidir_proximo
+    from services.banco import banco_do_payload
+    from services.estimadores import criar_estimador
+
+    banco = banco_do_payload(_banco_sintetico(seed=14))
+    resultado = decidir_proximo(
+        banco, 8, 500.0, 45, [0, 1, 2], np.array([1, 0, 1]), proficiencia=500.0, estimador=criar_estimador("map")
+    )
+    assert len(resultado) == 8
+    assert float(resultado[4]) > 0
+
+# Teste do gerador de carga (em processo, via ASGI)
+def test_carga_sessoes_sinteticas(tmp_path):
+    import asyncio
+    import httpx
+    from benchmarks.carga import campos_banco_sintetico, gerar_sessoes, executar_carga, ler_replay
+
+    async def rodar(**kwargs):
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://tai") as cliente:
+            return await executar_carga(cliente, concorrencia=2, **kwargs)
+
+    relatorio = asyncio.run(rodar(sessoes=gerar_sessoes(campos_banco_sintetico(60), n_sessoes=3)))
+    assert relatorio["status"] == {"200": relatorio["requisicoes"]}
+    # Cada sessão começa sem respostas e cresce uma resposta por requisição
+    assert relatorio["porRespostas"]["0"]["n"] == 3
+    assert relatorio["porRespostas"]["1"]["n"] == 3
+    assert {"p50Ms", "p95Ms", "p99Ms"} <= set(relatorio["latencia"])
+
+    replay = tmp_path / "trafego.jsonl"
+    replay.write_text(json.dumps({"rota": "/pingR", "payload": {}}) + "\n")
+    relatorio = asyncio.run(rodar(replay=ler_replay(replay)))
+    assert relatorio["requisicoes"] == 1
+
+# Testes para bancos gravados e mapeados em memória
+def test_banco_mapeado_igual_ao_original(tmp_path):
+    from services.banco import banco_do_payload, RegistroBancos
+    from services.armazenamento import salvar_banco, carregar_banco, carregar_diretorio
+    from routers.api import decidir_proximo
+
+    original = banco_do_payload(_banco_sintetico(seed=15), id_banco="LP/mmap").preparar()
+    mapeado = carregar_banco(salvar_banco(original, tmp_path))
+    assert isinstance(mapeado.P_grade, np.memmap)
+    assert not mapeado.PAR.flags.writeable
+    assert mapeado.impressao == original.impressao
+    assert np.array_equal(mapeado.tabela_informacao.tabela, original.tabela_informacao.tabela)
+    for administrado, acertos in (([], []), ([3, 7, 1], [1, 0, 1])):
+        assert decidir_proximo(mapeado, 8, 500.0, 45, administrado, np.array(acertos)) == \
+            decidir_proximo(original, 8, 500.0, 45, administrado, np.array(acertos))
+
+    # Regravar o mesmo banco troca o diretório sem deixar temporários
+    salvar_banco(original, tmp_path)
+    assert len(list(tmp_path.iterdir())) == 1
+
+    registro = RegistroBancos(diretorio=str(tmp_path))
+    assert registro.obter("LP/mmap").impressao == original.impressao
+    assert registro.obter("nao-existe") is None
+    assert carregar_diretorio(RegistroBancos(), str(tmp_path)) == 1
+
+# Testes para o reescore em massa
+def test_reescore_igual_ao_eap(tmp_path):
+    from services.banco import banco_do_payload
+    from services.reescore import reescorar, FonteBancos, EscritorSaida, ler_testes
+    from services.adaptive_testing import EAP_grade, escala_saeb
+
+    banco = banco_do_payload(_banco_sintetico(seed=16), id_banco="reescore").preparar()
+    rng = np.random.default_rng(16)
+    testes = []
+    for j in range(7):
+        n = int(rng.integers(0, 20))
+        itens = rng.permutation(banco.n_itens)[:n]
+        testes.append({
+            "ESTUDANTE": f"E{j}",
+            "administrado": ",".join(banco.id_item[i] for i in itens),
+            "acertos": ",".join(str(v) for v in rng.integers(0, 2, n)),
+        })
+    testes.append({"ESTUDANTE": "invalido", "administrado": "NAO_EXISTE", "acertos": "1"})
+    entrada = tmp_path / "testes.jsonl"
+    entrada.write_text("".join(json.dumps(t) + "\n" for t in testes))
+
+    saida = tmp_path / "saida.jsonl"
+    escritor = EscritorSaida(str(saida))
+    relatorio = reescorar(
+        ler_testes(str(entrada)), FonteBancos({"reescore": banco}), escritor,
+        tamanho_bloco=3, processos=1, id_padrao="reescore"
+    )
+    escritor.fechar()
+    assert relatorio["testes"] == 8 and relatorio["erros"] == 1
+
+    resultados = {r["ESTUDANTE"]: r for r in map(json.loads, saida.read_text().splitlines())}
+    assert "erro" in resultados["invalido"]
+    for t in testes[:-1]:
+        idx = banco.indices([i for i in t["administrado"].split(",") if i])
+        acertos = np.array([int(v) for v in t["acertos"].split(",") if v])
+        theta, ep = EAP_grade(acertos, banco.grade(idx))
+        assert resultados[t["ESTUDANTE"]]["theta"] == pytest.approx(theta, abs=1e-9)
+        assert resultados[t["ESTUDANTE"]]["proficiencia"] == round(escala_saeb(theta, ep, "LP")[0], 4)
+
+# Testes para alteração incremental de bancos
+def test_alterar_banco_igual_a_reconstruir():
+    from services.banco import banco_do_payload, alterar_banco
+    from services.cache import cache_decisoes
+
+    campos = _banco_sintetico(n_itens=12, seed=17)
+    banco = banco_do_payload(campos, id_banco="alterar").preparar()
+    alterado = alterar_banco(
+        banco,
+        remover=["ITEM2", "ITEM5"],
+        recalibrar={"idItem": "ITEM7", "parA": "0.03", "parB": "270.0", "parC": "0.2", "idEixo": "2"},
+        adicionar={"idItem": "NOVO1,NOVO2", "parA": "0.02,0.025", "parB": "240,310", "parC": "0.15,0.2",
+                   "idEixo": "1,3", "idHabilidade": "50,51"},
+    )
+    assert alterado.versao == banco.versao + 1
+    assert banco.n_itens == 12 and "ITEM2" in banco.indice
+
+    # Mesmo banco montado do zero com os itens resultantes
+    linhas = {k: campos[k].split(",") for k in ("idItem", "parA", "parB", "parC", "idEixo", "idHabilidade")}
+    linhas["parA"][6], linhas["parB"][6], linhas["parC"][6], linhas["idEixo"][6] = "0.03", "270.0", "0.2", "2"
+    manter = [i for i in range(12) if i not in (1, 4)]
+    esperado = {k: [v[i] for i in manter] for k, v in linhas.items()}
+    for k, novos in (("idItem", ["NOVO1", "NOVO2"]), ("parA", ["0.02", "0.025"]), ("parB", ["240", "310"]),
+                     ("parC", ["0.15", "0.2"]), ("idEixo", ["1", "3"]), ("idHabilidade", ["50", "51"])):
+        esperado[k] += novos
+    reconstruido = banco_do_payload(
+        {**{k: ",".join(v) for k, v in esperado.items()}, "componente": "LP"}, id_banco="alterar"
+    ).preparar()
+
+    assert alterado.id_item == reconstruido.id_item
+    assert alterado.impressao == reconstruido.impressao
+    assert np.allclose(alterado.P_grade, reconstruido.P_grade)
+    assert np.allclose(alterado.tabela_informacao.tabela, reconstruido.tabela_informacao.tabela)
+    assert cache_decisoes.chave(alterado, 8, 500.0, 45, [], []) != cache_decisoes.chave(banco, 8, 500.0, 45, [], [])
+
+    with pytest.raises(ValueError):
+        alterar_banco(banco, adicionar={**campos, "idItem": campos["idItem"]})
+    with pytest.raises(ValueError):
+        alterar_banco(banco, remover=["NAO_EXISTE"])
+
+def test_patch_bancos_endpoint(sample_request_data):
+    client.post("/bancos", json={**_banco_sintetico(n_itens=10, seed=18), "idBanco": "patch-teste"})
+    response = client.patch("/bancos/patch-teste", json={"remover": "ITEM1,ITEM2"})
+    assert response.status_code == 200
+    assert response.json() == {"idBanco": "patch-teste", "versao": 1, "nItens": 8}
+    assert client.patch("/bancos/patch-teste", json={"remover": "ITEM1"}).status_code == 400
+    assert client.patch("/bancos/nao-existe", json={}).status_code == 404
+
+# Testes para a auditoria das decisões
+def test_auditoria_grava_em_lotes_e_descarta(tmp_path):
+    import gzip
+    from services.auditoria import Auditoria, REGISTROS_AUDITORIA
+
+    registro = Auditoria(diretorio=str(tmp_path), max_fila=5, tamanho_lote=2, intervalo=0.05,
+                         max_bytes=1, comprimir=True)
+    descartados = REGISTROS_AUDITORIA.valor(resultado="descartado")
+    # Com a thread parada, a fila enche e os excedentes são descartados sem bloquear
+    registro._garantir_thread = lambda: None
+    aceitos = [registro.registrar({"n": i}) for i in range(8)]
+    assert aceitos.count(True) == 5
+    assert REGISTROS_AUDITORIA.valor(resultado="descartado") == descartados + 3
+
+    del registro._garantir_thread
+    registro.registrar({"n": 8})
+    registro.encerrar()
+    arquivos = sorted(tmp_path.glob("auditoria-*.jsonl.gz"))
+    assert len(arquivos) == 3  # max_bytes=1: um arquivo por lote
+    linhas = [json.loads(l) for a in arquivos for l in gzip.open(a, "rt").read().splitlines()]
+    assert sorted(r["n"] for r in linhas) == [0, 1, 2, 3, 4, 8]
+
+def test_proximo_auditado(sample_request_data, tmp_path, monkeypatch):
+    from services.auditoria import auditoria
+    from services.cache import cache_decisoes
+
+    cache_decisoes.limpar()
+    monkeypatch.setattr(auditoria, "diretorio", str(tmp_path))
+    request_data = {**sample_request_data, **_banco_sintetico(seed=19)}
+    request_data.update(administrado="ITEM1,ITEM2", respostas="A,B", gabarito="A,A")
+    for _ in range(2):
+        assert client.post("/proximo", json=request_data).status_code == 200
+    auditoria.encerrar()
+
+    registros = [json.loads(l) for a in tmp_path.glob("*.jsonl") for l in a.read_text().splitlines()]
+    assert [r["origem"] for r in registros] == ["calculo", "cache"]
+    calculado = registros[0]
+    assert calculado["administrado"] == [0, 1] and calculado["acertos"] == "10"
+    assert calculado["motivo"] is None and calculado["informacao"] > 0
+    # A decisão servida pelo cache é auditada com os valores do cálculo
+    campos = ("item", "theta", "ep", "motivo", "informacao")
+    assert [registros[1][c] for c in campos] == [calculado[c] for c in campos]
+
+    # Decisões de parada guardam também o motivo
+    itens = request_data["idItem"].split(",")
+    request_data.update(administrado=",".join(itens[:40]), respostas=",".join(["A"] * 40),
+                        gabarito=",".join(["A"] * 40))
+    for _ in range(2):
+        assert client.post("/proximo", json=request_data).json()[0] == -1
+    auditoria.encerrar()
+    registros = [json.loads(l) for a in sorted(tmp_path.glob("*.jsonl")) for l in a.read_text().splitlines()][2:]
+    assert [r["origem"] for r in registros] == ["calculo", "cache"]
+    assert registros[0]["motivo"] is not None and registros[0]["ep"] is not None
+    assert [registros[1][c] for c in campos] == [registros[0][c] for c in campos]
+
+# Testes para o perfil por requisição
+def test_perfil_por_cabecalho(sample_request_data, monkeypatch):
+    from fastapi import FastAPI
+    from routers.api import router as api_router
+    from routers.perfil import router as perfil_router
+    from services import metricas as modulo_metricas
+    from services.cache import cache_decisoes
+    from services.perfil import perfis, middleware_perfil
+
+    cache_decisoes.limpar()
+    monkeypatch.setattr(perfis, "aceitar_cabecalho", True)
+    monkeypatch.setattr(modulo_metricas, "coletando_perfis", True)
+    perfis.limpar()
+    app_perfil = FastAPI()
+    app_perfil.include_router(api_router)
+    app_perfil.include_router(perfil_router)
+    app_perfil.middleware("http")(middleware_perfil)
+    cliente = TestClient(app_perfil)
+
+    request_data = {**sample_request_data, **_banco_sintetico(seed=20)}
+    request_data.update(administrado="ITEM1", respostas="A", gabarito="A")
+    assert "X-TAI-Perfil-Id" not in cliente.post("/proximo", json=request_data).headers
+
+    cache_decisoes.limpar()
+    response = cliente.post("/proximo", json=request_data, headers={"X-TAI-Perfil": "cprofile"})
+    id_perfil = response.headers["X-TAI-Perfil-Id"]
+    perfil = cliente.get(f"/debug/perfis/{id_perfil}").json()
+    assert perfil["status"] == 200 and perfil["cprofile"]
+    assert {"parse", "eap", "selecao", "proximo"} <= set(perfil["etapas"])
+    assert "calcular_proximo" in cliente.get(f"/debug/perfis/{id_perfil}/cprofile").text
+    assert [p["id"] for p in cliente.get("/debug/perfis").json()["perfis"]] == [id_perfil]
+    assert cliente.get("/debug/perfis/nao-existe").status_code == 404
+
+# Testes para o transporte comprimido e o codec JSON
+def test_proximo_corpo_comprimido(sample_request_data):
+    import gzip
+    import zlib
+    from utils.transporte import descomprimir
+
+    request_data = {**sample_request_data, **_banco_sintetico(n_itens=300, seed=21)}
+    request_data.update(administrado="ITEM1,ITEM2", respostas="A,B", gabarito="A,A")
+    esperado = client.post("/proximo", json=request_data).json()
+    corpo = json.dumps(request_data).encode()
+
+    for codificacao, comprimido in (("gzip", gzip.compress(corpo)), ("deflate", zlib.compress(corpo))):
+        response = client.post("/proximo", content=comprimido, headers={
+            "Content-Encoding": codificacao, "Content-Type": "application/json"
+        })
+        assert response.status_code == 200
+        assert response.json() == esperado
+        assert len(comprimido) < len(corpo) / 2
+
+    assert client.post("/proximo", content=corpo, headers={
+        "Content-Encoding": "br", "Content-Type": "application/json"
+    }).status_code == 415
+    assert client.post("/proximo", content=b"nao comprimido", headers={
+        "Content-Encoding": "gzip", "Content-Type": "application/json"
+    }).status_code == 400
+    with pytest.raises(OverflowError):
+        descomprimir(gzip.compress(b"0" * 1000), "gzip", limite=100)
+
+def test_resposta_comprimida_e_codec_json(monkeypatch):
+    from utils import transporte
+
+    estudantes = [{"ESTUDANTE": f"A{j}", "AnoEscolarEstudante": "8", "profic.inic": "500.0",
+                   "administrado": "", "respostas": "", "gabarito": "", "n.Ij": "45"} for j in range(50)]
+    response = client.post("/proximo/lote", json={**_banco_sintetico(seed=22), "estudantes": estudantes})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()["resultados"]) == 50
+
+    # A serialização da resposta é a mesma com e sem orjson
+    valor = [-1, "NA", np.float64(243.1234), round(np.float64(25.55555), 4)]
+    rapido = transporte.serializar_json(valor)
+    monkeypatch.setattr(transporte, "JSON_RAPIDO", False)
+    assert json.loads(rapido) == json.loads(transporte.serializar_json(valor))
+
+
+def test_criterios_pwi_kl_iguais_a_definicao():
+    from services.adaptive_testing import quadratura, maxima_informacao_th
+    from services.banco import banco_do_payload, alterar_banco
+    from services.informacao import informacao_criterio, pesos_posteriori
+    from services.lote import EstudanteLote, proximo_lote
+    from routers.api import decidir_proximo
+
+    banco = banco_do_payload(_banco_sintetico(n_itens=30, seed=21), id_banco="criterios").preparar()
+    Xr, log_priori = quadratura()
+    adm, acertos = [3, 8, 15], [1, 0, 1]
+    log_post = log_priori + sum(
+        np.log(banco.P_grade[:, i]) if u else np.log1p(-banco.P_grade[:, i]) for i, u in zip(adm, acertos)
+    )
+    w = pesos_posteriori(log_post)
+    theta = float(w @ Xr)
+
+    # Definições item a item
+    pwi = [sum(w[k] * maxima_informacao_th(Xr[k], banco.PAR[j:j + 1])[0] for k in range(len(Xr)))
+           for j in range(banco.n_itens)]
+    a, b, c = banco.PAR.T
+    P_theta = c + (1 - c) / (1 + np.exp(-a * (theta - b)))
+    kl = [sum(w[k] * (P_theta[j] * np.log(P_theta[j] / banco.P_grade[k, j])
+                      + (1 - P_theta[j]) * np.log((1 - P_theta[j]) / (1 - banco.P_grade[k, j])))
+              for k in range(len(Xr))) for j in range(banco.n_itens)]
+    assert np.allclose(informacao_criterio(banco, theta, w, "pwi"), pwi)
+    assert np.allclose(informacao_criterio(banco, theta, w, "kl"), kl)
+    assert np.allclose(informacao_criterio(banco, np.array([theta]), w[None, :], "kl")[0], kl)
+
+    # Lote e individual escolhem o mesmo item
+    for criterio in ("pwi", "kl"):
+        individual = decidir_proximo(banco, 8, 500.0, 45, adm, acertos, criterio=criterio)
+        lote = proximo_lote(banco, [EstudanteLote(8, 500.0, 45, adm, acertos), EstudanteLote(8, 500.0, 45, [], [])],
+                            criterio=criterio)
+        assert lote[0][:6] == individual[:6]
+
+    # As tabelas por nó acompanham a alteração incremental do banco
+    alterado = alterar_banco(banco, remover=["ITEM2"], adicionar={
+        "idItem": "NOVO", "parA": "0.02", "parB": "260", "parC": "0.2", "idEixo": "1", "idHabilidade": "9"})
+    reconstruido = banco_do_payload({**_banco_sintetico(n_itens=30, seed=21)}, id_banco="x")
+    assert alterado.informacao_grade.shape == alterado.log_P_grade.shape[1:] == (len(Xr), 30)
+    assert np.allclose(alterado.informacao_grade[:, :-1], np.delete(reconstruido.informacao_grade, 1, axis=1))
+    assert np.allclose(alterado.log_P_grade[..., :-1], np.delete(reconstruido.log_P_grade, 1, axis=-1))
+
+
+def test_perfis_pontuacao_vetorizados_e_recarga(tmp_path):
+    import time
+    from services.adaptive_testing import escala_saeb, theta_da_escala_saeb, motivo_parada, motivo_parada_lote
+    from services.perfis_pontuacao import RegistroPerfis, ARQUIVO_PADRAO, perfis_pontuacao
+
+    # A escala de cada componente é a mesma na transformação dos itens e na conversão de volta
+    for componente in ("LP", "MT", "CN", "CH"):
+        PAR = transformar_parametros(np.array([[0.02, 310.0, 0.2]]), componente)
+        assert np.isclose(theta_da_escala_saeb(310.0, componente), PAR[0, 1])
+        assert np.isclose(escala_saeb(PAR[0, 1], 1.0, componente)[0], 310.0)
+    theta = np.linspace(-2, 2, 5)
+    saeb, erro = escala_saeb(theta, np.full(5, 0.3), "CN")
+    assert np.allclose(saeb, [escala_saeb(t, 0.3, "CN")[0] for t in theta]) and np.allclose(erro, 0.3 * 55.7899)
+
+    # Anos com e sem perfil no mesmo lote
+    anos = np.array([2, 5, 8, 9, 12, 8])
+    n_resp = np.array([8, 16, 20, 32, 10, 43])
+    ep = np.array([0.6, 0.45, 0.9, 0.9, 0.9, 0.9])
+    th = np.array([-2.5, 0.1, 0.5, 1.0, 0.0, 0.3])
+    lote = motivo_parada_lote(th, ep, n_resp, True, anos, 45, Area="MT")
+    assert list(lote) == [motivo_parada(t, e, n_resp=int(n), Area="MT", AnoEscolar=int(a)) or ""
+                          for t, e, n, a in zip(th, ep, n_resp, anos)]
+
+    # Recarga a quente: só o arquivo muda; um arquivo inválido mantém os perfis em uso
+    config = json.load(open(ARQUIVO_PADRAO, encoding="utf-8"))
+    arquivo = tmp_path / "perfis.json"
+    arquivo.write_text(json.dumps(config))
+    registro = RegistroPerfis(str(arquivo), intervalo=0.01)
+    assert registro.atual.perfil("LP", 8).ep == 0.5
+    config["componentes"]["LP"]["anos"]["8"]["ep"] = 0.4
+    config["componentes"]["LP"]["inclinacao"] = 50.0
+    arquivo.write_text(json.dumps(config) + " ")
+    time.sleep(0.02)
+    perfil = registro.atual.perfil("LP", 8)
+    assert perfil.ep == 0.4 and perfil.inclinacao == 50.0 and registro.atual.perfil("LP", 7).ep == 0.5
+    impressao = registro.atual.impressao
+    arquivo.write_text("{")
+    time.sleep(0.02)
+    assert registro.atual.impressao == impressao != perfis_pontuacao.atual.impressao
+
+
+def test_banco_reescalado_apos_recarga_dos_perfis(tmp_path, monkeypatch):
+    from services.armazenamento import salvar_banco, carregar_banco
+    from services.banco import RegistroBancos, criar_banco
+    from services.perfis_pontuacao import PerfisPontuacao, ARQUIVO_PADRAO, perfis_pontuacao
+    from services.sessoes import SessaoTeste
+
+    rng = np.random.default_rng(8)
+    n = 30
+    campos = dict(componente="LP", id_item=[f"ITEM{i}" for i in range(n)], parA=rng.uniform(0.01, 0.04, n),
+                  parB=rng.normal(250, 50, n), parC=rng.uniform(0.1, 0.25, n), id_eixo=np.arange(n) % 3 + 1,
+                  id_habilidade=np.arange(n), id_banco="reescala")
+    banco = criar_banco(**campos).preparar()
+    assert carregar_banco(salvar_banco(banco, str(tmp_path))).escala == banco.escala
+    registro = RegistroBancos()
+    registro.registrar(banco)
+    sessao = SessaoTeste(id="reescala", banco=banco, ano_escolar=8, profic_inic=500.0, n_Ij=45)
+    sessao.iniciar()
+
+    # Recarga que muda a escala de LP: o banco registrado passa a usar a escala nova
+    config = json.load(open(ARQUIVO_PADRAO, encoding="utf-8"))
+    config["componentes"]["LP"].update(inclinacao=50.0, intercepto=240.0)
+    monkeypatch.setattr(perfis_pontuacao, "_perfis", PerfisPontuacao(config))
+    reescalado = registro.obter("reescala")
+    assert reescalado is not banco and reescalado.versao == banco.versao + 1
+    assert reescalado.escala == (50.0, 240.0)
+    novo = criar_banco(**campos).preparar()
+    assert np.allclose(reescalado.PAR, novo.PAR) and np.allclose(reescalado.P_grade, novo.P_grade)
+    assert registro.obter("reescala") is reescalado
+
+    # A sessão iniciada com a escala anterior não mistura as duas
+    with pytest.raises(ValueError):
+        sessao.responder(1)
+
+def test_proximo_com_checkpoint_igual_sem_checkpoint():
+    from services.cache import cache_decisoes
+    from services.checkpoint import checkpoints, USOS_CHECKPOINT
+
+    banco = _banco_sintetico(n_itens=60, seed=5)
+    usados = USOS_CHECKPOINT._valores.get(("usado",), 0)
+    rng = np.random.default_rng(11)
+    administrado, respostas, checkpoint = [], [], ""
+    while True:
+        cache_decisoes.limpar()
+        payload = {
+            **banco, "ESTUDANTE": "Aluno1", "AnoEscolarEstudante": "8", "proficiencia": "500.0",
+            "profic.inic": "500.0", "administrado": ",".join(administrado), "respostas": ",".join(respostas),
+            "gabarito": ",".join(["A"] * len(respostas)), "erropadrao": "0.5", "n.Ij": "45",
+        }
+        sem = client.post("/proximo", json=payload).json()
+        com = client.post("/proximo", json={**payload, "checkpoint": checkpoint}).json()
+        assert len(sem) == 8 and len(com) == 9
+        assert com[:6] == sem[:6]
+        if sem[0] == -1:
+            assert np.allclose(com[6:8], sem[6:8], atol=1e-2) and com[8] is None
+            assert USOS_CHECKPOINT._valores.get(("usado",), 0) - usados == len(respostas)
+            break
+        if sem[7] != "NA":
+            assert np.allclose(np.array(com[6:8], dtype=float), np.array(sem[6:8], dtype=float), atol=1e-2)
+        checkpoint = com[8]
+        administrado.append(com[0])
+        respostas.append("A" if rng.random() < 0.6 else "B")
+
+    # Checkpoint adulterado ou de outras respostas: ignorado, posteriori calculada do zero
+    from services.banco import banco_do_payload
+    b = banco_do_payload(banco)
+    idx = b.indices(administrado)
+    acertos = [r == "A" for r in respostas]
+    texto = checkpoints.gerar(b, np.zeros(61), idx[:-1], acertos[:-1])
+    assert checkpoints.posteriori(texto, b, idx, acertos)[1]
+    adulterado = texto[:-3] + ("A" if texto[-3] != "A" else "B") + texto[-2:]
+    assert not checkpoints.posteriori(adulterado, b, idx, acertos)[1]
+    assert not checkpoints.posteriori(texto, b, idx, [not acertos[0]] + acertos[1:])[1]
+    assert not checkpoints.posteriori("lixo", b, idx, acertos)[1]
+
+
+def test_ingestao_valida_e_grava_versoes(tmp_path):
+    from services.armazenamento import carregar_id
+    from services.banco import banco_do_payload
+    from services.ingestao import ingerir
+
+    campos = _banco_sintetico(n_itens=24, seed=8)
+    colunas = ("idItem", "parA", "parB", "parC", "idEixo", "idHabilidade")
+    valores = [campos[c].split(",") for c in colunas]
+    # Planilha com ";" e vírgula decimal
+    arquivo = tmp_path / "banco.csv"
+    arquivo.write_text(";".join(colunas) + "\n" + "\n".join(
+        ";".join(v.replace(".", ",") for v in linha) for linha in zip(*valores)
+    ), encoding="utf-8")
+
+    resumo = ingerir(str(arquivo), "LP", saida=str(tmp_path / "bancos"), id_banco="LP-ing", eixos_esperados=[1, 2, 3])
+    assert resumo["valido"] and resumo["gravado"] and resumo["versao"] == 0
+    assert resumo["itensPorEixo"] == {1: 8, 2: 8, 3: 8}
+    gravado = carregar_id(str(tmp_path / "bancos"), "LP-ing")
+    esperado = banco_do_payload(campos, id_banco="LP-ing")
+    assert gravado.impressao == esperado.impressao
+    assert np.allclose(gravado.informacao_grade, esperado.informacao_grade)
+    eixos, ordem, inicios = gravado.particao_eixos
+    assert list(eixos) == [1, 2, 3] and set(np.asarray(gravado.id_eixo)[ordem[inicios[1]:inicios[2]]]) == {2}
+
+    # Mesmo conteúdo não é regravado; conteúdo novo incrementa a versão
+    assert not ingerir(str(arquivo), "LP", saida=str(tmp_path / "bancos"), id_banco="LP-ing")["gravado"]
+    arquivo.write_text(arquivo.read_text(encoding="utf-8").replace(valores[1][0].replace(".", ","), "0,03", 1),
+                       encoding="utf-8")
+    assert ingerir(str(arquivo), "LP", saida=str(tmp_path / "bancos"), id_banco="LP-ing")["versao"] == 1
+
+    # Erros: parâmetro fora da faixa, texto inválido, idItem repetido, habilidade em dois eixos, eixo ausente
+    ruim = tmp_path / "ruim.csv"
+    ruim.write_text(
+        "idItem,parA,parB,parC,idEixo,idHabilidade\n"
+        "I1,0.02,250,0.2,1,10\nI1,-0.01,250,0.2,1,10\nI3,abc,250,1.5,2,10\nI4,0.02,250,0.2,2,11\n",
+        encoding="utf-8",
+    )
+    resumo = ingerir(str(ruim), "LP", saida=str(tmp_path / "bancos"), eixos_esperados=[1, 2, 3])
+    assert not resumo["valido"] and "gravado" not in resumo
+    erros = " | ".join(resumo["erros"])
+    for trecho in ("parA fora da faixa na linha 3", "parA inválido na linha 4", "parC fora da faixa na linha 4",
+                   "idItem repetido: I1", "Habilidade 10 aparece em mais de um eixo", "Eixos sem itens: [3]"):
+        assert trecho in erros
+
+    # Linhas em branco são ignoradas (e não deslocam a numeração); linhas curtas são apontadas
+    ruim.write_text(
+        "idItem,parA,parB,parC,idEixo,idHabilidade\n\n"
+        "I1,0.02,250,0.2,1,10\nI2,0.02,250,1.5,1,11\n\n",
+        encoding="utf-8",
+    )
+    resumo = ingerir(str(ruim), "LP")
+    assert resumo["nItens"] == 2 and resumo["erros"] == ["parC fora da faixa na linha 4 (I2): '1.5'"]
+    ruim.write_text("idItem,parA,parB,parC,idEixo,idHabilidade\nI1,0.02,250,0.2,1,10\nI2,0.02,250,0.2,1\n",
+                    encoding="utf-8")
+    assert ingerir(str(ruim), "LP")["erros"] == ["Linha 3 com 5 campos; o cabeçalho tem 6"]
+
+def test_selecao_balanceada_por_eixo():
+    from services.banco import criar_banco
+    from services.decisao import selecionar_item
+    from services.informacao import contagem_eixos, itens_do_eixo, administrados_do_eixo
+    from services.lote import proximo_lote, EstudanteLote
+    from services.simulacao import simular
+    rng = np.random.default_rng(11)
+    n = 90
+    id_eixo = rng.choice([3, 1, 7], n, p=[0.6, 0.3, 0.1])
+    banco = criar_banco(
+        "LP", [f"ITEM{i}" for i in range(n)], rng.lognormal(np.log(0.02), 0.3, n), rng.normal(250, 50, n),
+        rng.uniform(0.1, 0.25, n), id_eixo, np.arange(n) % 15, id_banco="eixos"
+    ).preparar()
+    eixos, _, _ = banco.particao_eixos
+    assert eixos.tolist() == [1, 3, 7]
+    assert np.array_equal(eixos[banco.posicao_eixo], id_eixo)
+
+    administrado = list(rng.choice(n, 12, replace=False))
+    mascara = np.zeros(n, dtype=bool)
+    mascara[administrado] = True
+    contagem = contagem_eixos(banco, administrado)
+    assert contagem.tolist() == [int(np.sum(id_eixo[administrado] == e)) for e in eixos]
+    assert np.array_equal(contagem_eixos(banco, mascara[None].repeat(2, 0)), [contagem, contagem])
+
+    # Máxima informação dentro do eixo menos representado (com itens disponíveis)
+    disponivel = [np.setdiff1d(np.flatnonzero(id_eixo == e), administrado) for e in eixos]
+    alvo = min((k for k in range(3) if len(disponivel[k])), key=lambda k: (contagem[k], k))
+    esperado = disponivel[alvo][np.argmax(banco.informacao(0.3)[disponivel[alvo]])]
+    for adm, cont in [(administrado, None), (mascara, None), (administrado, contagem)]:
+        assert selecionar_item(banco, 0.3, adm, balancear=True, contagem=cont) == esperado
+    assert selecionar_item(banco, 0.3, administrado, balancear=True, criterio="pwi",
+                           pesos=np.full(61, 1 / 61)) in set(disponivel[alvo].tolist())
+    assert selecionar_item(banco, 0.3, administrado, randomesque=4, balancear=True) in set(disponivel[alvo].tolist())
+
+    # Bancos ordenados por eixo: o eixo é um slice e os aplicados, posições dentro dele
+    ordenado = criar_banco("LP", [f"I{i}" for i in range(n)], np.full(n, 0.02), np.linspace(150, 350, n),
+                           np.full(n, 0.2), np.sort(id_eixo), np.arange(n) % 15)
+    inicio, fim = int(np.sum(id_eixo == 1)), int(np.sum(id_eixo <= 3))
+    assert itens_do_eixo(ordenado, 1) == slice(inicio, fim)
+    assert administrados_do_eixo(ordenado, 1, [0, inicio + 2, n - 1]).tolist() == [2]
+
+    # O lote escolhe, por estudante, o mesmo item da seleção individual balanceada
+    estudantes = [EstudanteLote(8, 500.0, 45, [], [])] + [
+        EstudanteLote(8, 500.0, 45, list(map(int, rng.choice(n, k, replace=False))), list(rng.integers(0, 2, k)))
+        for k in (1, 3, 6)
+    ]
+    detalhes = []
+    resultados = proximo_lote(banco, estudantes, detalhes, balancear=True)
+    for e, r, d in zip(estudantes, resultados, detalhes):
+        assert int(r[2]) == selecionar_item(banco, d["theta"], e.administrado_idx, balancear=True)
+
+    # Na simulação, os eixos ficam representados de forma equilibrada apesar do banco desigual
+    resultado = simular(banco, 200, tamanho_lote=100, processos=1, semente=1, balancear=True)
+    media = np.array(list(resultado["itensPorEixo"].values()))
+    assert resultado["balancearEixos"] and media.max() - media.min() <= 1.0
+
+def test_proximo_lote_auditado_registra_motivos(tmp_path, monkeypatch):
+    from services.auditoria import auditoria
+
+    monkeypatch.setattr(auditoria, "diretorio", str(tmp_path))
+    banco = _banco_sintetico(seed=23)
+    itens = banco["idItem"].split(",")
+    estudantes = [
+        {
+            "ESTUDANTE": f"Aluno{j}", "AnoEscolarEstudante": "8", "profic.inic": "500.0", "n.Ij": "45",
+            "administrado": ",".join(itens[:n]), "respostas": ",".join(["A"] * n), "gabarito": ",".join(["A"] * n),
+        }
+        # Mais estudantes que caracteres em qualquer motivo de parada, com e sem parada
+        for j, n in enumerate([0, 2, 5] + [32] * 12)
+    ]
+    response = client.post("/proximo/lote", json={**banco, "estudantes": estudantes})
+    assert response.status_code == 200
+    resultados = response.json()["resultados"]
+    auditoria.encerrar()
+
+    registros = [json.loads(l) for a in tmp_path.glob("*.jsonl") for l in a.read_text().splitlines()]
+    assert [r["estudante"] for r in registros] == [e["ESTUDANTE"] for e in estudantes]
+    for registro, resultado in zip(registros, resultados):
+        assert (registro["motivo"] is None) == (resultado[0] != -1)
+        assert registro["motivo"] is None or len(registro["motivo"]) > 1
+
+def test_registro_bancos_entre_workers(tmp_path):
+    import shutil
+    from concurrent.futures import ThreadPoolExecutor
+    from services.armazenamento import salvar_banco, carregar_banco
+    from services.banco import RegistroBancos, banco_do_payload, alterar_banco
+
+    # Dois registros sobre o mesmo diretório fazem o papel de dois workers
+    banco = banco_do_payload(_banco_sintetico(n_itens=12, seed=24), id_banco="compartilhado")
+    salvar_banco(banco, str(tmp_path))
+    a = RegistroBancos(diretorio=str(tmp_path), intervalo=0)
+    b = RegistroBancos(diretorio=str(tmp_path), intervalo=3600)
+    assert a.obter("compartilhado").versao == b.obter("compartilhado").versao == 0
+
+    def alterar(registro, item):
+        with registro.bloqueio("compartilhado"):
+            atual = registro.obter("compartilhado", verificar=True)
+            alterado = alterar_banco(atual, remover=[item])
+            registro.registrar(carregar_banco(salvar_banco(alterado, str(tmp_path))))
+
+    # Alterações simultâneas, pelos dois "workers", não se perdem
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(alterar, [a, b] * 4, [f"ITEM{i}" for i in range(1, 9)]))
+    assert a.obter("compartilhado").n_itens == 4 and a.obter("compartilhado").versao == 8
+
+    # O outro worker vê a versão nova depois do intervalo (aqui, ao forçar a verificação)
+    b.intervalo = 0
+    assert b.obter("compartilhado").id_item == [f"ITEM{i}" for i in range(9, 13)]
+    a.remover("compartilhado")
+    shutil.rmtree(os.path.join(str(tmp_path), "compartilhado"))
+    assert b.obter("compartilhado") is None and "compartilhado" not in b
+
+def test_banco_preparado_escolhe_o_mesmo_item_do_calculo_exato():
+    from services.banco import criar_banco
+    from services.decisao import selecionar_item
+    from services.lote import proximo_lote, EstudanteLote
+    from services.simulacao import simular_lote
+
+    rng = np.random.default_rng(25)
+    n = 400
+    campos = dict(
+        componente="LP", id_item=[f"ITEM{i}" for i in range(n)], parA=rng.lognormal(np.log(0.02), 0.3, n),
+        parB=rng.normal(250, 50, n), parC=rng.uniform(0.1, 0.25, n), id_eixo=np.arange(n) % 4 + 1,
+        id_habilidade=np.arange(n) % 20,
+    )
+    exato = criar_banco(**campos)
+    preparado = criar_banco(**campos).preparar()
+    assert "tabela_informacao" not in exato.__dict__
+
+    # Mesmo item com a tabela interpolada (banco registrado) e com a 3PL (banco no payload)
+    thetas = rng.normal(0, 1.2, 3000)
+    administrados = [list(rng.choice(n, rng.integers(0, 30), replace=False)) for _ in thetas]
+    for theta, administrado in zip(thetas, administrados):
+        assert selecionar_item(preparado, theta, administrado) == selecionar_item(exato, theta, administrado)
+
+    estudantes = [EstudanteLote(8, 500.0, 45, a, list(rng.integers(0, 2, len(a)))) for a in administrados[:200]]
+    detalhes = []
+    for e, r, d in zip(estudantes, proximo_lote(preparado, estudantes, detalhes), detalhes):
+        if r[0] != -1:
+            assert int(r[2]) == selecionar_item(exato, d["theta"], e.administrado_idx)
+
+    # A simulação seleciona como o /proximo: mesmos testes com e sem a tabela
+    theta_real = rng.normal(0, 1, 500)
+    com_tabela = simular_lote(preparado, theta_real, semente=3)
+    sem_tabela = simular_lote(exato, theta_real, semente=3)
+    assert np.array_equal(com_tabela.exposicao, sem_tabela.exposicao)
+    assert np.array_equal(com_tabela.theta_est, sem_tabela.theta_est)
+
+def test_sessao_probabilidade_saturada_e_respostas_simultaneas():
+    from concurrent.futures import ThreadPoolExecutor
+    from services.banco import criar_banco, banco_sintetico
+    from services.sessoes import SessaoTeste, ArmazemSessoes, RespostaConflitante
+
+    # Itens sem acerto ao acaso e muito discriminativos: P satura em 0 ou 1 nos nós extremos
+    n = 20
+    banco = criar_banco("LP", [f"ITEM{i}" for i in range(n)], np.full(n, 2.0), np.linspace(150, 350, n),
+                        np.zeros(n), np.arange(n) % 2 + 1, np.arange(n)).preparar()
+    sessao = SessaoTeste(id="saturada", banco=banco, ano_escolar=8, profic_inic=500.0, n_Ij=45)
+    sessao.iniciar()
+    for acerto in (1, 0, 1, 0):
+        sessao.responder(acerto)
+        assert np.all(np.isfinite(sessao.log_posteriori)) and np.all(np.isfinite(sessao.estimativa()))
+
+    # Respostas simultâneas à mesma sessão: cada uma responde um item diferente
+    sessao = SessaoTeste(id="simultanea", banco=banco_sintetico(60), ano_escolar=8, profic_inic=500.0, n_Ij=45)
+    sessao.iniciar()
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda _: sessao.responder(1), range(8)))
+    assert sessao.n_resp == 8 and len(set(sessao.ordem)) == 8 and sessao.administrado.sum() == 8
+
+    # Respostas simultâneas ao mesmo item (reenvios): só uma é aplicada e a memória
+    # contabilizada acompanha a sessão
+    armazem = ArmazemSessoes()
+    sessao = armazem.criar(banco_sintetico(60), 8, 500.0, 45)
+    sessao.iniciar()
+    id_item = sessao.banco.id_item[sessao.item_atual]
+
+    def reenviar(_):
+        try:
+            armazem.atualizar(sessao, sessao.responder(1, id_item=id_item)[1])
+            return True
+        except RespostaConflitante:
+            return False
+
+    with ThreadPoolExecutor(8) as pool:
+        assert sorted(pool.map(reenviar, range(8))) == [False] * 7 + [True]
+    assert sessao.ordem == [sessao.banco.indice[id_item]]
+    assert armazem.bytes_em_uso == sessao.tamanho_bytes
@@ -1,9 +1,43 @@
+import base64
+
+import numpy as np
+
+# Tipos aceitos na codificação binária (base64) de vetores numéricos
+DTYPES_BINARIOS = {"<f8", "<f4", "<i8", "<i4", "u1"}
+
 def parse_str_list(value: str, cast_type=float):
     """Transforma string separada por vírgula em lista do tipo desejado"""
     if not value:
         return []
     return [cast_type(v.strip()) for v in value.split(",")]
 
+def decodificar_vetor(value, dtype=float) -> np.ndarray:
+    """
+    Converte um campo numérico do payload em vetor NumPy. Aceita o formato texto
+    separado por vírgula, uma lista JSON ou {"b64": ..., "dtype": "<f8"} com os bytes
+    little-endian codificados em base64.
+    """
+    if isinstance(value, dict):
+        tipo = value.get("dtype", "<f8")
+        if tipo not in DTYPES_BINARIOS:
+            raise ValueError(f"dtype não suportado: {tipo}")
+        return np.frombuffer(base64.b64decode(value["b64"]), dtype=tipo).astype(dtype, copy=False)
+    if isinstance(value, str):
+        if not value.strip():
+            return np.empty(0, dtype=dtype)
+        return np.array(value.split(","), dtype=dtype)
+    return np.asarray(value, dtype=dtype)
+
+def decodificar_textos(value) -> list:
+    """Converte um campo de identificadores (texto separado por vírgula ou lista) em lista, sem vazios."""
+    if isinstance(value, str):
+        return [v for v in value.split(",") if v]
+    return [str(v) for v in value if v != ""]
+
+def codificar_vetor(valores, dtype="<f8") -> dict:
+    """Inverso de decodificar_vetor para o formato binário."""
+    return {"b64": base64.b64encode(np.asarray(valores, dtype=dtype).tobytes()).decode(), "dtype": dtype}
+
 def normalizar_componente(componente: str) -> str:
     """Mapeia o nome do componente para o código esperado"""
     mapa = {
@@ -12,4 +46,35 @@ def normalizar_componente(componente: str) -> str:
         "Ciências da Natureza": "CN",
         "Ciências Humanas": "CH"
     }
-    return mapa.get(componente.strip(), componente.strip())
\ No newline at end of file
+    return mapa.get(componente.strip(), componente.strip())
+
+def validar_respostas(administrado, respostas_corrigidas):
+    """
+    Cada resposta corresponde a um item administrado. Sem nenhuma resposta, administrado
+    pode listar itens já vistos (excluídos da seleção do primeiro item).
+    """
+    if len(respostas_corrigidas) and len(respostas_corrigidas) != len(administrado):
+        raise ValueError("administrado e respostas devem ter o mesmo tamanho")
+
+def ler_respostas(body):
+    """
+    Itens administrados e respostas corrigidas (0/1) do payload. Em vez de respostas
+    e gabarito, o payload pode trazer diretamente o vetor "acertos" (0/1).
+    """
+    # Filtrar strings vazias para administrado, respostas e gabarito
+    administrado = decodificar_textos(body["administrado"])
+    if "acertos" in body:
+        acertos = decodificar_vetor(body["acertos"], np.int64)
+        validar_respostas(administrado, acertos)
+        return administrado, acertos
+
+    respostas = decodificar_textos(body["respostas"])
+    gabarito = decodificar_textos(body["gabarito"])
+    if len(respostas) != len(gabarito):
+        # ValueError (convertido em 400) para poder atravessar o pool de processos
+        raise ValueError("respostas e gabarito devem ter o mesmo tamanho")
+
+    # Gabarito corrigido (0/1)
+    respostas_corrigidas = (np.array(respostas, dtype=object) == np.array(gabarito, dtype=object)).astype(int)
+    validar_respostas(administrado, respostas_corrigidas)
+    return administrado, respostas_corrigidas
@@ -0,0 +1,142 @@
+"""
+Transporte HTTP dos payloads grandes: descompressão de corpos gzip/deflate
+(Content-Encoding), codificação JSON com orjson quando disponível (opcional; sem ele,
+o módulo json da biblioteca padrão) e a classe de rota que usa esse decodificador.
+"""
+import json
+import os
+import zlib
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+# orjson é usado se estiver instalado, a menos que TAI_JSON_RAPIDO=0
+JSON_RAPIDO = orjson is not None and os.getenv("TAI_JSON_RAPIDO", "1") == "1"
+
+# Tamanho máximo do corpo descomprimido (proteção contra "bombas" de compressão)
+MAX_CORPO_DESCOMPRIMIDO = int(os.getenv("TAI_MAX_CORPO", str(64 * 1024 * 1024)))
+
+
+def carregar_json(dados):
+    if JSON_RAPIDO:
+        return orjson.loads(dados)
+    return json.loads(dados)
+
+
+def serializar_json(valor):
+    if JSON_RAPIDO:
+        return orjson.dumps(valor, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(valor, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class RespostaJSON(JSONResponse):
+    """JSONResponse serializada com serializar_json."""
+
+    def render(self, content):
+        return serializar_json(content)
+
+
+class RequisicaoJSON(Request):
+    """Request cujo json() usa carregar_json."""
+
+    async def json(self):
+        if not hasattr(self, "_json"):
+            self._json = carregar_json(await self.body())
+        return self._json
+
+
+class RotaJSON(APIRoute):
+    """Rota que decodifica o corpo com carregar_json (orjson quando disponível)."""
+
+    def get_route_handler(self):
+        manipulador = super().get_route_handler()
+
+        async def manipulador_json(request):
+            return await manipulador(RequisicaoJSON(request.scope, request.receive))
+
+        return manipulador_json
+
+
+def descomprimir(corpo, codificacao, limite=MAX_CORPO_DESCOMPRIMIDO):
+    """
+    Corpo descomprimido conforme o Content-Encoding (gzip ou deflate, com ou sem
+    cabeçalho zlib). Levanta ValueError se o formato for inválido ou se o resultado
+    passar de limite bytes.
+    """
+    # 47 = detecção automática de gzip/zlib; -15 = deflate sem cabeçalho
+    for wbits in ((47,) if codificacao == "gzip" else (47, -zlib.MAX_WBITS)):
+        descompressor = zlib.decompressobj(wbits)
+        try:
+            dados = descompressor.decompress(corpo, limite + 1)
+        except zlib.error:
+            continue
+        if len(dados) > limite or descompressor.unconsumed_tail:
+            raise OverflowError(f"Corpo descomprimido maior que {limite} bytes")
+        return dados
+    raise ValueError(f"Corpo {codificacao} inválido")
+
+
+class DescompressaoMiddleware:
+    """
+    Middleware ASGI que aceita requisições com Content-Encoding gzip ou deflate:
+    descomprime o corpo e o repassa como se tivesse sido enviado sem compressão.
+    Requisições sem Content-Encoding passam direto, sem custo.
+    """
+
+    def __init__(self, app, limite=MAX_CORPO_DESCOMPRIMIDO):
+        self.app = app
+        self.limite = limite
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        codificacao = None
+        for nome, valor in scope["headers"]:
+            if nome == b"content-encoding":
+                codificacao = valor.decode("latin-1").strip().lower()
+        if codificacao in (None, "", "identity"):
+            return await self.app(scope, receive, send)
+        if codificacao not in ("gzip", "deflate"):
+            return await self._erro(send, 415, f"Content-Encoding não suportado: {codificacao}")
+
+        partes = []
+        while True:
+            mensagem = await receive()
+            partes.append(mensagem.get("body", b""))
+            if not mensagem.get("more_body", False):
+                break
+        try:
+            corpo = descomprimir(b"".join(partes), codificacao, self.limite)
+        except OverflowError as e:
+            return await self._erro(send, 413, str(e))
+        except ValueError as e:
+            return await self._erro(send, 400, str(e))
+
+        cabecalhos = [(n, v) for n, v in scope["headers"] if n not in (b"content-encoding", b"content-length")]
+        cabecalhos.append((b"content-length", str(len(corpo)).encode()))
+        entregue = False
+
+        async def receber():
+            nonlocal entregue
+            if entregue:
+                return await receive()
+            entregue = True
+            return {"type": "http.request", "body": corpo, "more_body": False}
+
+        await self.app(dict(scope, headers=cabecalhos), receber, send)
+
+    @staticmethod
+    async def _erro(send, status, mensagem):
+        corpo = serializar_json({"detail": mensagem})
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(corpo)).encode())],
+        })
+        await send({"type": "http.response.body", "body": corpo})